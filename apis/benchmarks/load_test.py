@@ -0,0 +1,137 @@
+"""
+APIサーバーの負荷試験
+
+    python -m benchmarks.load_test --base-url http://localhost:8000 --scenario analyze --users 20 --requests 200
+
+N人の同時ユーザーがそれぞれ順にリクエストを送り、レイテンシーのp50/p95/p99とスループットを表示する。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from .samples import SAMPLE_TARGET_BEHAVIOR, sample_statement, sample_transcript
+
+
+def build_request(scenario: str, index: int, unique: bool, repeat: int) -> Tuple[str, Dict[str, Any]]:
+    """シナリオごとの (パス, リクエスト本文)"""
+    # uniqueの場合は対話文を毎回変えて、分析キャッシュ・集約に当たらないようにする
+    text = sample_transcript(repeat=repeat, variant=index + 1 if unique else 0)
+    if scenario == "analyze":
+        return "/analyze", {"text": text, "target_behavior": SAMPLE_TARGET_BEHAVIOR}
+    if scenario == "detailed-chat":
+        return "/detailed-chat", {
+            "conversation_text": text,
+            "analysis_result": {"cct": [sample_statement()]},
+            "aspect": "cct",
+            "user_question": "どう言い換えればよりよくなりますか？",
+            "chat_history": [],
+            "use_reference": False,
+        }
+    raise ValueError(f"unknown scenario: {scenario}")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """q（0〜100）パーセンタイル"""
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+async def run_load(
+    base_url: str,
+    scenario: str,
+    users: int,
+    requests: int,
+    unique: bool = True,
+    repeat: int = 1,
+    api_key: Optional[str] = None,
+    timeout: float = 300.0
+) -> Dict[str, Any]:
+    """同時ユーザー数usersでrequests件送り、結果を集計"""
+    counter = itertools.count()
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    headers = {"X-API-Key": api_key} if api_key else {}
+
+    async def user(client: httpx.AsyncClient) -> None:
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            path, body = build_request(scenario, index, unique, repeat)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body, headers={**headers, "X-Request-ID": f"load-{index}"})
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[user(client) for _ in range(users)])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": scenario,
+        "users": users,
+        "requests": requests,
+        "succeeded": len(latencies),
+        "statuses": dict(statuses),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_s": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3) if latencies else 0.0,
+        },
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    latency = report["latency_s"]
+    return "\n".join([
+        f"scenario   {report['scenario']}  users={report['users']}  requests={report['requests']}",
+        f"succeeded  {report['succeeded']}  statuses={report['statuses']}",
+        f"elapsed    {report['elapsed_s']}s  rps={report['rps']}",
+        f"latency    p50={latency['p50']}s  p95={latency['p95']}s  p99={latency['p99']}s  max={latency['max']}s",
+    ])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="APIサーバーの負荷試験")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--scenario", choices=["analyze", "detailed-chat"], default="analyze")
+    parser.add_argument("--users", type=int, default=10, help="同時ユーザー数")
+    parser.add_argument("--requests", type=int, default=100, help="送信するリクエストの総数")
+    parser.add_argument("--repeat", type=int, default=1, help="サンプルの対話文を繰り返して長くする回数")
+    parser.add_argument("--same-text", action="store_true", help="毎回同じ対話文を送る（キャッシュ・集約の効果を測る）")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(
+        args.base_url,
+        args.scenario,
+        args.users,
+        args.requests,
+        unique=not args.same_text,
+        repeat=args.repeat,
+        api_key=args.api_key,
+    ))
+    print(json.dumps(report, ensure_ascii=False) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+プロンプト組み立て・応答パースのマイクロベンチマーク
+
+    python -m benchmarks.micro --number 2000
+"""
+import argparse
+import json
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+from core.json_stream import IncrementalStatementParser
+from core.prompt_manager import PromptManager
+from core.transcript import preprocess_transcript
+from core.utils import parse_analysis_response, parse_combined_analysis_response
+from models.types import EVALUATION_AXES
+from .samples import SAMPLE_TARGET_BEHAVIOR, sample_statement, sample_transcript
+
+
+def build_cases(repeat: int) -> List[Tuple[str, Callable[[], object]]]:
+    """(名前, 計測する処理) の一覧"""
+    text = sample_transcript(repeat=repeat)
+    axis_response = json.dumps({"statements": [sample_statement() for _ in range(3)]}, ensure_ascii=False)
+    combined_response = json.dumps(
+        {aspect: [sample_statement() for _ in range(3)] for aspect in EVALUATION_AXES},
+        ensure_ascii=False,
+    )
+    # 前後に説明文がついた応答（括弧の位置から切り出す経路）
+    wrapped_response = "以下が分析結果です。\n" + axis_response + "\n以上です。"
+    # 発言番号で返された応答（発言内容を対話文から補う経路）
+    transcript = preprocess_transcript(text)
+    turn_items = []
+    for item in json.loads(axis_response)["statements"]:
+        item = {key: value for key, value in item.items() if key != "statement"}
+        turn_items.append({"turn": 3, **item})
+    turn_response = json.dumps({"statements": turn_items}, ensure_ascii=False)
+
+    def stream_parse() -> None:
+        parser = IncrementalStatementParser()
+        for start in range(0, len(axis_response), 8):
+            parser.feed(axis_response[start:start + 8])
+
+    return [
+        ("prompt.analysis", lambda: PromptManager.get_analysis_prompt(text, "cct", SAMPLE_TARGET_BEHAVIOR)),
+        ("prompt.combined", lambda: PromptManager.get_combined_analysis_prompt(text, SAMPLE_TARGET_BEHAVIOR)),
+        ("prompt.detailed_chat", lambda: PromptManager.get_detailed_chat_prompt(text, "cct", False)),
+        ("parse.axis", lambda: parse_analysis_response(axis_response)),
+        ("parse.axis_wrapped", lambda: parse_analysis_response(wrapped_response)),
+        ("parse.axis_turns", lambda: parse_analysis_response(turn_response, transcript)),
+        # キャッシュを通さない前処理（同じ対話文の2回目以降はキャッシュから返る）
+        ("transcript.preprocess", lambda: preprocess_transcript.__wrapped__(text)),
+        ("parse.combined", lambda: parse_combined_analysis_response(combined_response, EVALUATION_AXES)),
+        ("parse.incremental", stream_parse),
+    ]
+
+
+def run(number: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """各処理をnumber回ずつ5セット実行し、最良のセットの1回あたりの時間を返す"""
+    results = {}
+    for name, func in build_cases(repeat):
+        best = min(timeit.repeat(func, number=number, repeat=5)) / number
+        results[name] = {"us_per_op": round(best * 1e6, 2), "ops_per_s": round(1 / best)}
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="プロンプト組み立て・応答パースのマイクロベンチマーク")
+    parser.add_argument("--number", type=int, default=1000, help="1セットあたりの実行回数")
+    parser.add_argument("--repeat", type=int, default=1, help="サンプルの対話文を繰り返して長くする回数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args(argv)
+
+    results = run(args.number, args.repeat)
+    if args.json:
+        print(json.dumps(results))
+        return
+    for name, result in results.items():
+        print(f"{name:<24} {result['us_per_op']:>10.2f} us/op {result['ops_per_s']:>10} ops/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+ローカルで動かすOpenAI互換のモックサーバー（負荷試験・Batch APIの確認用）
+
+    python -m benchmarks.mock_openai --port 9000 --latency lognormal:1.0,0.5 --throttle-rate 0.05
+
+APIサーバー側は OPENAI_BASE_URL=http://localhost:9000/v1 を設定して起動する。
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from .samples import sample_statement
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """秒数の分布の指定を乱数生成関数に変換
+
+    fixed:1.5 / uniform:0.5,2 / normal:1.0,0.3 / lognormal:mu,sigma（exp(N(mu, sigma))秒）
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"unknown distribution: {spec}")
+
+
+def estimate_tokens(text: str) -> int:
+    """使用量の概算（日本語は1文字≒1トークン）"""
+    return max(1, math.ceil(sum(0.25 if char.isascii() else 1 for char in text)))
+
+
+class MockConfig:
+    """モックサーバーの振る舞い"""
+
+    def __init__(
+        self,
+        latency: str = "fixed:0.5",
+        first_token: str = "fixed:0.2",
+        tokens_per_second: float = 200.0,
+        throttle_rate: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        retry_after: float = 1.0,
+        cached_ratio: float = 0.5,
+        batch_delay: float = 0.0,
+    ):
+        self.latency = parse_distribution(latency)
+        self.first_token = parse_distribution(first_token)
+        self.tokens_per_second = tokens_per_second
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.cached_ratio = cached_ratio
+        self.batch_delay = batch_delay
+
+
+# 番号つきの対話文の臨床家の行（「[3] Th: ...」）
+CLINICIAN_TURN_PATTERN = re.compile(r"^\[(\d+)\] Th:", re.MULTILINE)
+
+
+def build_content(body: Dict[str, Any]) -> str:
+    """リクエストに合わせた応答本文（構造化出力ならスキーマのキーごとに評価を並べる）
+
+    スキーマが発言番号（turn）を求める場合は、対話文の臨床家の行の番号で返す。
+    """
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        properties = response_format["json_schema"]["schema"]["properties"]
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        turns = [int(number) for number in CLINICIAN_TURN_PATTERN.findall(prompt)]
+
+        def statement(index: int) -> Dict[str, Any]:
+            item = sample_statement()
+            if "turn" in next(iter(properties.values()))["items"]["properties"] and turns:
+                del item["statement"]
+                item = {"turn": turns[index % len(turns)], **item}
+            return item
+
+        return json.dumps({key: [statement(index) for index in range(3)] for key in properties}, ensure_ascii=False)
+    return "ご質問ありがとうございます。この発言では、クライエントの変化への気持ちを反映できています。" * 3
+
+
+def build_usage(body: Dict[str, Any], content: str, cached_ratio: float) -> Dict[str, Any]:
+    prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in body.get("messages", []))
+    completion_tokens = estimate_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": int(prompt_tokens * cached_ratio) // 128 * 128},
+    }
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    """モックサーバーのアプリケーション"""
+    app = FastAPI(title="Mock OpenAI")
+    state: Dict[str, Any] = {"in_flight": 0, "requests": 0, "throttled": 0, "files": {}, "batches": {}}
+
+    def throttled_response() -> JSONResponse:
+        state["throttled"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+            headers={
+                "retry-after-ms": str(int(config.retry_after * 1000)),
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": f"{config.retry_after}s",
+            },
+        )
+
+    def completion(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": build_usage(body, content, config.cached_ratio),
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        state["requests"] += 1
+        if random.random() < config.throttle_rate or (
+            config.max_concurrency is not None and state["in_flight"] >= config.max_concurrency
+        ):
+            return throttled_response()
+
+        content = build_content(body)
+        if not body.get("stream"):
+            state["in_flight"] += 1
+            try:
+                await asyncio.sleep(config.latency())
+            finally:
+                state["in_flight"] -= 1
+            return completion(body, content)
+
+        async def events():
+            state["in_flight"] += 1
+            try:
+                chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+                base = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "mock")}
+                await asyncio.sleep(config.first_token())
+                # 1チャンク≒4トークンとして生成速度に合わせて送る
+                interval = 4 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+                for start in range(0, len(content), 4):
+                    delta = {"choices": [{"index": 0, "delta": {"content": content[start:start + 4]}, "finish_reason": None}]}
+                    yield f"data: {json.dumps({**base, **delta}, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(interval)
+                yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage = build_usage(body, content, config.cached_ratio)
+                    yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                state["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/files")
+    async def upload_file(request: Request):
+        # multipartを解析せず、本文からJSONLの行だけを取り出す
+        raw = (await request.body()).decode("utf-8", "ignore")
+        lines = [line for line in raw.splitlines() if line.startswith("{") and '"custom_id"' in line]
+        file_id = f"file-{uuid.uuid4().hex}"
+        state["files"][file_id] = "\n".join(lines)
+        return {"id": file_id, "object": "file", "bytes": len(raw), "created_at": int(time.time()),
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed"}
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        return PlainTextResponse(state["files"].get(file_id, ""))
+
+    def batch_object(batch: Dict[str, Any]) -> Dict[str, Any]:
+        # batch_delay秒経ったら完了させ、出力ファイルを作る
+        if batch["status"] != "completed" and time.time() - batch["created_at"] >= config.batch_delay:
+            outputs = []
+            for line in state["files"].get(batch["input_file_id"], "").splitlines():
+                entry = json.loads(line)
+                outputs.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": entry["custom_id"],
+                    "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                                 "body": completion(entry["body"], build_content(entry["body"]))},
+                    "error": None,
+                }, ensure_ascii=False))
+            output_file_id = f"file-{uuid.uuid4().hex}"
+            state["files"][output_file_id] = "\n".join(outputs)
+            batch.update(status="completed", output_file_id=output_file_id, completed_at=int(time.time()))
+        return batch
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request):
+        body = await request.json()
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "in_progress",
+            "created_at": int(time.time()),
+        }
+        state["batches"][batch["id"]] = batch
+        return batch_object(batch) if config.batch_delay <= 0 else batch
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        batch = state["batches"].get(batch_id)
+        if batch is None:
+            return JSONResponse(status_code=404, content={"error": {"message": "No such batch"}})
+        return batch_object(batch)
+
+    @app.get("/stats")
+    async def stats():
+        return {key: state[key] for key in ("in_flight", "requests", "throttled")}
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+    parser = argparse.ArgumentParser(description="OpenAI互換のモックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="fixed:0.5", help="非ストリーミングの応答時間の分布")
+    parser.add_argument("--first-token", default="fixed:0.2", help="ストリーミングの最初のトークンまでの時間の分布")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="429を返す割合")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="これを超える同時リクエストには429を返す")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--cached-ratio", type=float, default=0.5, help="プロンプトトークンのうちキャッシュ済みとする割合")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="Batch APIのジョブが完了するまでの秒数")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency=args.latency,
+        first_token=args.first_token,
+        tokens_per_second=args.tokens_per_second,
+        throttle_rate=args.throttle_rate,
+        max_concurrency=args.max_concurrency,
+        retry_after=args.retry_after,
+        cached_ratio=args.cached_ratio,
+        batch_delay=args.batch_delay,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
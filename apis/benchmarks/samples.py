@@ -0,0 +1,40 @@
+"""
+ベンチマーク用のサンプルデータ
+"""
+from typing import Any, Dict, List
+
+# MIのロールプレイを模した対話文（実在の面接ではない）
+SAMPLE_TURNS: List[str] = [
+    "Th: 今日はどんなことをお話ししたいですか？",
+    "Cl: 最近お酒の量が増えていて、家族にも言われるんです。",
+    "Th: ご家族から言われることが増えて、気になっているんですね。",
+    "Cl: はい。でも仕事のストレスもあって、やめられる気がしないです。",
+    "Th: やめられる気がしない一方で、このままでいいとも思っていない。",
+    "Cl: そうですね。健康診断の数値も悪くなってきたので。",
+    "Th: 健康のことを考えると、何か変えたい気持ちもある。",
+    "Cl: 平日だけでも減らせたらいいなとは思います。",
+    "Th: 平日に減らすとしたら、どんなやり方が考えられそうですか？",
+    "Cl: 帰りにコンビニに寄らないようにする、とかですかね。",
+]
+
+SAMPLE_TARGET_BEHAVIOR = "平日の飲酒量を減らす"
+
+
+def sample_transcript(repeat: int = 1, variant: int = 0) -> str:
+    """サンプルの対話文（repeatで長さを、variantで内容を変えてキャッシュに当たらないようにする）"""
+    turns = SAMPLE_TURNS * repeat
+    if variant:
+        turns = turns + [f"Cl: （メモ {variant}）"]
+    return "\n".join(turns)
+
+
+def sample_statement() -> Dict[str, Any]:
+    """1件分の評価"""
+    return {
+        "statement": "健康のことを考えると、何か変えたい気持ちもある。",
+        "evaluation": "チェンジトークを選択的に反映している",
+        "score": 4,
+        "feedback": "**変化への気持ち**をうまく引き出しています。",
+        "suggestions": ["「どんなふうに変えたいですか？」と具体化を促す"],
+        "icon": "good",
+    }
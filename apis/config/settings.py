@@ -2,7 +2,8 @@
 アプリケーション設定管理
 """
 import os
-from typing import List
+from typing import List, Literal, Optional
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -19,7 +20,111 @@ class Settings(BaseSettings):
     openai_temperature: float = 0.3
     openai_max_tokens: int = 10000
     openai_timeout: int = 120  # タイムアウト（秒）
-    
+    openai_base_url: Optional[str] = None  # 互換サーバー（ローカルのスタンドインなど）に向ける場合のベースURL
+    # サーキットが開いているときに代わりに使う速いモデル（Noneなら代わりに呼ばず即座にエラーにする）
+    openai_fallback_model: Optional[str] = None
+
+    # OpenAIクライアントプール設定
+    openai_client_pool_size: int = 256  # 保持するAPI keyごとのクライアント数の上限
+    openai_client_idle_ttl: int = 900  # 未使用クライアントを破棄するまでの秒数
+    openai_http2: bool = True  # HTTP/2で接続を多重化する
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry: float = 60.0  # keep-alive接続の保持秒数
+
+    # レート制御・リトライ設定（API keyごと）
+    rate_limit_max_concurrency: int = 16  # 同時に実行する呼び出し数の上限
+    rate_limit_requests_per_second: float = 8.0  # リクエストレートの初期値・上限
+    rate_limit_min_requests_per_second: float = 0.5  # 429を受けて下げるときの下限
+    openai_max_retries: int = 5
+    openai_retry_deadline: float = 300.0  # リトライを含めた全体の期限（秒）
+    openai_backoff_base: float = 1.0  # バックオフの初回待ち時間（秒）
+    openai_backoff_max: float = 30.0  # バックオフの最大待ち時間（秒）
+
+    # サーキットブレーカー設定（モデルごと）
+    circuit_breaker_enabled: bool = True
+    circuit_breaker_window_seconds: float = 60.0  # 失敗率・遅い呼び出しの割合を見る期間
+    circuit_breaker_min_calls: int = 10  # 期間内の呼び出しがこれ未満なら開かない
+    circuit_breaker_failure_rate: float = 0.5  # 5xx・接続エラー・タイムアウトの割合がこれ以上で開く
+    # これ以上かかった呼び出しを遅いとみなす（openai_timeoutより短くする。超えた呼び出しはタイムアウトで失敗になる）
+    circuit_breaker_slow_call_seconds: float = 60.0
+    circuit_breaker_slow_call_rate: float = 0.5  # 遅い呼び出しの割合がこれ以上で開く
+    circuit_breaker_open_seconds: float = 30.0  # 開いてから試しの呼び出しを通すまでの秒数
+    circuit_breaker_half_open_probes: int = 2  # 閉じるまでに成功させる試しの呼び出しの数
+
+    # 分析設定
+    # per_axis: 評価軸ごとに4回呼び出す / combined: 4軸を1回の呼び出しでまとめて分析する
+    analysis_mode: Literal["per_axis", "combined"] = "per_axis"
+    analysis_structured_output: bool = True  # JSON Schemaの構造化出力で結果を返させる
+    analysis_repair_attempts: int = 1  # 形式が不正な応答を出し直させる回数
+    # 対話文を番号つきの話者ターン（あいづちを除く）にして送り、評価する発言を番号で返させる（出力トークンを減らす）
+    analysis_statement_ids: bool = True
+    # これを超える長さの対話文は話者ターン単位の窓に分割して並行に分析し、結果をまとめる
+    analysis_long_transcript_tokens: int = 8000
+    analysis_window_tokens: int = 6000  # 1つの窓のトークン数の上限
+    analysis_window_overlap_tokens: int = 500  # 隣り合う窓で重ねるトークン数
+    # /analyzeの全体の期限（秒）。リクエストヘッダーX-Deadline-Secondsで上書きでき、Noneなら期限なし
+    analysis_deadline_seconds: Optional[float] = 110.0
+    # 評価軸ごとの直近の所要時間のパーセンタイルを過ぎた呼び出しには、同じ呼び出しをもう1つ送る
+    analysis_hedge_enabled: bool = True
+    analysis_hedge_quantile: float = 0.95
+    analysis_hedge_min_samples: int = 20  # これだけ所要時間が集まるまではヘッジしない
+    analysis_hedge_min_delay: float = 5.0  # ヘッジするまでの最短の待ち時間（秒）
+    # 差分の再分析（/analyze/incremental）。変更されたターンの前後何ターンまでを一緒に分析し直すか
+    analysis_incremental_context_turns: int = 2
+    analysis_incremental_max_ratio: float = 0.5  # 分析し直すターンの割合がこれを超えたら全体を分析する
+
+    # 参考資料検索設定（詳細チャットのuse_reference）
+    reference_csv_path: str = "./documents/MI_point.csv"
+    reference_index_path: Optional[str] = "./documents/MI_point.index.json"  # 構築済みインデックスの保存先
+    reference_top_k: int = 5  # プロンプトに添える要点の件数
+
+    # 詳細チャットの履歴圧縮設定
+    chat_history_token_budget: int = 4000  # 履歴がこれを超えたら古いやり取りを要約に畳み込む
+    chat_history_keep_turns: int = 4  # 要約せずにそのまま残す直近の往復数
+    chat_summary_model: Optional[str] = None  # 要約に使うモデル（未指定時はopenai_model）
+    chat_summary_cache_size: int = 1000  # 要約のメモ化件数
+
+    # 分析セッション設定（/analyzeの結果をサーバー側に保持し、詳細チャットはIDだけで行う）
+    session_store_max_entries: int = 1000  # メモリ上に保持するセッション数の上限
+    session_ttl: int = 604800  # 最後に使われてからセッションを破棄するまでの秒数
+    # ワーカー間で共有するSQLite（複数ワーカーでは必須。Noneにするとメモリ上だけに保持する）
+    session_store_sqlite_path: Optional[str] = "sessions.sqlite3"
+
+    # 分析結果キャッシュ設定
+    analysis_cache_enabled: bool = True
+    analysis_cache_max_entries: int = 1000  # メモリ上に保持する件数の上限
+    analysis_cache_ttl: int = 86400  # キャッシュの有効期限（秒）
+    analysis_cache_sqlite_path: Optional[str] = None  # 指定するとワーカー間で共有するSQLiteキャッシュを併用
+    analysis_cache_sqlite_max_entries: int = 20000  # SQLiteに保持する件数の上限
+
+    # 一括分析設定（/analyze/batch）
+    batch_max_items: int = 200  # 1回のリクエストで受け付ける件数の上限
+    batch_concurrency: int = 32  # すべての一括分析で共有する、評価軸ごとの呼び出しの同時実行数
+    batch_provider_db_path: str = "batches.sqlite3"  # プロバイダーのBatch APIへ投入した内容を保存するSQLite
+    batch_provider_completion_window: str = "24h"
+
+    # 集計設定（/analytics/summary）
+    analytics_max_sessions: int = 20000  # 1回のリクエストで集計する分析結果の件数の上限
+    analytics_rolling_window: int = 5  # 推移の移動平均に使う直近の分析結果の件数
+
+    # 分析ジョブキュー設定
+    job_queue_enabled: bool = True
+    job_queue_db_path: str = "jobs.sqlite3"  # ジョブを永続化するSQLiteファイル
+    job_queue_concurrency: int = 4  # 同時に実行するジョブ数の上限
+    # 実行中のジョブのリース。ハートビート（この1/3ごと）が途絶えてこの秒数たったジョブは、この1/2ごとの見回りで再実行する
+    job_queue_lease_seconds: int = 60
+    job_queue_persist_api_keys: bool = False  # 再起動後も再開できるようAPI keyをSQLiteに保存する
+    job_webhook_timeout: float = 5.0  # 完了通知Webhookのタイムアウト（秒）
+    # 完了通知Webhookの送信先として許可するホスト。空なら、公開アドレスに解決されるホストだけに送る（httpsのみ）
+    job_webhook_allowed_hosts: List[str] = []
+    job_retention_seconds: int = 7 * 24 * 3600  # 終了したジョブと結果を保持する秒数
+
+    # 計測設定
+    slow_request_seconds: float = 30.0  # これ以上かかったリクエストを構造化ログに残す
+    # /stats・/metricsに必要なBearerトークン。未設定ならループバック（同じホスト）からの接続だけに返す
+    internal_stats_token: Optional[str] = None
+
     # CORS設定
     allowed_origins: List[str] = [
         "http://localhost:3000",
@@ -29,7 +134,47 @@ class Settings(BaseSettings):
     # サーバー設定
     host: str = "0.0.0.0"
     port: int = 8000
+    # ワーカープロセス数。Noneの場合、gunicorn_conf.pyではCPUコア数、python main.pyでは1
+    server_workers: Optional[int] = None
+    server_keepalive: int = 75  # keep-alive接続を保持する秒数（前段のロードバランサーのidle timeoutより長くする）
+    server_timeout: int = 180  # 応答のないワーカーを再起動するまでの秒数（分析の期限より長くする）
+    server_graceful_timeout: int = 60  # 終了時に処理中のリクエストを待つ秒数
+    server_max_requests: int = 0  # この件数を処理したワーカーを入れ替える（0で無効）
+    server_max_requests_jitter: int = 0
+    shutdown_drain_seconds: float = 50.0  # 終了処理で処理中のリクエストを待つ秒数（server_graceful_timeoutより短くする）
+    # SIGTERMを受けて/readyを503にしてから、新しい接続の受付を止めるまでの秒数（ロードバランサーが振り分けから外すのを待つ）
+    shutdown_readiness_delay: float = 5.0
     
+    @model_validator(mode="after")
+    def _check_limits(self) -> "Settings":
+        """互いに関係する設定の値を検証"""
+        if self.circuit_breaker_slow_call_seconds >= self.openai_timeout:
+            raise ValueError(
+                "CIRCUIT_BREAKER_SLOW_CALL_SECONDS は OPENAI_TIMEOUT より短くしてください"
+                "（タイムアウトより長いと遅い呼び出しを数えられません）"
+            )
+        if self.analysis_window_tokens >= self.analysis_long_transcript_tokens:
+            raise ValueError(
+                "ANALYSIS_WINDOW_TOKENS は ANALYSIS_LONG_TRANSCRIPT_TOKENS より小さくしてください"
+                "（窓が長い対話文の扱いになると分割が終わりません）"
+            )
+        if self.analysis_window_overlap_tokens >= self.analysis_window_tokens:
+            raise ValueError("ANALYSIS_WINDOW_OVERLAP_TOKENS は ANALYSIS_WINDOW_TOKENS より小さくしてください")
+        if self.shutdown_readiness_delay + self.shutdown_drain_seconds >= self.server_graceful_timeout:
+            raise ValueError(
+                "SHUTDOWN_READINESS_DELAY と SHUTDOWN_DRAIN_SECONDS の合計は SERVER_GRACEFUL_TIMEOUT より短くしてください"
+                "（gunicornはSIGTERMから数えて強制終了するため）"
+            )
+        return self
+
+    def check_workers(self, workers: int) -> None:
+        """複数ワーカーで起動できる設定か確認（ワーカー間で共有されない保存先があれば起動を止める）"""
+        if workers > 1 and not self.session_store_sqlite_path:
+            raise RuntimeError(
+                "複数ワーカーで起動するには SESSION_STORE_SQLITE_PATH を指定してください"
+                "（分析セッションをワーカー間で共有するため）"
+            )
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -97,9 +97,8 @@ class DeveloperMessageConfig:
 - スキルやプロセスの名前は専門用語なので，日本語の用語を用いて，正確にそのままの表現で使用しなさい。特に「聞き返し」を「反映」や「映す」などと絶対に変えないこと。
 - 発言例は、クライエントの発言ではなく、臨床家の発言です。易しい日本語で，抽象的な表現や省略した言い方を避けて書きなさい。
     """
-    # /documents/MI_point.csv　をreadしてrefに記載
-    with open("./documents/MI_point.csv", "r") as f:
-        ref = f.read()
+    # 参考資料（/documents/MI_point.csv）は全文を載せず、
+    # core.reference_index で質問に関連する要点だけを検索してチャットに添える
 
 
 
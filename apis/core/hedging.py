@@ -0,0 +1,60 @@
+"""
+遅い呼び出しのヘッジ（一定時間を過ぎたら同じ呼び出しをもう1つ送り、先に終わった方を使う）
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """キーごとの直近の所要時間からパーセンタイルを求める"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, key: str, seconds: float) -> None:
+        self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        """q（0〜1）分位点（サンプルが足りなければNone）"""
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged_call(
+    factory: Callable[[], Awaitable[T]],
+    hedge_after: Optional[float]
+) -> Tuple[T, Optional[str]]:
+    """factory()を実行し、hedge_after秒で終わらなければもう1つ実行して先に成功した方を返す
+
+    (結果, 勝った方) を返す。勝った方はヘッジを送らなかった場合None、送った場合は "primary" か "hedge"。
+    負けた方・途中で不要になった方はキャンセルする。
+    両方失敗した場合は最初の呼び出しの例外を送出する。
+    """
+    primary = asyncio.ensure_future(factory())
+    tasks = [primary]
+    try:
+        if hedge_after is None:
+            return await primary, None
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return primary.result(), None
+        tasks.append(asyncio.ensure_future(factory()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), "primary" if task is primary else "hedge"
+        return primary.result(), None
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
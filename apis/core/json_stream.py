@@ -0,0 +1,72 @@
+"""
+ストリーミング中のJSONから評価を1件ずつ取り出すパーサー
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class IncrementalStatementParser:
+    """生成途中のJSONテキストを少しずつ受け取り、配列の要素のオブジェクトが閉じるたびに返す
+
+    対象は `[{...}, ...]`、`{"statements": [{...}]}`、`{"cct": [{...}], ...}` のいずれの形でもよい。
+    feed() は (要素を含む配列のキー, オブジェクト) のリストを返す。最上位が配列の場合キーはNone。
+    """
+
+    def __init__(self):
+        # 開いているコンテナの (種類, そのコンテナを値に持つキー)
+        self._stack: List[Tuple[str, Optional[str]]] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_chars: List[str] = []
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        # 取り出し中のオブジェクト
+        self._capture: List[str] = []
+        self._capture_depth: Optional[int] = None
+        self._capture_key: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+        completed: List[Tuple[Optional[str], Dict[str, Any]]] = []
+        for char in chunk:
+            if self._capture_depth is not None:
+                self._capture.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = "".join(self._string_chars)
+                else:
+                    self._string_chars.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_chars = []
+            elif char == ":":
+                self._pending_key = self._last_string
+            elif char in "{[":
+                parent = self._stack[-1] if self._stack else None
+                if char == "{" and self._capture_depth is None and parent and parent[0] == "array":
+                    # 配列の要素のオブジェクトの取り出しを開始
+                    self._capture = ["{"]
+                    self._capture_depth = len(self._stack)
+                    self._capture_key = parent[1]
+                self._stack.append(("object" if char == "{" else "array", self._pending_key))
+                self._pending_key = None
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if char == "}" and self._capture_depth is not None and len(self._stack) == self._capture_depth:
+                    try:
+                        completed.append((self._capture_key, json.loads("".join(self._capture))))
+                    except json.JSONDecodeError:
+                        pass
+                    self._capture = []
+                    self._capture_depth = None
+            elif char == ",":
+                self._pending_key = None
+        return completed
@@ -0,0 +1,122 @@
+"""
+アプリケーションの起動準備（プリウォーム）と終了時のドレイン
+"""
+import asyncio
+import logging
+import signal
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+WarmupStep = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+class AppLifecycle:
+    """プリウォームの進行状況と処理中のリクエスト数を管理する
+
+    プリウォームが終わるまでと、終了処理（ドレイン）に入ってからはreadyをFalseにして、
+    ロードバランサーが新しいリクエストを振り分けないようにする。
+    """
+
+    def __init__(self):
+        self.warm = False
+        self.draining = False
+        self.started_at = time.time()
+        self.warmup: Dict[str, Dict[str, Any]] = {}
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.warm and not self.draining
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def request_started(self) -> None:
+        self._in_flight += 1
+        self._idle.clear()
+
+    def request_finished(self) -> None:
+        self._in_flight -= 1
+        if self._in_flight == 0:
+            self._idle.set()
+
+    async def prewarm(self, steps: List[WarmupStep]) -> None:
+        """各ステップを並行して実行し、すべて終わったらwarmにする
+
+        失敗したステップはログと/readyの表示に残すだけで、起動は止めない
+        （必要な処理は最初のリクエストで改めて行われる）。
+        """
+        async def run(name: str, step: Callable[[], Awaitable[Any]]) -> None:
+            start = time.monotonic()
+            try:
+                await step()
+                self.warmup[name] = {"ok": True}
+            except Exception as e:
+                logger.warning("warmup step %s failed: %s", name, e)
+                self.warmup[name] = {"ok": False, "error": str(e)}
+            self.warmup[name]["seconds"] = round(time.monotonic() - start, 3)
+
+        start = time.monotonic()
+        await asyncio.gather(*[run(name, step) for name, step in steps])
+        self.warm = True
+        logger.info("warmup finished in %.2fs", time.monotonic() - start)
+
+    def install_signal_handler(self, delay: float) -> bool:
+        """SIGTERMを受けたらすぐに/readyを503にし、delay秒後にサーバーの終了処理を始める
+
+        uvicorn（gunicornのUvicornWorkerも同じ）は起動時にSIGTERMのハンドラーを設定し、
+        受けるとすぐに新しい接続の受付を止める。そのハンドラーの呼び出しを遅らせて、
+        その間にロードバランサーが/readyの503を見て振り分けから外せるようにする。
+        2回目のSIGTERMはすぐにサーバーに渡す。設定できなかった場合（メインスレッドでない・
+        サーバーがハンドラーを設定していない）はFalseを返す。
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        server_handler = signal.getsignal(signal.SIGTERM)
+        if not callable(server_handler):
+            return False
+        loop = asyncio.get_running_loop()
+
+        def handle(signum, frame):
+            if self.draining:
+                server_handler(signum, frame)
+                return
+            self.draining = True
+            logger.info("received SIGTERM, not ready; stopping the server in %.1fs", delay)
+            loop.call_soon_threadsafe(loop.call_later, delay, server_handler, signum, frame)
+
+        signal.signal(signal.SIGTERM, handle)
+        return True
+
+    async def drain(self, timeout: float) -> bool:
+        """新しいリクエストを受けない状態にし、処理中のリクエストが終わるまで最大timeout秒待つ"""
+        self.draining = True
+        if self._in_flight:
+            logger.info("draining %d in-flight requests", self._in_flight)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("shutting down with %d requests still in flight", self._in_flight)
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """状態の概要"""
+        return {
+            "ready": self.ready,
+            "warm": self.warm,
+            "draining": self.draining,
+            "in_flight": self._in_flight,
+            "uptime": round(time.time() - self.started_at, 1),
+            "warmup": self.warmup,
+        }
+
+
+# グローバルインスタンス
+app_lifecycle = AppLifecycle()
@@ -0,0 +1,86 @@
+"""
+Prometheus形式の計測値
+"""
+import os
+from typing import Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+
+# 分析は数十秒かかるため、既定より長い区間まで用意する
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, float("inf"))
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "エンドポイントごとのリクエスト所要時間（ストリーミングは送信完了まで）",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_QUEUE_WAIT_SECONDS = Histogram(
+    "openai_queue_wait_seconds",
+    "API keyごとのレート制御で呼び出しが待たされた時間",
+    ["endpoint", "axis"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    "openai_request_duration_seconds",
+    "OpenAI呼び出しの所要時間（ストリーミングは応答ヘッダーまで）",
+    ["endpoint", "axis", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "openai_time_to_first_token_seconds",
+    "ストリーミング呼び出しの最初のトークンまでの時間",
+    ["endpoint", "axis"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens",
+    "OpenAI呼び出しのトークン数（kind: prompt / cached / completion）",
+    ["endpoint", "axis", "model", "kind"],
+)
+OPENAI_ERRORS = Counter(
+    "openai_errors",
+    "OpenAI呼び出しの失敗（リトライしたものを含む）",
+    ["endpoint", "axis", "error"],
+)
+OPENAI_CIRCUIT_STATE = Gauge(
+    "openai_circuit_state",
+    "モデルごとのサーキットブレーカーの状態（0: closed / 1: half_open / 2: open）",
+    ["model"],
+    multiprocess_mode="max",
+)
+OPENAI_FALLBACKS = Counter(
+    "openai_fallbacks",
+    "サーキットが開いていたため代わりのモデルで呼び出した回数",
+    ["endpoint", "axis", "model", "fallback_model"],
+)
+ANALYSIS_HEDGES = Counter(
+    "analysis_hedges",
+    "遅い分析の呼び出しに送ったヘッジ（winner: primary / hedge）",
+    ["endpoint", "axis", "winner"],
+)
+ANALYSIS_PARSE_FAILURES = Counter(
+    "analysis_parse_failures",
+    "分析結果の応答を読み込めなかった回数",
+    ["endpoint", "axis"],
+)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """/metricsの本文とContent-Type
+
+    gunicornの複数ワーカーではPROMETHEUS_MULTIPROC_DIRを指定すると全ワーカー分を集計する。
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,9 +1,39 @@
 """
 プロンプト管理システム
 """
-from typing import Optional
-from models.types import EvaluationAxis
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from config.settings import settings
+from models.types import EvaluationAxis, EVALUATION_AXES
 from .developer_message import DeveloperMessageConfig
+from .transcript import PREPROCESSING_VERSION
+
+
+# 構造化出力（JSON Schema）で返させる1件分の評価。models.responses.StatementEvaluationと対応する
+STATEMENT_EVALUATION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "statement": {"type": "string"},
+        "evaluation": {"type": "string"},
+        "score": {"type": "integer", "enum": [1, 2, 3, 4, 5]},
+        "feedback": {"type": "string"},
+        "suggestions": {"type": "array", "items": {"type": "string"}},
+        "icon": {"type": "string", "enum": ["good", "warning", "bad"]},
+    },
+    "required": ["statement", "evaluation", "score", "feedback", "suggestions", "icon"],
+    "additionalProperties": False,
+}
+# 発言番号で返させる場合（analysis_statement_ids）の1件分。発言内容はサーバー側で補う
+TURN_EVALUATION_SCHEMA: Dict[str, Any] = {
+    **STATEMENT_EVALUATION_SCHEMA,
+    "properties": {
+        "turn": {"type": "integer"},
+        **{key: value for key, value in STATEMENT_EVALUATION_SCHEMA["properties"].items() if key != "statement"},
+    },
+    "required": ["turn"] + [key for key in STATEMENT_EVALUATION_SCHEMA["required"] if key != "statement"],
+}
 
 
 class PromptManager:
@@ -34,13 +64,42 @@ class PromptManager:
         }
         return descriptions.get(aspect, aspect) # キーがない時はそのまま返す
     
+    @staticmethod
+    def get_conversation_block(text: str) -> str:
+        """対話文のブロック（分析・詳細チャットで共通のプレフィックス）"""
+        return f"""# 対話文
+{text}
+"""
+    
+    @staticmethod
+    def get_statement_format() -> str:
+        """出力形式のうち評価1件分の例
+
+        analysis_statement_idsが有効な場合は、発言を書き写させず発言番号（turn）で返させる。
+        """
+        if settings.analysis_statement_ids:
+            statement = '''"turn": 発言番号（対話文の各行の先頭の[ ]内の数字。臨床家（Th）の発言から選び、発言は書き写さないこと）,'''
+        else:
+            statement = '''"statement": "発言（意味のない発言は無視すること）",'''
+        return f"""    {{
+      {statement}
+      "evaluation": "評価の根拠（内部処理用でユーザには見せない）",
+      "score": 1-5の評価点,
+      "feedback": "具体的なフィードバック（ユーザに見せる）。重要な部分は「**」で囲め。",
+      "suggestions": ["改善提案1", "改善提案2(optional)"]フィードバックを踏まえた，よりよい発言の具体例。もしあれば補足説明。
+      "icon": "good/warning/bad"
+    }}"""
+    
     @staticmethod
     def get_analysis_prompt(text: str, aspect: EvaluationAxis, target_behavior: Optional[str] = None) -> str:
         """分析用プロンプトを生成"""
         developer_message = DeveloperMessageConfig.get_system_message(analysys=True)
-        base_prompt = f"""
+        # 対話文を先頭に置き、評価軸ごとに異なる指示を末尾に回す。
+        # こうすると同じ会話の4軸分と詳細チャットで、開発者メッセージ＋対話文までが
+        # 同一のプレフィックスになり、プロンプトキャッシュが効く。
+        base_prompt = PromptManager.get_conversation_block(text) + f"""
 # 指示
-対話文を与えるので，以下の評価軸で分析してください。
+上の対話文を，以下の評価軸で分析してください。
 臨床家（治療を行う者）の発言から重要なものを抽出し評価してください。
 # 評価軸
 {PromptManager.get_aspect_description(aspect)}
@@ -49,37 +108,136 @@ class PromptManager:
 　これは、クライエントが変化を望む行動や目標です。この目標に動機づけされるよう評価しなさい。
 # 出力形式
 重要な発言を最大3つ抽出し、以下のJSON形式で返してください：
-[
-  {{
-    "statement": "発言（意味のない発言は無視すること）",
-    "evaluation": "評価の根拠（内部処理用でユーザには見せない）",
-    "score": 1-5の評価点,
-    "feedback": "具体的なフィードバック（ユーザに見せる）。重要な部分は「**」で囲め。",
-    "suggestions": ["改善提案1", "改善提案2(optional)"]フィードバックを踏まえた，よりよい発言の具体例。もしあれば補足説明。
-    "icon": "good/warning/bad"
-  }}
-]
-# 対話文
-{text}
+{{
+  "statements": [
+{PromptManager.get_statement_format()}
+  ]
+}}
 """
         return developer_message,base_prompt
     
+    @staticmethod
+    def get_combined_analysis_prompt(text: str, target_behavior: Optional[str] = None) -> str:
+        """4つの評価軸をまとめて分析するプロンプトを生成"""
+        developer_message = DeveloperMessageConfig.get_system_message(analysys=True)
+        base_prompt = PromptManager.get_conversation_block(text) + f"""
+# 指示
+上の対話文を，以下の4つの評価軸それぞれで分析してください。
+評価軸ごとに，臨床家（治療を行う者）の発言から重要なものを抽出し評価してください。
+# 評価軸
+## cct
+{PromptManager.get_aspect_description('cct')}
+## sst
+{PromptManager.get_aspect_description('sst')}
+## empathy
+{PromptManager.get_aspect_description('empathy')}
+## partnership
+{PromptManager.get_aspect_description('partnership')}
+# 目標行動
+            {target_behavior}
+　これは、クライエントが変化を望む行動や目標です。この目標に動機づけされるよう評価しなさい。
+# 出力形式
+評価軸ごとに重要な発言を最大3つ抽出し、評価軸名をキーとする以下のJSON形式で返してください：
+{{
+  "cct": [
+{PromptManager.get_statement_format()}
+  ],
+  "sst": [...],
+  "empathy": [...],
+  "partnership": [...]
+}}
+"""
+        return developer_message,base_prompt
+    
+    @staticmethod
+    def get_analysis_response_format(combined: bool = False) -> Optional[Dict[str, Any]]:
+        """分析の構造化出力（JSON Schema）の指定（無効な場合はNone）"""
+        if not settings.analysis_structured_output:
+            return None
+        item_schema = TURN_EVALUATION_SCHEMA if settings.analysis_statement_ids else STATEMENT_EVALUATION_SCHEMA
+        statements = {"type": "array", "items": item_schema}
+        keys = list(EVALUATION_AXES) if combined else ["statements"]
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "combined_analysis" if combined else "axis_analysis",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {key: statements for key in keys},
+                    "required": keys,
+                    "additionalProperties": False,
+                },
+            },
+        }
+    
+    @staticmethod
+    def get_repair_prompt(error: str) -> str:
+        """形式が不正だった応答を出し直させるプロンプト"""
+        return f"""直前の出力は指定したJSON形式として読み込めませんでした。
+エラー: {error}
+内容は変えずに，指定したJSON形式だけを出力し直してください。"""
+    
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_prompt_version(aspect: str) -> str:
+        """分析プロンプトの版（テンプレート・評価軸の説明・出力形式・対話文の前処理が変わると値が変わる）
+
+        aspectに"combined"を渡すと4軸まとめて分析するプロンプトの版を返す。
+        """
+        combined = aspect == "combined"
+        if combined:
+            system, prompt = PromptManager.get_combined_analysis_prompt("{text}", "{target_behavior}")
+        else:
+            system, prompt = PromptManager.get_analysis_prompt("{text}", aspect, "{target_behavior}")
+        response_format = json.dumps(PromptManager.get_analysis_response_format(combined), sort_keys=True)
+        source = system + prompt + response_format + PREPROCESSING_VERSION
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    
     @staticmethod
     def get_detailed_chat_prompt(text: str, aspect: EvaluationAxis, use_reference: bool,target_behavior: Optional[str] = None) -> str:
         """詳細チャット用"""
         developer_message = DeveloperMessageConfig.get_system_message()
-        base_prompt = f"""
-        # 指示
-        対話文を与えるので，以下の評価軸で分析してください。
-        臨床家（治療を行う者）の発言から重要なものを抽出し評価してください。
-        # 評価軸
-        {PromptManager.get_aspect_description(aspect)}
-        # 対話文
-        {text}
-        """
+        base_prompt = PromptManager.get_conversation_block(text) + f"""
+# 指示
+上の対話文を，以下の評価軸で分析してください。
+臨床家（治療を行う者）の発言から重要なものを抽出し評価してください。
+# 評価軸
+{PromptManager.get_aspect_description(aspect)}
+"""
         
         # if use_reference:
         #     base_prompt += """# ツール使用
         #     参考文献を検索しつつ返答してください"""
         
-        return developer_message,base_prompt.strip()
\ No newline at end of file
+        return developer_message,base_prompt
+    
+    @staticmethod
+    def get_reference_question_prompt(question: str, references: List[Dict[str, Any]]) -> str:
+        """参考資料の要点を添えた質問（詳細チャットの最後のユーザー発言）"""
+        points = "\n".join(
+            f"- {reference['content']}（第{reference['chapter']}章）" for reference in references
+        )
+        return f"""# 参考資料
+以下は動機づけ面接の要点です。回答の根拠として関連するものを参照しなさい。
+{points}
+# 質問
+{question}"""
+    
+    @staticmethod
+    def get_history_summary_prompt(previous_summary: Optional[str], turns: List[Dict[str, str]]) -> str:
+        """詳細チャットの古いやり取りを要約するプロンプト"""
+        developer_message = DeveloperMessageConfig.get_system_message()
+        dialogue = "\n".join(
+            f"{'臨床家' if turn['role'] == 'user' else 'アドバイザー'}: {turn['content']}" for turn in turns
+        )
+        base_prompt = f"""
+# 指示
+臨床家とアドバイザー（あなた）の質疑を，後の回答で参照できるように要約してください。
+臨床家の疑問点，アドバイザーが示した助言や発言例，未解決の論点を漏らさず，箇条書きで簡潔にまとめなさい。
+# これまでの要約
+{previous_summary or "なし"}
+# 新しいやり取り
+{dialogue}
+"""
+        return developer_message,base_prompt
\ No newline at end of file
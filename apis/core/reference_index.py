@@ -0,0 +1,149 @@
+"""
+MIの要点（documents/MI_point.csv）の検索インデックス
+"""
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 検索に使わない記号・空白
+_IGNORED_CHARS = re.compile(r"[\s\W_]+")
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """日本語向けの文字n-gram（分かち書き不要）"""
+    normalized = _IGNORED_CHARS.sub("", unicodedata.normalize("NFKC", text).lower())
+    if len(normalized) < n:
+        return [normalized] if normalized else []
+    return [normalized[i:i + n] for i in range(len(normalized) - n + 1)]
+
+
+class ReferenceIndex:
+    """文字bigramのBM25による参照資料の検索インデックス
+
+    起動時に1度だけ構築し、CSVのハッシュとともにJSONへ保存して次回以降はそれを読み込む。
+    読み込みはロックで1回にまとめ、起動時の事前読み込みと検索が重なっても二重に構築しない。
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, csv_path: str, index_path: Optional[str] = None):
+        self.csv_path = csv_path
+        self.index_path = index_path
+        self.documents: List[Dict[str, str]] = []
+        self.postings: Dict[str, List[List[int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.idf: Dict[str, float] = {}
+        self.average_length = 0.0
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def _source_hash(self) -> str:
+        with open(self.csv_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def load(self) -> None:
+        """保存済みのインデックスを読み込む（CSVが変わっていれば作り直す。読み込み済みなら何もしない）
+
+        ファイルの読み書きを伴うため、イベントループからはasyncio.to_threadで呼ぶこと。
+        """
+        with self._load_lock:
+            if not self._loaded:
+                self._load()
+
+    def _load(self) -> None:
+        source_hash = self._source_hash()
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("source_hash") == source_hash:
+                    self._restore(data)
+                    return
+            except (OSError, ValueError, KeyError):
+                logger.warning("reference index at %s is unreadable, rebuilding", self.index_path)
+
+        self._build()
+        if self.index_path:
+            try:
+                with open(self.index_path, "w", encoding="utf-8") as f:
+                    json.dump({"source_hash": source_hash, **self._dump()}, f, ensure_ascii=False)
+            except OSError as e:
+                logger.warning("could not save reference index: %s", e)
+
+    def _build(self) -> None:
+        with open(self.csv_path, "r", encoding="utf-8") as f:
+            self.documents = [
+                {"content": row["content"], "chapter": row.get("chapter", "")}
+                for row in csv.DictReader(f)
+                if row.get("content")
+            ]
+
+        postings: Dict[str, List[List[int]]] = {}
+        self.doc_lengths = []
+        for doc_id, document in enumerate(self.documents):
+            terms = Counter(char_ngrams(document["content"]))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                postings.setdefault(term, []).append([doc_id, frequency])
+        self.postings = postings
+        self._finalize()
+
+    def _finalize(self) -> None:
+        count = len(self.documents)
+        self.average_length = sum(self.doc_lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        self._loaded = True
+
+    def _dump(self) -> Dict[str, Any]:
+        return {
+            "documents": self.documents,
+            "postings": self.postings,
+            "doc_lengths": self.doc_lengths,
+        }
+
+    def _restore(self, data: Dict[str, Any]) -> None:
+        self.documents = data["documents"]
+        self.postings = data["postings"]
+        self.doc_lengths = data["doc_lengths"]
+        self._finalize()
+
+    async def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """クエリに関連する要点を上位top_k件返す（未読み込みなら、イベントループを止めずに読み込んでから検索）"""
+        if not self._loaded:
+            await asyncio.to_thread(self.load)
+
+        scores: Dict[int, float] = {}
+        for term in set(char_ngrams(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, frequency in docs:
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / self.average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {**self.documents[doc_id], "score": round(score, 4)}
+            for doc_id, score in ranked
+        ]
+
+
+# グローバルインスタンス
+reference_index = ReferenceIndex(settings.reference_csv_path, settings.reference_index_path)
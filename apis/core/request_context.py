@@ -0,0 +1,114 @@
+"""
+リクエストごとのコンテキスト（リクエストID・エンドポイント・評価軸）と計測ミドルウェア
+"""
+import json
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config.settings import settings
+from .lifecycle import app_lifecycle
+from .metrics import HTTP_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# 処理中のリクエストのASGIスコープ（ルーティング後にマッチしたルートが書き込まれる）
+scope_var: ContextVar[Optional[Scope]] = ContextVar("scope", default=None)
+axis_var: ContextVar[str] = ContextVar("axis", default="-")
+# 処理全体の期限（time.monotonic()の値）。上流呼び出しのタイムアウトとリトライはこの時刻までに収める
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+# リクエスト内の上流呼び出しの集計（子タスクからも同じdictを更新する）
+request_stats_var: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_stats", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    """処理中のリクエストID"""
+    return request_id_var.get()
+
+
+def current_endpoint() -> str:
+    """処理中のリクエストのルートのパス（リクエストの外ではbackground）
+
+    ラベルの種類が増えないよう、実際のパスではなく "/analyze/jobs/{job_id}" のようなルートのパスを使う。
+    """
+    scope = scope_var.get()
+    if scope is None:
+        return "background"
+    return getattr(scope.get("route"), "path", None) or "unmatched"
+
+
+def metric_labels() -> Dict[str, str]:
+    """計測値に付けるエンドポイントと評価軸のラベル"""
+    return {"endpoint": current_endpoint(), "axis": axis_var.get()}
+
+
+def add_request_stats(**values: float) -> None:
+    """処理中のリクエストの集計に値を加算"""
+    stats = request_stats_var.get()
+    if stats is None:
+        return
+    for key, value in values.items():
+        stats[key] = stats.get(key, 0) + value
+
+
+class RequestContextMiddleware:
+    """リクエストIDの付与・伝播と、エンドポイントごとの所要時間の計測
+
+    呼び出し元（Next.js）からX-Request-IDが渡されればそれを使い、なければ生成してレスポンスに返す。
+    ストリーミングのレスポンスも最後まで送り終えた時点を所要時間とする。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        request_id = headers.get(REQUEST_ID_HEADER.lower()) or uuid.uuid4().hex
+        stats: Dict[str, Any] = {}
+        tokens = [
+            request_id_var.set(request_id),
+            scope_var.set(scope),
+            request_stats_var.set(stats),
+        ]
+        status = {"code": 500}
+        start = time.monotonic()
+        # 終了時のドレインで待つ対象として数える
+        app_lifecycle.request_started()
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER.lower().encode("latin-1"), request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            app_lifecycle.request_finished()
+            duration = time.monotonic() - start
+            endpoint = current_endpoint()
+            HTTP_REQUEST_SECONDS.labels(
+                endpoint=endpoint, method=scope["method"], status=str(status["code"])
+            ).observe(duration)
+            if duration >= settings.slow_request_seconds:
+                logger.warning("slow request %s", json.dumps({
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "endpoint": endpoint,
+                    "status": status["code"],
+                    "duration_ms": round(duration * 1000),
+                    **{key: round(value, 3) if isinstance(value, float) else value for key, value in stats.items()},
+                }, ensure_ascii=False))
+            for var, token in zip((request_id_var, scope_var, request_stats_var), tokens):
+                var.reset(token)
@@ -0,0 +1,67 @@
+"""
+実行中の同一呼び出しの集約（singleflight）
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """実行中の1つの呼び出しと、その結果を待っている呼び出し元の数"""
+
+    def __init__(self, task: "asyncio.Task[T]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """同じキーの呼び出しが実行中なら、新たに実行せずその結果を共有する
+
+    呼び出し元はasyncio.shieldを通して待つため、1つの呼び出し元がキャンセルされても
+    実行中の呼び出しは続く。待っている呼び出し元が全員いなくなった時点でキャンセルする。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call[T]] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """keyの呼び出しが実行中なら相乗りし、なければfactory()を実行"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 全員が待つのをやめたので上流の呼び出しも打ち切る
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _finish(self, key: str, call: _Call[T]) -> None:
+        self._forget(key, call)
+        # 待っている呼び出し元がいなくても例外を取得済みにしておく
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def _forget(self, key: str, call: _Call[T]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """集約の統計"""
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
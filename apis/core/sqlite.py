@@ -0,0 +1,22 @@
+"""
+SQLiteの接続
+"""
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def connect_sqlite(path: str, row_factory: bool = False) -> Iterator[sqlite3.Connection]:
+    """SQLiteに接続し、ブロックを抜けるとコミット（例外の場合はロールバック）して接続を閉じる
+
+    sqlite3.Connectionのwith文はコミットするだけで接続を閉じないため、こちらを使う。
+    """
+    conn = sqlite3.connect(path, timeout=10)
+    if row_factory:
+        conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
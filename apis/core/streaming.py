@@ -0,0 +1,51 @@
+"""
+ストリーミング応答のクライアント切断の検知
+"""
+import asyncio
+import contextvars
+from typing import AsyncGenerator, AsyncIterator, Optional, TypeVar
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    """クライアントの切断（http.disconnect）を受け取るまで待つ"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def stop_on_disconnect(request: Request, events: AsyncGenerator[T, None]) -> AsyncIterator[T]:
+    """eventsを中継し、クライアントが切断したら次のイベントを待たずに上流を打ち切る
+
+    次のイベントの待機と切断の監視を並べて待ち、切断が先なら待機中のタスクをキャンセルする。
+    上流で設定したコンテキスト変数（評価軸など）が次のイベントにも引き継がれるよう、
+    イベントの待機はすべて同じコンテキストで実行する。
+    """
+    context = contextvars.copy_context()
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    step: Optional["asyncio.Task[T]"] = None
+
+    async def next_event() -> T:
+        return await events.__anext__()
+
+    try:
+        while True:
+            step = asyncio.get_running_loop().create_task(next_event(), context=context)
+            await asyncio.wait({step, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                # クライアントが切断したので上流の生成も打ち切る
+                return
+            try:
+                event = step.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        pending = [task for task in (step, watcher) if task is not None and not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await events.aclose()
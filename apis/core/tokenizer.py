@@ -0,0 +1,34 @@
+"""
+トークン数の計測
+"""
+from functools import lru_cache
+from typing import Any, Optional
+
+# tiktokenのエンコーディング名（gpt-4o / gpt-5系）
+ENCODING_NAME = "o200k_base"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> Optional[Any]:
+    """エンコーダーを1度だけ読み込む（利用できなければNone）"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        # 未インストールや語彙ファイルを取得できない環境では概算で代用する
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """tiktokenを使わない概算（日本語は1文字≒1トークン、英数字は4文字≒1トークン）"""
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """テキストのトークン数"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
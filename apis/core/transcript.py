@@ -0,0 +1,245 @@
+"""
+対話文の分割と前処理
+"""
+import difflib
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from .tokenizer import count_tokens
+
+# 前処理（ターンの分割・あいづちの扱い・圧縮表現）の版。変えたら上げる（分析キャッシュのキーに含まれる）
+PREPROCESSING_VERSION = "2"
+
+CLINICIAN = "clinician"
+CLIENT = "client"
+OTHER = "other"
+
+# 話者ラベル（小文字・末尾の番号を除いたもの）→ 話者
+SPEAKER_LABELS: Dict[str, str] = {
+    **{label: CLINICIAN for label in (
+        "th", "t", "co", "therapist", "counselor", "counsellor", "clinician",
+        "カウンセラー", "セラピスト", "臨床家", "治療者", "面接者", "支援者", "医師", "看護師", "保健師",
+    )},
+    **{label: CLIENT for label in (
+        "cl", "client", "patient",
+        "クライエント", "クライアント", "来談者", "相談者", "患者",
+    )},
+}
+# 圧縮表現で使う話者の表記
+SPEAKER_SHORT_LABELS = {CLINICIAN: "Th", CLIENT: "Cl"}
+
+_LABEL_ALTERNATION = "|".join(re.escape(label) for label in sorted(SPEAKER_LABELS, key=len, reverse=True))
+# 「Th:」「クライエント2：」のように既知の話者ラベル（末尾の番号は可）で始まる行
+# （「注意：」「URL:」のような行を話者ターンと誤認しないよう、SPEAKER_LABELSにあるものだけを認める）
+SPEAKER_LABEL_PATTERN = re.compile(rf"^\s*(?:{_LABEL_ALTERNATION})\d*\s*[:：]", re.IGNORECASE)
+# 話者ラベルと発言内容に分ける（ラベル末尾の番号「Th1：」は話者の判定では無視する）
+LABELED_TURN_PATTERN = re.compile(
+    rf"^\s*((?:{_LABEL_ALTERNATION})\d*)\s*[:：]\s*(.*)$", re.IGNORECASE | re.DOTALL
+)
+
+FILLER_WORDS = (
+    "うん", "はい", "ええ", "え", "あ", "う", "お", "そう", "そうですね", "そうですか", "なるほど",
+    "へえ", "ふん", "はあ", "ほう", "えと", "えっと", "あの",
+    "mm", "mhm", "hmm", "uhhuh", "uh", "um", "ok", "okay", "yeah",
+)
+_FILLER_ALTERNATION = "|".join(sorted(FILLER_WORDS, key=len, reverse=True))
+# あいづち・言いよどみだけの発言（句読点・長音・空白を除いて判定する）
+FILLER_PATTERN = re.compile(rf"^(?:{_FILLER_ALTERNATION})*$")
+FILLER_IGNORED_CHARS = re.compile(r"[\s、。，．,.!！?？…ー〜~-]+")
+# 発言の冒頭の「えっと、」「あの…」のような言いよどみ（区切りの記号が続くものだけ）
+LEADING_FILLER_PATTERN = re.compile(
+    rf"^(?:(?:{_FILLER_ALTERNATION}){FILLER_IGNORED_CHARS.pattern})+", re.IGNORECASE
+)
+
+
+def split_turns(text: str) -> List[str]:
+    """対話文を話者ターンごとに分割
+
+    話者ラベルで始まる行を新しいターンとし、ラベルのない行は直前のターンに連結する。
+    ラベルが1つも見つからない場合は空行以外の各行を1ターンとみなす。
+    """
+    lines = [line for line in text.replace("\r\n", "\n").split("\n") if line.strip()]
+    if not any(SPEAKER_LABEL_PATTERN.match(line) for line in lines):
+        return lines
+
+    turns: List[str] = []
+    for line in lines:
+        if SPEAKER_LABEL_PATTERN.match(line) or not turns:
+            turns.append(line)
+        else:
+            turns[-1] += "\n" + line
+    return turns
+
+
+def segment_transcript(text: str, max_tokens: int, overlap_tokens: int) -> List[str]:
+    """話者ターンの境界で、トークン数を上限とする重なりつきの窓に分割
+
+    次の窓は直前の窓の末尾のターン（合計overlap_tokens以内）から始める。
+    1ターンだけで上限を超える場合はそのターン単独で1つの窓とする。
+    """
+    turns = split_turns(text)
+    sizes = [count_tokens(turn) for turn in turns]
+
+    windows: List[str] = []
+    start = 0
+    while start < len(turns):
+        end = start
+        total = 0
+        while end < len(turns) and (end == start or total + sizes[end] <= max_tokens):
+            total += sizes[end]
+            end += 1
+        windows.append("\n".join(turns[start:end]))
+        if end >= len(turns):
+            break
+
+        # 重なり部分を確保しつつ、必ず1ターン以上は前に進める
+        next_start = end
+        overlap = 0
+        while next_start - 1 > start and overlap + sizes[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += sizes[next_start]
+        start = next_start
+    return windows
+
+
+class Turn:
+    """話者ターン（numberは対話文の先頭からの通し番号で、あいづちを除いても変わらない）
+
+    fillerはクライエントのあいづちだけのターン。臨床家の発言は短くても評価の対象なので付けない。
+    """
+
+    def __init__(self, number: int, speaker: str, label: str, content: str, filler: bool):
+        self.number = number
+        self.speaker = speaker
+        self.label = label
+        self.content = content
+        self.filler = filler
+
+
+class Transcript:
+    """話者つきのターンに分けた対話文
+
+    compact() はクライエントのあいづちのターンを除き、発言冒頭の言いよどみを取り、
+    各ターンに発言番号を付けた表現を返す。
+    分析ではモデルに発言を書き写させず番号だけを返させ、statement() で発言内容に戻す。
+    """
+
+    def __init__(self, turns: List[Turn]):
+        self.turns = turns
+        self._by_number = {turn.number: turn for turn in turns}
+        # 臨床家のラベルが見つからない対話文では、どのターンも評価の対象にできる
+        self.has_clinician = any(turn.speaker == CLINICIAN for turn in turns)
+        self._compact: Optional[str] = None
+
+    def compact(self) -> str:
+        if self._compact is None:
+            self._compact = self._build_compact()
+        return self._compact
+
+    def _build_compact(self) -> str:
+        lines = []
+        for turn in self.turns:
+            if turn.filler:
+                continue
+            label = SPEAKER_SHORT_LABELS.get(turn.speaker, turn.label)
+            content = strip_leading_fillers(" ".join(turn.content.split("\n")))
+            lines.append(f"[{turn.number}] {label}: {content}" if label else f"[{turn.number}] {content}")
+        return "\n".join(lines)
+
+    def statement(self, number: int) -> Optional[str]:
+        """評価の対象にできるターンの発言内容（臨床家の発言でない・存在しない場合はNone）"""
+        turn = self._by_number.get(number)
+        if turn is None or turn.filler:
+            return None
+        if self.has_clinician and turn.speaker != CLINICIAN:
+            return None
+        return turn.content
+
+
+def detect_speaker(label: str) -> str:
+    """話者ラベルから話者（clinician / client / other）を判定"""
+    return SPEAKER_LABELS.get(re.sub(r"\d+$", "", label.strip().lower()), OTHER)
+
+
+def is_filler(content: str) -> bool:
+    """あいづち・言いよどみだけの発言か"""
+    return bool(FILLER_PATTERN.match(FILLER_IGNORED_CHARS.sub("", content).lower()))
+
+
+def strip_leading_fillers(content: str) -> str:
+    """発言冒頭の言いよどみを取り除く（発言がすべて言いよどみの場合はそのまま返す）"""
+    return LEADING_FILLER_PATTERN.sub("", content) or content
+
+
+@lru_cache(maxsize=256)
+def preprocess_transcript(text: str) -> Transcript:
+    """対話文を話者つきのターンに分け、クライエントのあいづちのターンに印を付ける
+
+    4つの評価軸で同じ対話文を処理するため、結果はキャッシュして共有する（変更しないこと）。
+    """
+    turns = []
+    for number, raw in enumerate(split_turns(text), start=1):
+        match = LABELED_TURN_PATTERN.match(raw) if SPEAKER_LABEL_PATTERN.match(raw) else None
+        if match:
+            label, content = match.group(1), match.group(2).strip()
+        else:
+            label, content = "", raw.strip()
+        speaker = detect_speaker(label) if label else OTHER
+        # 臨床家の発言は「そう」のような短いものも評価の対象として残す
+        turns.append(Turn(number, speaker, label, content, speaker == CLIENT and is_filler(content)))
+    return Transcript(turns)
+
+
+def _normalize_turn(text: str) -> str:
+    """差分・照合用に空白を取り除いた文字列"""
+    return "".join(text.split())
+
+
+class TurnDiff:
+    """編集前後の対話文の話者ターン単位の差分
+
+    regionsは変更されたターンの前後context_turnsターンを含む、編集後の対話文の範囲（[start, end)）。
+    この範囲だけを分析し直し、範囲外の発言の評価は編集前の結果を使い回す。
+    """
+
+    def __init__(self, old_text: str, new_text: str, context_turns: int):
+        old_turns = [_normalize_turn(turn) for turn in split_turns(old_text)]
+        self.turns = split_turns(new_text)
+        self._normalized = [_normalize_turn(turn) for turn in self.turns]
+        matcher = difflib.SequenceMatcher(None, old_turns, self._normalized, autojunk=False)
+
+        self.changed_turns = 0
+        regions: List[Tuple[int, int]] = []
+        for tag, _, _, start, end in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            # 削除だけの場合もその前後の文脈が変わるので分析し直す
+            self.changed_turns += end - start
+            region = (max(0, start - context_turns), min(len(self.turns), end + context_turns))
+            if regions and region[0] <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], max(regions[-1][1], region[1]))
+            else:
+                regions.append(region)
+        self.regions = [(start, end) for start, end in regions if end > start]
+
+    @property
+    def unchanged(self) -> bool:
+        return not self.regions and self.changed_turns == 0
+
+    @property
+    def reanalyzed_turns(self) -> int:
+        return sum(end - start for start, end in self.regions)
+
+    def windows(self) -> List[str]:
+        """分析し直す範囲ごとの対話文"""
+        return ["\n".join(self.turns[start:end]) for start, end in self.regions]
+
+    def is_stable(self, statement: str) -> bool:
+        """発言が、分析し直す範囲の外のターンにそのまま残っているか"""
+        target = _normalize_turn(statement)
+        if not target:
+            return False
+        for index, turn in enumerate(self._normalized):
+            if target in turn and not any(start <= index < end for start, end in self.regions):
+                return True
+        return False
@@ -0,0 +1,110 @@
+"""
+LRU + TTL キャッシュ
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """件数上限付きLRUキャッシュ（有効期限つき）
+
+    sliding=True の場合は参照のたびに有効期限を延長する（アイドルTTL）。
+    エントリが追い出されるときは on_evict(key, value) が呼ばれる。
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        sliding: bool = False,
+        on_evict: Optional[Callable[[Hashable, V], None]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sliding = sliding
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Tuple[V, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _evict(self, key: Hashable) -> None:
+        value, _ = self._data.pop(key)
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[V]:
+        """値を取得（期限切れ・未登録はNone）"""
+        now = time.monotonic()
+        entry = self._data.get(key)
+        if entry is None or self._expired(entry[1], now):
+            if entry is not None:
+                self._evict(key)
+            if count:
+                self.misses += 1
+            return None
+
+        value, stored_at = entry
+        self._data.move_to_end(key)
+        if self.sliding:
+            self._data[key] = (value, now)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        """値を登録し、上限を超えたら古いものから追い出す"""
+        if key in self._data:
+            self._data.pop(key)
+        self._data[key] = (value, time.monotonic())
+        self.purge_expired()
+        while len(self._data) > self.max_size:
+            self._evict(next(iter(self._data)))
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        """値を取り除く（on_evictは呼ばない）"""
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def purge_expired(self) -> int:
+        """期限切れのエントリを追い出す"""
+        if self.ttl is None:
+            return 0
+        now = time.monotonic()
+        expired = [k for k, (_, stored_at) in self._data.items() if self._expired(stored_at, now)]
+        for key in expired:
+            self._evict(key)
+        return len(expired)
+
+    def clear(self) -> None:
+        """全エントリを追い出す"""
+        for key in list(self._data):
+            self._evict(key)
+
+    def values(self):
+        return [value for value, _ in self._data.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット率などの統計"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -1,22 +1,154 @@
 """
 ユーティリティ関数
 """
+import hashlib
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from pydantic import ValidationError
+from models.responses import StatementEvaluation
+from .transcript import Transcript
 
 
-def parse_analysis_response(response_text: str) -> List[Dict[str, Any]]:
-    """GPT-4の応答をパースしてJSONに変換"""
+class AnalysisParseError(ValueError):
+    """分析結果の応答が期待する形式でない"""
+
+
+def _load_json(response_text: str, open_char: str, close_char: str) -> Any:
+    """応答テキストからJSONを取り出す（前後に説明文があっても最初と最後の括弧の間を読む）"""
     try:
-        # JSONの開始と終了を見つける
-        start = response_text.find('[')
-        end = response_text.rfind(']') + 1
-        
-        if start != -1 and end != 0:
-            json_text = response_text[start:end]
-            return json.loads(json_text)
-        else:
-            # JSONが見つからない場合のフォールバック
-            return [{"error": "分析結果のパースに失敗しました"}]
+        return json.loads(response_text)
     except json.JSONDecodeError:
-        return [{"error": "分析結果のパースに失敗しました"}]
\ No newline at end of file
+        pass
+    start = response_text.find(open_char)
+    end = response_text.rfind(close_char) + 1
+    if start == -1 or end == 0:
+        raise AnalysisParseError("応答にJSONが見つかりません")
+    try:
+        return json.loads(response_text[start:end])
+    except json.JSONDecodeError as e:
+        raise AnalysisParseError(f"JSONとして読み込めません: {e}")
+
+
+def rehydrate_statement(item: Any, transcript: Transcript) -> Any:
+    """発言番号（turn）で返された評価に、対話文から発言内容を補う"""
+    if not isinstance(item, dict) or "turn" not in item:
+        return item
+    rest = {key: value for key, value in item.items() if key != "turn"}
+    turn = item["turn"]
+    statement = transcript.statement(turn) if isinstance(turn, int) else None
+    if statement is None:
+        raise AnalysisParseError(f"発言番号 {turn} は評価できる臨床家の発言ではありません")
+    return {"statement": statement, **rest}
+
+
+def validate_statements(items: Any, transcript: Optional[Transcript] = None) -> List[Dict[str, Any]]:
+    """評価の配列をStatementEvaluationとして検証
+
+    transcriptを渡すと、発言番号で返された評価の発言内容を補ってから検証する。
+    """
+    if not isinstance(items, list):
+        raise AnalysisParseError("評価の配列が見つかりません")
+    if transcript is not None:
+        items = [rehydrate_statement(item, transcript) for item in items]
+    try:
+        return [StatementEvaluation.model_validate(item).model_dump() for item in items]
+    except ValidationError as e:
+        raise AnalysisParseError(f"評価の形式が不正です: {e}")
+
+
+def parse_analysis_response(response_text: str, transcript: Optional[Transcript] = None) -> List[Dict[str, Any]]:
+    """1つの評価軸の分析結果をパース
+
+    構造化出力の {"statements": [...]} と、配列だけの応答の両方を受け付ける。
+    形式が不正な場合はAnalysisParseErrorを送出する。
+    """
+    data = _load_json(response_text, '[', ']') if response_text.lstrip().startswith('[') else _load_json(response_text, '{', '}')
+    if isinstance(data, dict):
+        data = data.get("statements")
+    return validate_statements(data, transcript)
+
+
+def parse_combined_analysis_response(
+    response_text: str,
+    aspects: Sequence[str],
+    transcript: Optional[Transcript] = None
+) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, str]]:
+    """4軸まとめて分析した応答をパースし、評価軸ごとに分割
+
+    (読み込めた評価軸の結果, 読み込めなかった評価軸のエラー) を返す。
+    """
+    try:
+        data = _load_json(response_text, '{', '}')
+        if not isinstance(data, dict):
+            raise AnalysisParseError("評価軸ごとのオブジェクトが見つかりません")
+    except AnalysisParseError as e:
+        return {}, {aspect: str(e) for aspect in aspects}
+    
+    results, errors = {}, {}
+    for aspect in aspects:
+        try:
+            results[aspect] = validate_statements(data.get(aspect), transcript)
+        except AnalysisParseError as e:
+            errors[aspect] = str(e)
+    return results, errors
+
+
+def tag_model(items: List[Dict[str, Any]], model: str) -> List[Dict[str, Any]]:
+    """各評価に、それを出力したモデル名を付ける（保存した分析をあとから追跡できるように）"""
+    return [{**item, "model": model} for item in items]
+
+
+def merge_analysis_results(results: Sequence[List[Dict[str, Any]]], limit: int = 3) -> List[Dict[str, Any]]:
+    """分割して分析した窓ごとの結果を、1つの評価軸の上位limit件にまとめる
+
+    同じ発言は1件にまとめ、評価点が中間（3）から離れているもの、
+    すなわち特に良い・特に改善が必要な発言を優先する。同点なら対話文で先に出たものを優先する。
+    """
+    candidates: Dict[str, Dict[str, Any]] = {}
+    for items in results:
+        for item in items:
+            statement = "".join(str(item.get("statement", "")).split())
+            if statement not in candidates:
+                candidates[statement] = item
+    
+    def notability(item: Dict[str, Any]) -> float:
+        try:
+            return abs(float(item.get("score", 3)) - 3)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    ranked = sorted(candidates.values(), key=notability, reverse=True)
+    return ranked[:limit]
+
+
+def assign_statement_ids(aspect: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """各評価に発言内容から決まる安定したIDを付ける（元のリストは変更しない）"""
+    assigned: List[Dict[str, Any]] = []
+    seen = set()
+    for item in items:
+        if "id" in item:
+            assigned.append(dict(item))
+            continue
+        statement = "".join(str(item.get("statement", "")).split())
+        digest = hashlib.sha256(f"{aspect}\n{statement}".encode("utf-8")).hexdigest()[:10]
+        statement_id = f"{aspect}-{digest}"
+        suffix = 1
+        while statement_id in seen:
+            suffix += 1
+            statement_id = f"{aspect}-{digest}-{suffix}"
+        seen.add(statement_id)
+        assigned.append({**item, "id": statement_id})
+    return assigned
+
+
+def hash_api_key(api_key: Optional[str]) -> str:
+    """API keyを平文で保持しないためのハッシュ値（キー未指定時は"default"）"""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Server-Sent Eventsの1イベント分の文字列を生成"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
@@ -0,0 +1,30 @@
+"""
+gunicornの設定（uvicornワーカーで複数プロセス起動する）
+
+    gunicorn -c gunicorn_conf.py main:app
+
+値はconfig.settingsのサーバー設定（環境変数SERVER_WORKERSなど）から読み込む。
+"""
+import multiprocessing
+import os
+from config.settings import settings
+
+bind = f"{settings.host}:{settings.port}"
+# 分析はOpenAIの応答待ちがほとんどなので、1ワーカーで多数のリクエストを並行して処理できる。
+# CPUを使うのはプロンプト組み立て・パース程度のため、コア数と同じにする
+workers = settings.server_workers or multiprocessing.cpu_count()
+settings.check_workers(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = settings.server_keepalive
+timeout = settings.server_timeout
+graceful_timeout = settings.server_graceful_timeout
+max_requests = settings.server_max_requests
+max_requests_jitter = settings.server_max_requests_jitter
+accesslog = "-"
+
+
+def child_exit(server, worker):
+    """終了したワーカーのPrometheusの計測値ファイルを片付ける"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,21 +1,79 @@
 """
 FastAPI アプリケーションメイン
 """
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 from config.settings import settings
-from routes import health, analysis, chat
+from core.lifecycle import app_lifecycle
+from core.prompt_manager import PromptManager
+from core.reference_index import reference_index
+from core.request_context import RequestContextMiddleware
+from core.tokenizer import count_tokens
+from models.types import EVALUATION_AXES
+from routes import health, analysis, analytics, chat, ready
+from services.job_queue import job_queue
+from services.openai_client_pool import openai_client_pool
 
 # 環境変数をロード
 load_dotenv()
 
+# ログ設定
+logging.basicConfig(
+    level=logging.DEBUG if settings.debug else logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
+
+async def _warm_prompts() -> None:
+    """分析プロンプトの版（キャッシュキーに使う）と出力形式を先に計算しておく"""
+    for aspect in (*EVALUATION_AXES, "combined"):
+        PromptManager.get_prompt_version(aspect)
+
+
+async def _warm_tokenizer() -> None:
+    """tiktokenの語彙を読み込む（初回は取得に時間がかかる）"""
+    await asyncio.to_thread(count_tokens, "ウォームアップ warmup")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動・終了時の処理
+
+    プリウォームはバックグラウンドで行い、終わるまで /ready は503を返す。
+    SIGTERMを受けた時点で/readyを503にし、shutdown_readiness_delay秒後にサーバーが接続の受付を止める。
+    終了時は処理中のリクエストを待ってから（ドレイン）接続を閉じる。
+    """
+    # SIGTERMを受けたらサーバーが接続の受付を止める前に/readyを503にする
+    app_lifecycle.install_signal_handler(settings.shutdown_readiness_delay)
+    if settings.job_queue_enabled:
+        await job_queue.start()
+    warmup = asyncio.create_task(app_lifecycle.prewarm([
+        # 参考資料の検索インデックスを読み込む（なければ構築して保存）
+        ("reference_index", lambda: asyncio.to_thread(reference_index.load)),
+        ("tokenizer", _warm_tokenizer),
+        ("prompts", _warm_prompts),
+        # OpenAIのホストへのDNS解決・TLSハンドシェイクを済ませておく
+        ("openai_connection", openai_client_pool.prewarm),
+    ]))
+    yield
+    await app_lifecycle.drain(settings.shutdown_drain_seconds)
+    warmup.cancel()
+    await job_queue.stop()
+    # 終了時にOpenAIクライアントの接続を閉じる
+    await openai_client_pool.close()
+
+
 # FastAPIアプリケーション初期化
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
-    debug=settings.debug
+    debug=settings.debug,
+    lifespan=lifespan
 )
 
 # CORS設定
@@ -25,17 +83,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# リクエストIDの付与と所要時間の計測（CORSより外側で全リクエストを対象にする）
+app.add_middleware(RequestContextMiddleware)
 
 # ルーター登録
 app.include_router(health.router)
+app.include_router(ready.router)
 app.include_router(analysis.router)
 app.include_router(chat.router)
+app.include_router(analytics.router)
 
 if __name__ == "__main__":
     import uvicorn
+    settings.check_workers(settings.server_workers or 1)
     uvicorn.run(
-        app,
+        # 複数ワーカーで起動するためにインポート文字列で渡す
+        "main:app",
         host=settings.host,
-        port=settings.port
+        port=settings.port,
+        workers=settings.server_workers or 1,
+        timeout_keep_alive=settings.server_keepalive,
+        timeout_graceful_shutdown=settings.server_graceful_timeout,
+        limit_max_requests=settings.server_max_requests or None
     )
\ No newline at end of file
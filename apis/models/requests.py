@@ -1,8 +1,10 @@
 """
 リクエストモデル定義
 """
+from datetime import datetime
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from models.responses import StatementEvaluation
 from models.types import EvaluationAxis
 
 
@@ -12,6 +14,51 @@ class ConversationAnalysisRequest(BaseModel):
     target_behavior: Optional[str] = None
 
 
+class IncrementalAnalysisRequest(ConversationAnalysisRequest):
+    """編集した対話文の差分再分析リクエスト
+
+    編集前の分析はsession_idか、previous_textとprevious_resultの組で指定する。
+    """
+    session_id: Optional[str] = None
+    previous_text: Optional[str] = None
+    previous_result: Optional[Dict[EvaluationAxis, List[StatementEvaluation]]] = None
+
+
+class AnalysisJobRequest(ConversationAnalysisRequest):
+    """会話分析ジョブの登録リクエスト"""
+    priority: int = 0  # 大きいほど先に実行する
+    webhook_url: Optional[str] = None  # 完了時に結果をPOSTするURL
+
+
+class BatchAnalysisItem(ConversationAnalysisRequest):
+    """一括分析の1件"""
+    id: str  # 呼び出し側で付ける識別子（結果の対応付けに使う）
+
+
+class BatchAnalysisRequest(BaseModel):
+    """一括分析リクエスト"""
+    items: List[BatchAnalysisItem]
+
+
+class AnalyticsItem(BaseModel):
+    """集計する分析結果の1件（AnalysisResponseの形。session_idなどの項目は無視する）
+
+    評価はscoreとiconだけを使い、エラーの項目など集計できない評価は読み飛ばす（件数はskippedに数える）。
+    """
+    cct: Optional[List[Any]] = None
+    sst: Optional[List[Any]] = None
+    empathy: Optional[List[Any]] = None
+    partnership: Optional[List[Any]] = None
+    created_at: Optional[datetime] = None  # 推移の並び順に使う（ないものは最後に入力順で並べる。タイムゾーンがなければUTC）
+    group: Optional[str] = None  # ユーザーIDやコホート名など、別に集計する単位
+
+
+class AnalyticsSummaryRequest(BaseModel):
+    """分析結果の集計リクエスト"""
+    items: List[AnalyticsItem]
+    rolling_window: Optional[int] = Field(None, ge=1)  # 省略時はanalytics_rolling_window
+
+
 class DetailedChatRequest(BaseModel):
     """詳細チャットリクエスト"""
     conversation_text: str
@@ -24,3 +71,10 @@ class DetailedChatRequest(BaseModel):
     statement_content: Optional[str] = None
 
 
+class SessionChatRequest(BaseModel):
+    """分析セッションを使う詳細チャットリクエスト（会話・分析結果・履歴はサーバー側で保持）"""
+    session_id: str
+    aspect: EvaluationAxis
+    statement_id: str
+    question: str
+    use_reference: bool = False
@@ -1,8 +1,10 @@
 """
 レスポンスモデル定義
 """
-from typing import List, Dict, Any
-from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Dict, Any, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from models.types import EvaluationAxis
 
 
 class ChatResponse(BaseModel):
@@ -10,9 +12,88 @@ class ChatResponse(BaseModel):
     response: str
 
 
+class StatementEvaluation(BaseModel):
+    """発言ごとの評価"""
+    # 発言IDなど、サーバー側で付け加える項目を許可する
+    model_config = ConfigDict(extra="allow")
+    
+    statement: str
+    evaluation: str  # 評価の根拠（内部処理用でユーザには見せない）
+    score: int = Field(ge=1, le=5)
+    feedback: str
+    suggestions: List[str]
+    icon: Literal["good", "warning", "bad"]
+
+
 class AnalysisResponse(BaseModel):
-    """分析レスポンス"""
-    cct: List[Dict[str, Any]]
-    sst: List[Dict[str, Any]] 
-    empathy: List[Dict[str, Any]]
-    partnership: List[Dict[str, Any]]
\ No newline at end of file
+    """分析レスポンス（期限切れ・失敗した評価軸は空で、timed_out / errorsに含まれる）"""
+    cct: List[StatementEvaluation] = []
+    sst: List[StatementEvaluation] = []
+    empathy: List[StatementEvaluation] = []
+    partnership: List[StatementEvaluation] = []
+    session_id: Optional[str] = None  # 詳細チャットで使う分析セッションのID
+    timed_out: List[EvaluationAxis] = []  # 期限までに終わらなかった評価軸
+    errors: Dict[str, str] = {}  # 評価軸 → エラー内容
+
+
+class IncrementalAnalysisResponse(AnalysisResponse):
+    """差分再分析のレスポンス"""
+    mode: Literal["incremental", "full", "unchanged"]  # full: 変更が大きく全体を分析した
+    reanalyzed_turns: int  # 分析し直したターン数
+    total_turns: int
+
+
+class AnalysisJobResponse(BaseModel):
+    """会話分析ジョブの状態"""
+    job_id: str
+    status: Literal["queued", "running", "completed", "failed"]
+    priority: int
+    created_at: float
+    updated_at: float
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+
+class ProviderBatchResponse(BaseModel):
+    """プロバイダーのBatch APIに投入した一括分析の状態"""
+    batch_id: str
+    status: str  # プロバイダー側の状態（validating / in_progress / completed / failed / expired など）
+    items: int
+    unique_items: int
+    created_at: float
+    results: Optional[Dict[str, Dict[str, List[StatementEvaluation]]]] = None  # 項目ID → 評価軸 → 結果
+    errors: Optional[Dict[str, Dict[str, str]]] = None  # 項目ID → 評価軸 → エラー
+
+
+class AxisSummary(BaseModel):
+    """評価軸ごとのスコアの集計"""
+    statements: int  # 評価の件数
+    sessions: int  # この評価軸の評価を含む分析結果の件数
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    percentiles: Dict[str, float] = {}  # "p10" / "p25" / "p50" / "p75" / "p90"
+    icons: Dict[str, int]  # good / warning / bad の件数
+
+
+class ScoreTrend(BaseModel):
+    """分析結果を時系列に並べたスコアの推移"""
+    created_at: List[Optional[datetime]]
+    rolling_mean: Dict[EvaluationAxis, List[Optional[float]]]  # 直近rolling_window件の平均スコア
+    slope: Dict[EvaluationAxis, Optional[float]]  # 分析結果1件あたりの平均スコアの変化（回帰直線の傾き）
+
+
+class AnalyticsSummary(BaseModel):
+    """分析結果の集計"""
+    sessions: int
+    statements: int
+    axes: Dict[EvaluationAxis, AxisSummary]
+    weakest_axis: Optional[EvaluationAxis] = None  # 平均スコアが最も低い評価軸
+    weakest_axis_counts: Dict[EvaluationAxis, int]  # 分析結果ごとに最も低かった評価軸の件数
+    trend: ScoreTrend
+
+
+class AnalyticsSummaryResponse(AnalyticsSummary):
+    """分析結果の集計レスポンス"""
+    rolling_window: int
+    skipped: int = 0  # 集計できずに読み飛ばした評価（エラーの項目・範囲外のスコアなど）の件数
+    groups: Dict[str, AnalyticsSummary] = {}  # groupごとの集計
@@ -1,7 +1,10 @@
 """
 型定義
 """
-from typing import Literal
+from typing import Literal, Tuple
 
 # 評価軸の型定義
-EvaluationAxis = Literal['cct', 'sst', 'empathy', 'partnership']
\ No newline at end of file
+EvaluationAxis = Literal['cct', 'sst', 'empathy', 'partnership']
+
+# 評価軸の一覧（レスポンスの並び順）
+EVALUATION_AXES: Tuple[EvaluationAxis, ...] = ('cct', 'sst', 'empathy', 'partnership')
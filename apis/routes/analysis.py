@@ -1,11 +1,31 @@
 """
 分析関連エンドポイント
 """
-from fastapi import APIRouter, HTTPException, Header
-from typing import Optional
-from models.requests import ConversationAnalysisRequest
-from models.responses import AnalysisResponse
+import json
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
+from openai import RateLimitError
+from typing import Any, Dict, List, Optional
+from config.settings import settings
+from core.streaming import stop_on_disconnect
+from core.utils import assign_statement_ids
+from models.requests import (
+    ConversationAnalysisRequest,
+    AnalysisJobRequest,
+    BatchAnalysisRequest,
+    IncrementalAnalysisRequest,
+)
+from models.responses import (
+    AnalysisResponse,
+    AnalysisJobResponse,
+    IncrementalAnalysisResponse,
+    ProviderBatchResponse,
+)
 from services.analysis_service import analysis_service
+from services.batch_service import batch_service
+from services.circuit_breaker import CircuitOpenError
+from services.job_queue import WebhookURLError, job_queue
+from services.session_store import AnalysisSession, session_store
 
 router = APIRouter(tags=["analysis"])
 
@@ -13,17 +33,239 @@ router = APIRouter(tags=["analysis"])
 @router.post("/analyze", response_model=AnalysisResponse)
 async def analyze_conversation(
     request: ConversationAnalysisRequest,
-    x_api_key: Optional[str] = Header(None, alias="X-API-Key")
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
+    x_cache_bypass: bool = Header(False, alias="X-Cache-Bypass"),
+    x_deadline_seconds: Optional[float] = Header(None, alias="X-Deadline-Seconds")
 ):
-    """会話テキストを4つの評価軸で分析"""
+    """会話テキストを4つの評価軸で分析
+
+    期限（X-Deadline-Seconds、既定はanalysis_deadline_seconds）までに終わらなかった評価軸は
+    timed_outに、失敗した評価軸はerrorsに入れ、完了した評価軸だけを返す。
+    """
+    try:
+        results, errors, timed_out = await analysis_service.analyze_conversation_partial(
+            request.text,
+            request.target_behavior,
+            x_api_key,
+            use_cache=not x_cache_bypass,
+            timeout=x_deadline_seconds or settings.analysis_deadline_seconds
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析エラー: {str(e)}")
+
+    session = await _create_session(request, results, errors)
+    return AnalysisResponse(
+        **session.analysis_result,
+        session_id=session.session_id,
+        timed_out=timed_out,
+        errors={aspect: f"分析エラー: {str(error)}" for aspect, error in errors.items()}
+    )
+
+
+async def _create_session(
+    request: ConversationAnalysisRequest,
+    results: Dict[str, List[Dict[str, Any]]],
+    errors: Dict[str, Exception]
+) -> AnalysisSession:
+    """完了した評価軸の結果でセッションを作成（1つも完了していなければエラーを返す）"""
+    if not results:
+        if not errors:
+            raise HTTPException(status_code=504, detail="分析エラー: 期限までに分析が完了しませんでした")
+        error = next(iter(errors.values()))
+        if isinstance(error, RateLimitError):
+            # リトライしても枠が空かなかった場合は呼び出し元に待ってもらう
+            raise HTTPException(status_code=429, detail=f"分析エラー: {str(error)}")
+        if isinstance(error, CircuitOpenError):
+            # 上流の回復を待つ間は、呼び出し元に待たせずすぐ返す
+            raise HTTPException(status_code=503, detail=f"分析エラー: {str(error)}")
+        raise HTTPException(status_code=500, detail=f"分析エラー: {str(error)}")
+
     try:
-        result = await analysis_service.analyze_conversation(
+        # 詳細チャットで会話・結果を再送しなくてよいようにセッションとして保持
+        return await session_store.create(request.text, request.target_behavior, results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析エラー: {str(e)}")
+
+
+@router.post("/analyze/incremental", response_model=IncrementalAnalysisResponse)
+async def analyze_incremental(
+    request: IncrementalAnalysisRequest,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
+    x_cache_bypass: bool = Header(False, alias="X-Cache-Bypass"),
+    x_deadline_seconds: Optional[float] = Header(None, alias="X-Deadline-Seconds")
+):
+    """編集した対話文を、変更されたターンの周辺だけ分析し直す
+
+    編集前の分析はsession_id（/analyzeが返したもの）か、previous_textとprevious_resultで指定する。
+    目標行動がセッションと異なる場合は全体を分析する。
+    """
+    if request.session_id:
+        session = await session_store.get(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="分析セッションが見つかりません")
+        previous_text = session.conversation_text
+        # 目標行動が変わるとすべての評価が変わりうるため、使い回さない
+        previous_result = session.analysis_result if session.target_behavior == request.target_behavior else {}
+    elif request.previous_text is not None and request.previous_result is not None:
+        previous_text = request.previous_text
+        previous_result = {
+            aspect: [item.model_dump() for item in items]
+            for aspect, items in request.previous_result.items()
+        }
+    else:
+        raise HTTPException(status_code=400, detail="session_id か previous_text と previous_result を指定してください")
+
+    try:
+        results, errors, timed_out, info = await analysis_service.analyze_incremental(
+            request.text,
+            previous_text,
+            previous_result,
+            request.target_behavior,
+            x_api_key,
+            use_cache=not x_cache_bypass,
+            timeout=x_deadline_seconds or settings.analysis_deadline_seconds
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析エラー: {str(e)}")
+
+    session = await _create_session(request, results, errors)
+    return IncrementalAnalysisResponse(
+        **session.analysis_result,
+        session_id=session.session_id,
+        timed_out=timed_out,
+        errors={aspect: f"分析エラー: {str(error)}" for aspect, error in errors.items()},
+        **info
+    )
+
+
+@router.post("/analyze/stream")
+async def analyze_conversation_stream(
+    request: ConversationAnalysisRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
+    x_cache_bypass: bool = Header(False, alias="X-Cache-Bypass"),
+    x_deadline_seconds: Optional[float] = Header(None, alias="X-Deadline-Seconds")
+):
+    """評価軸ごとの結果を完了順にNDJSONで返す（評価が1件生成されるごとにstatementイベントも返す）"""
+    async def event_stream():
+        events = analysis_service.analyze_conversation_stream(
             request.text,
             request.target_behavior,
-            x_api_key
+            x_api_key,
+            use_cache=not x_cache_bypass,
+            timeout=x_deadline_seconds or settings.analysis_deadline_seconds
         )
-        
-        return AnalysisResponse(**result)
-        
+        completed = {}
+        try:
+            # クライアントが切断したら残りの分析を打ち切る
+            async for event in stop_on_disconnect(http_request, events):
+                if event["type"] == "statement":
+                    # 生成途中の評価。axisイベントで確定した結果と同じIDを付ける
+                    event = {**event, "statement": assign_statement_ids(event["aspect"], [event["statement"]])[0]}
+                elif event["type"] == "axis":
+                    event = {**event, "result": assign_statement_ids(event["aspect"], event["result"])}
+                    completed[event["aspect"]] = event["result"]
+                elif event["type"] == "done":
+                    # 完了した評価軸だけでセッションを作成
+                    session = await session_store.create(request.text, request.target_behavior, completed)
+                    event = {**event, "session_id": session.session_id}
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+def _validate_batch(request: BatchAnalysisRequest) -> None:
+    """一括分析の件数と項目IDを検証"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="分析する項目がありません")
+    if len(request.items) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"一度に分析できるのは{settings.batch_max_items}件までです")
+    if len({item.id for item in request.items}) != len(request.items):
+        raise HTTPException(status_code=400, detail="項目IDが重複しています")
+
+
+@router.post("/analyze/batch")
+async def analyze_batch(
+    request: BatchAnalysisRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
+    x_cache_bypass: bool = Header(False, alias="X-Cache-Bypass")
+):
+    """複数の対話文をまとめて分析し、項目ごとの結果を完了順にNDJSONで返す"""
+    _validate_batch(request)
+    items = {item.id: item for item in request.items}
+
+    async def event_stream():
+        events = batch_service.stream(request.items, x_api_key, use_cache=not x_cache_bypass)
+        try:
+            async for event in stop_on_disconnect(http_request, events):
+                if event["type"] == "item":
+                    result = {
+                        aspect: assign_statement_ids(aspect, statements)
+                        for aspect, statements in event["result"].items()
+                    }
+                    event = {**event, "result": result}
+                    if result:
+                        item = items[event["id"]]
+                        session = await session_store.create(item.text, item.target_behavior, result)
+                        event["session_id"] = session.session_id
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@router.post("/analyze/batch/provider", response_model=ProviderBatchResponse, status_code=202)
+async def create_provider_batch(
+    request: BatchAnalysisRequest,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """複数の対話文をプロバイダーのBatch APIに投入（結果は完了後に取得）"""
+    _validate_batch(request)
+    try:
+        return await batch_service.submit_provider_batch(request.items, x_api_key)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"分析エラー: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"分析エラー: {str(e)}")
+
+
+@router.get("/analyze/batch/provider/{batch_id}", response_model=ProviderBatchResponse)
+async def get_provider_batch(
+    batch_id: str,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """Batch APIに投入した一括分析の状態と、終了していれば結果を取得"""
+    try:
+        batch = await batch_service.get_provider_batch(batch_id, x_api_key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析エラー: {str(e)}")
+    if batch is None:
+        raise HTTPException(status_code=404, detail="バッチが見つかりません")
+    return batch
+
+
+@router.post("/analyze/jobs", response_model=AnalysisJobResponse, status_code=202)
+async def create_analysis_job(
+    request: AnalysisJobRequest,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """分析ジョブを登録し、ジョブIDをすぐに返す"""
+    if not settings.job_queue_enabled:
+        raise HTTPException(status_code=503, detail="ジョブキューは無効です")
+    try:
+        return await job_queue.submit(request, x_api_key)
+    except WebhookURLError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/analyze/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(job_id: str):
+    """分析ジョブの状態と結果を取得"""
+    if not settings.job_queue_enabled:
+        raise HTTPException(status_code=503, detail="ジョブキューは無効です")
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
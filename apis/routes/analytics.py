@@ -0,0 +1,46 @@
+"""
+集計関連エンドポイント
+"""
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
+from typing import Optional
+from config.settings import settings
+from models.requests import AnalyticsSummaryRequest
+from models.responses import AnalyticsSummaryResponse
+from services.analytics_service import AnalyticsInputError, AnalyticsTooLargeError, analytics_service
+
+router = APIRouter(tags=["analytics"])
+
+
+@router.post("/analytics/summary", response_model=AnalyticsSummaryResponse)
+async def analytics_summary(
+    request: Request,
+    rolling_window: Optional[int] = Query(None, ge=1)
+):
+    """蓄積した分析結果（AnalysisResponseの形）のスコアを評価軸ごと・groupごとに集計
+
+    本文はAnalyticsSummaryRequestのJSONか、Content-Type: application/x-ndjson で1行に1件の分析結果を送る
+    （NDJSONの場合、移動平均の件数はクエリのrolling_windowで指定する）。
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            # 大量の履歴は全体を読み込まず、届いた行から列に展開する
+            columns = await analytics_service.read_ndjson(request.stream())
+        else:
+            body = AnalyticsSummaryRequest.model_validate_json(await request.body())
+            columns = analytics_service.collect(body.items)
+            rolling_window = rolling_window or body.rolling_window
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    except AnalyticsTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AnalyticsInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not len(columns):
+        raise HTTPException(status_code=400, detail="集計する分析結果がありません")
+
+    # 件数が多い場合に他のリクエストを止めないよう、集計はスレッドで行う
+    return await asyncio.to_thread(
+        analytics_service.summarize, columns, rolling_window or settings.analytics_rolling_window
+    )
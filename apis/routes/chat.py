@@ -1,11 +1,17 @@
 """
 チャット関連エンドポイント
 """
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
+from openai import RateLimitError
 from typing import Optional
-from models.requests import DetailedChatRequest
+from core.streaming import stop_on_disconnect
+from core.utils import format_sse
+from models.requests import DetailedChatRequest, SessionChatRequest
 from models.responses import ChatResponse
 from services.chat_service import chat_service
+from services.circuit_breaker import CircuitOpenError
+from services.session_store import AnalysisSession, session_store
 
 router = APIRouter(tags=["chat"])
 
@@ -20,5 +26,90 @@ async def detailed_chat(
         response = await chat_service.detailed_chat(request, x_api_key)
         return ChatResponse(response=response)
         
+    except RateLimitError as e:
+        # リトライしても枠が空かなかった場合は呼び出し元に待ってもらう
+        raise HTTPException(status_code=429, detail=f"詳細チャットエラー: {str(e)}")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"詳細チャットエラー: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"詳細チャットエラー: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"詳細チャットエラー: {str(e)}")
+
+
+@router.post("/detailed-chat/stream")
+async def detailed_chat_stream(
+    request: DetailedChatRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """詳細分析チャット（Server-Sent Eventsでトークンを逐次返す）"""
+    async def event_stream():
+        events = chat_service.stream_detailed_chat(request, x_api_key)
+        try:
+            # クライアントが切断したら上流の生成も打ち切る
+            async for event, data in stop_on_disconnect(http_request, events):
+                yield format_sse(event, data)
+        except Exception as e:
+            yield format_sse("error", {"detail": f"詳細チャットエラー: {str(e)}"})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _get_session(request: SessionChatRequest) -> AnalysisSession:
+    """セッションと対象の発言が存在することを確認"""
+    session = await session_store.get(request.session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="分析セッションが見つかりません")
+    if session.find_statement(request.aspect, request.statement_id) is None:
+        raise HTTPException(status_code=404, detail="指定された発言の評価が見つかりません")
+    return session
+
+
+@router.post("/detailed-chat/session", response_model=ChatResponse)
+async def session_chat(
+    request: SessionChatRequest,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """分析セッションを使う詳細分析チャット"""
+    session = await _get_session(request)
+    try:
+        response = await chat_service.session_chat(session, request, x_api_key)
+        return ChatResponse(response=response)
+        
+    except RateLimitError as e:
+        raise HTTPException(status_code=429, detail=f"詳細チャットエラー: {str(e)}")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"詳細チャットエラー: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"詳細チャットエラー: {str(e)}")
+
+
+@router.post("/detailed-chat/session/stream")
+async def session_chat_stream(
+    request: SessionChatRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None, alias="X-API-Key")
+):
+    """分析セッションを使う詳細分析チャット（Server-Sent Events）"""
+    session = await _get_session(request)
+
+    async def event_stream():
+        events = chat_service.stream_session_chat(session, request, x_api_key)
+        try:
+            async for event, data in stop_on_disconnect(http_request, events):
+                yield format_sse(event, data)
+        except Exception as e:
+            yield format_sse("error", {"detail": f"詳細チャットエラー: {str(e)}"})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
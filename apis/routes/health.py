@@ -1,12 +1,62 @@
 """
 ヘルスチェックエンドポイント
 """
-from fastapi import APIRouter
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from config.settings import settings
+from core.metrics import render_metrics
+from services.analysis_cache import analysis_cache
+from services.analysis_service import analysis_service
+from services.circuit_breaker import circuit_breaker
+from services.job_queue import job_queue
+from services.openai_client_pool import openai_client_pool
+from services.openai_service import openai_service
+from services.rate_limiter import rate_limiter
+from services.session_store import session_store
 
 router = APIRouter()
 
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+async def require_internal_access(
+    request: Request,
+    authorization: Optional[str] = Header(None)
+) -> None:
+    """内部向けの統計の閲覧を制限（internal_stats_tokenのBearerトークン、未設定ならループバックからの接続だけ）"""
+    if settings.internal_stats_token:
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.internal_stats_token.encode()):
+            raise HTTPException(status_code=401, detail="認証が必要です", headers={"WWW-Authenticate": "Bearer"})
+        return
+    if request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="INTERNAL_STATS_TOKEN を設定してください")
+
 
 @router.get("/")
 async def health_check():
     """ヘルスチェック"""
-    return {"message": "Conversation Analysis API"}
\ No newline at end of file
+    return {"message": "Conversation Analysis API"}
+
+
+@router.get("/stats", dependencies=[Depends(require_internal_access)])
+async def stats():
+    """内部リソースの統計"""
+    return {
+        "openai_client_pool": openai_client_pool.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "analysis_inflight": analysis_service.inflight_stats(),
+        "openai_usage": openai_service.usage_stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "circuit_breaker": circuit_breaker.stats(),
+        "job_queue": job_queue.stats(),
+        "sessions": session_store.stats(),
+    }
+
+
+@router.get("/metrics", dependencies=[Depends(require_internal_access)])
+async def metrics():
+    """Prometheus形式の計測値"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,18 @@
+"""
+レディネスチェックエンドポイント
+"""
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from core.lifecycle import app_lifecycle
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/ready")
+async def readiness():
+    """プリウォームが終わり、終了処理に入っていなければ200（それ以外は503）
+
+    `/` は起動していれば常に200を返すため、ロードバランサーの振り分けにはこちらを使う。
+    """
+    status = app_lifecycle.stats()
+    return JSONResponse(status_code=200 if app_lifecycle.ready else 503, content=status)
@@ -0,0 +1,160 @@
+"""
+分析結果キャッシュ
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from config.settings import settings
+from core.sqlite import connect_sqlite
+from core.ttl_cache import TTLCache
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用に対話文を正規化（改行コードと行末・前後の空白の違いを無視）"""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_cache_key(
+    text: str,
+    target_behavior: Optional[str],
+    aspect: str,
+    model: str,
+    prompt_version: str
+) -> str:
+    """(対話文, 目標行動, 評価軸, モデル, プロンプト版) から決まるキーを生成"""
+    payload = json.dumps(
+        [normalize_text(text), (target_behavior or "").strip(), aspect, model, prompt_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteCacheStore:
+    """ワーカー間で共有するSQLiteのキャッシュ層"""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with connect_sqlite(self.path) as conn:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_analysis_cache_accessed_at "
+                    "ON analysis_cache (accessed_at)"
+                )
+                self._initialized = True
+            yield conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """値を取得（期限切れはNone）"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """値を登録し、上限を超えた分は参照の古いものから削除"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            conn.execute("DELETE FROM analysis_cache WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM analysis_cache WHERE key IN ("
+                "SELECT key FROM analysis_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class AnalysisCache:
+    """評価軸ごとの分析結果キャッシュ（メモリLRU + 任意のSQLite）"""
+
+    def __init__(self):
+        self.enabled = settings.analysis_cache_enabled
+        self._memory: TTLCache[Any] = TTLCache(
+            max_size=settings.analysis_cache_max_entries,
+            ttl=settings.analysis_cache_ttl,
+        )
+        self._sqlite: Optional[SQLiteCacheStore] = None
+        if settings.analysis_cache_sqlite_path:
+            self._sqlite = SQLiteCacheStore(
+                settings.analysis_cache_sqlite_path,
+                ttl=settings.analysis_cache_ttl,
+                max_entries=settings.analysis_cache_sqlite_max_entries,
+            )
+        self.sqlite_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        """キャッシュから取得（メモリ → SQLiteの順）"""
+        if not self.enabled:
+            return None
+        value = self._memory.get(key, count=False)
+        if value is not None:
+            self._memory.hits += 1
+            # 呼び出し元が結果を書き換えてもキャッシュに影響しないよう、コピーを返す
+            return copy.deepcopy(value)
+        if self._sqlite is not None:
+            value = await asyncio.to_thread(self._sqlite.get, key)
+            if value is not None:
+                self.sqlite_hits += 1
+                self._memory.set(key, copy.deepcopy(value))
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        """キャッシュに登録（両方の層）"""
+        if not self.enabled:
+            return
+        self._memory.set(key, copy.deepcopy(value))
+        if self._sqlite is not None:
+            await asyncio.to_thread(self._sqlite.set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計"""
+        memory = self._memory.stats()
+        hits = memory["hits"] + self.sqlite_hits
+        total = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": memory["size"],
+            "max_size": memory["max_size"],
+            "evictions": memory["evictions"],
+            "memory_hits": memory["hits"],
+            "sqlite_hits": self.sqlite_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "sqlite": self._sqlite is not None,
+        }
+
+
+# グローバルインスタンス
+analysis_cache = AnalysisCache()
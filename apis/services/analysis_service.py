@@ -2,58 +2,641 @@
 分析サービス
 """
 import asyncio
-from typing import List, Dict, Any, Optional
-from models.types import EvaluationAxis
+import logging
+import time
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable, Tuple
+from models.types import EvaluationAxis, EVALUATION_AXES
+from core.hedging import LatencyTracker, hedged_call
+from core.json_stream import IncrementalStatementParser
+from core.metrics import ANALYSIS_HEDGES, ANALYSIS_PARSE_FAILURES
 from core.prompt_manager import PromptManager
-from core.utils import parse_analysis_response
+from core.request_context import add_request_stats, axis_var, deadline_var, metric_labels
+from core.singleflight import SingleFlight
+from core.tokenizer import count_tokens
+from core.transcript import Transcript, TurnDiff, preprocess_transcript, segment_transcript
+from core.utils import (
+    AnalysisParseError,
+    hash_api_key,
+    merge_analysis_results,
+    parse_analysis_response,
+    parse_combined_analysis_response,
+    tag_model,
+    validate_statements,
+)
+from config.settings import settings
+from .analysis_cache import analysis_cache, make_cache_key
 from .openai_service import openai_service
 
+logger = logging.getLogger(__name__)
+
+# 評価が1件揃うたびに (評価軸, 評価) で呼ばれるコールバック
+StatementCallback = Callable[[EvaluationAxis, Dict[str, Any]], None]
+
 
 class AnalysisService:
     """会話分析サービス"""
     
-    async def analyze_conversation(
+    def __init__(self):
+        # 実行中の同一分析（キャッシュキー + API key）を1つの上流呼び出しにまとめる
+        self._inflight: SingleFlight[Any] = SingleFlight()
+        # 評価軸ごとの上流呼び出しの所要時間（ヘッジするまでの待ち時間に使う）
+        self._latency = LatencyTracker(min_samples=settings.analysis_hedge_min_samples)
+    
+    async def analyze_conversation_partial(
         self,
         text: str,
         target_behavior: Optional[str] = None,
-        api_key: Optional[str] = None
-    ) -> Dict[str, List[Dict[str, Any]]]:
-        """会話テキストを4つの評価軸で分析"""
-        # 4つの分析を並行実行
-        tasks = [
-            self._analyze_axis(text, 'cct', target_behavior, api_key),
-            self._analyze_axis(text, 'sst', target_behavior, api_key),
-            self._analyze_axis(text, 'empathy', target_behavior, api_key),
-            self._analyze_axis(text, 'partnership', target_behavior, api_key)
-        ]
-        
-        cct_result, sst_result, empathy_result, partnership_result = await asyncio.gather(*tasks)
-        
-        return {
-            'cct': cct_result,
-            'sst': sst_result,
-            'empathy': empathy_result,
-            'partnership': partnership_result
+        api_key: Optional[str] = None,
+        use_cache: bool = True,
+        slots: Optional[asyncio.Semaphore] = None,
+        timeout: Optional[float] = None
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Exception], List[str]]:
+        """例外を送出せず (完了した評価軸の結果, 失敗した評価軸の例外, 期限切れの評価軸) を返す
+
+        slotsを渡すと、呼び出し（per_axisでは評価軸ごと、combinedでは1回）をその同時実行数の内側で行う。
+        timeout秒を過ぎても終わらない評価軸はキャンセルして期限切れとする。
+        """
+        async def bounded(call):
+            if slots is None:
+                return await call
+            async with slots:
+                return await call
+        
+        # 期限は各呼び出しのタスクにだけ引き継ぎ、呼び出し元のコンテキストには残さない
+        token = deadline_var.set(time.monotonic() + timeout if timeout is not None else None)
+        try:
+            if settings.analysis_mode == "combined":
+                tasks = {"combined": asyncio.ensure_future(
+                    bounded(self._analyze_combined(text, target_behavior, api_key, use_cache))
+                )}
+            else:
+                tasks = {
+                    aspect: asyncio.ensure_future(
+                        bounded(self._analyze_axis(text, aspect, target_behavior, api_key, use_cache))
+                    )
+                    for aspect in EVALUATION_AXES
+                }
+        finally:
+            deadline_var.reset(token)
+        return await self._collect_axis_tasks(tasks, timeout)
+
+    async def _collect_axis_tasks(
+        self,
+        tasks: Dict[str, "asyncio.Future[Any]"],
+        timeout: Optional[float]
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Exception], List[str]]:
+        """評価軸ごと（combinedは4軸まとめて1つ）のタスクを期限まで待ち、結果・例外・期限切れに分ける"""
+        try:
+            _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+        
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        errors: Dict[str, Exception] = {}
+        timed_out: List[str] = []
+        for key, task in tasks.items():
+            aspects = EVALUATION_AXES if key == "combined" else (key,)
+            # 呼び出し元の期限で待つのをやめた評価軸（TimeoutError）も期限切れとする
+            if task in pending or (not task.cancelled() and isinstance(task.exception(), asyncio.TimeoutError)):
+                timed_out.extend(aspects)
+            elif task.exception() is not None:
+                errors.update({aspect: task.exception() for aspect in aspects})
+            else:
+                result = task.result()
+                results.update(result if key == "combined" else {key: result})
+        if timed_out:
+            logger.warning("analysis timed out after %.1fs for axes %s", timeout, timed_out)
+        return results, errors, timed_out
+
+    async def analyze_incremental(
+        self,
+        text: str,
+        previous_text: str,
+        previous_result: Dict[str, List[Dict[str, Any]]],
+        target_behavior: Optional[str] = None,
+        api_key: Optional[str] = None,
+        use_cache: bool = True,
+        timeout: Optional[float] = None
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Exception], List[str], Dict[str, Any]]:
+        """編集前の分析結果を使い回し、変更されたターンの周辺だけを分析し直す
+
+        変更されたターンとその前後（analysis_incremental_context_turns）を窓として評価軸ごとに分析し、
+        窓の外に残っている発言の評価と合わせて上位3件にまとめる。
+        変更が大きい場合は全体を分析する。
+        analyze_conversation_partialの戻り値に加えて、(mode, 分析し直したターン数, 全ターン数) の情報を返す。
+        """
+        diff = TurnDiff(previous_text, text, settings.analysis_incremental_context_turns)
+        info: Dict[str, Any] = {
+            "mode": "incremental",
+            "reanalyzed_turns": diff.reanalyzed_turns,
+            "total_turns": len(diff.turns),
+        }
+        if diff.unchanged and all(aspect in previous_result for aspect in EVALUATION_AXES):
+            info["mode"] = "unchanged"
+            return {aspect: previous_result[aspect] for aspect in EVALUATION_AXES}, {}, [], info
+        if (
+            not diff.turns
+            or any(aspect not in previous_result for aspect in EVALUATION_AXES)
+            or diff.reanalyzed_turns > len(diff.turns) * settings.analysis_incremental_max_ratio
+        ):
+            info.update(mode="full", reanalyzed_turns=len(diff.turns))
+            results, errors, timed_out = await self.analyze_conversation_partial(
+                text, target_behavior, api_key, use_cache, timeout=timeout
+            )
+            return results, errors, timed_out, info
+        
+        windows = diff.windows()
+        kept = {
+            aspect: [item for item in previous_result[aspect] if diff.is_stable(str(item.get("statement", "")))]
+            for aspect in EVALUATION_AXES
         }
+        
+        async def reanalyze_axis(aspect: EvaluationAxis) -> List[Dict[str, Any]]:
+            window_results = await asyncio.gather(*[
+                self._analyze_axis(window, aspect, target_behavior, api_key, use_cache)
+                for window in windows
+            ])
+            return merge_analysis_results([kept[aspect], *window_results])
+        
+        async def reanalyze_combined() -> Dict[str, List[Dict[str, Any]]]:
+            window_results = await asyncio.gather(*[
+                self._analyze_combined(window, target_behavior, api_key, use_cache)
+                for window in windows
+            ])
+            return {
+                aspect: merge_analysis_results([kept[aspect], *[result[aspect] for result in window_results]])
+                for aspect in EVALUATION_AXES
+            }
+        
+        # 窓の結果は窓のテキストのキーでキャッシュされる。まとめた結果は全体を分析したものと
+        # 同じではないため、対話文全体のキーではキャッシュしない
+        token = deadline_var.set(time.monotonic() + timeout if timeout is not None else None)
+        try:
+            if settings.analysis_mode == "combined":
+                tasks = {"combined": asyncio.ensure_future(reanalyze_combined())}
+            else:
+                tasks = {aspect: asyncio.ensure_future(reanalyze_axis(aspect)) for aspect in EVALUATION_AXES}
+        finally:
+            deadline_var.reset(token)
+        results, errors, timed_out = await self._collect_axis_tasks(tasks, timeout)
+        return results, errors, timed_out, info
+
+    async def analyze_conversation_stream(
+        self,
+        text: str,
+        target_behavior: Optional[str] = None,
+        api_key: Optional[str] = None,
+        use_cache: bool = True,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """評価軸ごとに、完了した順で結果を返す
+
+        評価が1件生成されるたびにstatementイベントを、軸が揃ったらaxisイベントを返す。
+        1つの軸が失敗しても他の軸は続行し、その軸についてerrorイベントを返す。
+        timeout秒を過ぎても終わらない軸は打ち切り、timeoutイベントを返す。
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        
+        def on_statement(aspect: EvaluationAxis, item: Dict[str, Any]) -> None:
+            events.put_nowait({"type": "statement", "aspect": aspect, "statement": item})
+        
+        async def run_combined() -> None:
+            try:
+                result = await self._analyze_combined(text, target_behavior, api_key, use_cache, on_statement)
+            except Exception as e:
+                for aspect in EVALUATION_AXES:
+                    events.put_nowait((aspect, None, e))
+                return
+            for aspect in EVALUATION_AXES:
+                events.put_nowait((aspect, result[aspect], None))
+        
+        async def run_axis(aspect: EvaluationAxis) -> None:
+            events.put_nowait(await self._analyze_axis_safely(
+                text, aspect, target_behavior, api_key, use_cache, on_statement
+            ))
+        
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        token = deadline_var.set(deadline)
+        try:
+            if settings.analysis_mode == "combined":
+                tasks = [asyncio.ensure_future(run_combined())]
+            else:
+                tasks = [asyncio.ensure_future(run_axis(aspect)) for aspect in EVALUATION_AXES]
+        finally:
+            deadline_var.reset(token)
+        completed, failed, timed_out = [], [], []
+        try:
+            while len(completed) + len(failed) + len(timed_out) < len(EVALUATION_AXES):
+                try:
+                    event = await asyncio.wait_for(
+                        events.get(),
+                        None if deadline is None else max(deadline - time.monotonic(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    remaining = [aspect for aspect in EVALUATION_AXES if aspect not in completed + failed + timed_out]
+                    timed_out.extend(remaining)
+                    for aspect in remaining:
+                        yield {"type": "timeout", "aspect": aspect}
+                    break
+                if isinstance(event, dict):
+                    yield event
+                    continue
+                aspect, result, error = event
+                if isinstance(error, asyncio.TimeoutError):
+                    # 期限で待つのをやめた評価軸
+                    timed_out.append(aspect)
+                    yield {"type": "timeout", "aspect": aspect}
+                elif error is None:
+                    completed.append(aspect)
+                    yield {"type": "axis", "aspect": aspect, "result": result}
+                else:
+                    failed.append(aspect)
+                    yield {"type": "error", "aspect": aspect, "detail": f"分析エラー: {str(error)}"}
+            yield {"type": "done", "completed": completed, "failed": failed, "timed_out": timed_out}
+        finally:
+            # 途中で打ち切られた場合は残りの呼び出しをキャンセル
+            for task in tasks:
+                task.cancel()
+
+    async def _analyze_axis_safely(
+        self,
+        text: str,
+        aspect: EvaluationAxis,
+        target_behavior: Optional[str] = None,
+        api_key: Optional[str] = None,
+        use_cache: bool = True,
+        on_statement: Optional[StatementCallback] = None
+    ) -> Tuple[EvaluationAxis, Optional[List[Dict[str, Any]]], Optional[Exception]]:
+        """例外を送出せず (評価軸, 結果, 例外) を返す"""
+        try:
+            result = await self._analyze_axis(text, aspect, target_behavior, api_key, use_cache, on_statement)
+            return aspect, result, None
+        except Exception as e:
+            return aspect, None, e
     
     async def _analyze_axis(
         self,
         text: str,
         aspect: EvaluationAxis,
         target_behavior: Optional[str] = None,
-        api_key: Optional[str] = None
+        api_key: Optional[str] = None,
+        use_cache: bool = True,
+        on_statement: Optional[StatementCallback] = None,
+        split: bool = True
     ) -> List[Dict[str, Any]]:
-        """特定の評価軸で分析"""
-        system, prompt = PromptManager.get_analysis_prompt(text, aspect, target_behavior)
+        """特定の評価軸で分析
+
+        use_cache=Falseの場合はキャッシュを参照せずに分析し、結果でキャッシュを更新する。
+        on_statementを渡すと、窓が1つの場合は応答をストリーミングして評価が揃うたびに呼ぶ。
+        split=Falseの場合は長くても窓に分けない（分割済みの窓を分析するとき）。
+        """
+        cache_key = self.axis_cache_key(text, aspect, target_behavior)
+        if use_cache:
+            cached = await analysis_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        response = await openai_service.create_chat_completion(
-            messages=[
-                {"role": "developer", "content": system},
-                {"role": "user", "content": prompt}],
-            api_key=api_key
+        # 同じ分析が実行中なら相乗りする（ストリーミング中の評価は最初の呼び出し元にだけ届く）
+        return await self._coalesce(
+            self._flight_key(cache_key, api_key),
+            lambda: self._compute_axis(cache_key, text, aspect, target_behavior, api_key, use_cache, on_statement, split)
         )
+
+    async def _coalesce(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """実行中の同じ呼び出しに相乗りし、呼び出し元ごとの期限まで待つ
+
+        共有する呼び出しは最初の呼び出し元の期限を引き継がないよう期限なしで実行し、
+        各呼び出し元の期限はasyncio.wait_forで待つ側に適用する（期限の長い呼び出し元が後から相乗りしても短くならない）。
+        全員が期限切れなどで待つのをやめた時点で、共有する呼び出しもキャンセルされる。
+        """
+        deadline = deadline_var.get()
+        token = deadline_var.set(None)
+        try:
+            waiter = asyncio.ensure_future(self._inflight.do(key, factory))
+        finally:
+            deadline_var.reset(token)
+        if deadline is None:
+            return await waiter
+        return await asyncio.wait_for(waiter, max(deadline - time.monotonic(), 0))
+
+    async def _compute_axis(
+        self,
+        cache_key: str,
+        text: str,
+        aspect: EvaluationAxis,
+        target_behavior: Optional[str],
+        api_key: Optional[str],
+        use_cache: bool,
+        on_statement: Optional[StatementCallback],
+        split: bool
+    ) -> List[Dict[str, Any]]:
+        """キャッシュにない評価軸の分析を実行し、結果をキャッシュ"""
+        # 集約用のタスク内で実行されるため、呼び出し元のコンテキストには影響しない
+        axis_var.set(aspect)
+        windows = self.split_long_transcript(text) if split else [text]
+        if len(windows) > 1:
+            # 長い対話文は窓ごとに並行して分析し、上位3件にまとめる（窓は分け直さない）
+            window_results = await asyncio.gather(*[
+                self._analyze_axis(window, aspect, target_behavior, api_key, use_cache, split=False)
+                for window in windows
+            ])
+            result = merge_analysis_results(window_results)
+            from_primary = all(self._from_primary_model(items) for items in window_results)
+        else:
+            transcript = self.prepare_transcript(text)
+            result, model = await self._request_analysis(
+                self.build_axis_messages(text, aspect, target_behavior),
+                PromptManager.get_analysis_response_format(),
+                lambda response: parse_analysis_response(response, transcript),
+                api_key,
+                on_statement=(lambda _, item: on_statement(aspect, item)) if on_statement else None,
+                transcript=transcript
+            )
+            result = tag_model(result, model)
+            from_primary = model == settings.openai_model
+        # 代わりのモデルの結果はキャッシュせず、回復後に本来のモデルで分析し直す
+        if from_primary:
+            await analysis_cache.set(cache_key, result)
+        return result
+
+    async def _analyze_combined(
+        self,
+        text: str,
+        target_behavior: Optional[str] = None,
+        api_key: Optional[str] = None,
+        use_cache: bool = True,
+        on_statement: Optional[StatementCallback] = None,
+        split: bool = True
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """4つの評価軸を1回の呼び出しでまとめて分析
+
+        一部の評価軸だけ形式が不正だった場合は、その軸だけを個別に分析し直す。
+        split=Falseの場合は長くても窓に分けない（分割済みの窓を分析するとき）。
+        """
+        cache_key = self.combined_cache_key(text, target_behavior)
+        if use_cache:
+            cached = await analysis_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        return parse_analysis_response(response)
+        return await self._coalesce(
+            self._flight_key(cache_key, api_key),
+            lambda: self._compute_combined(cache_key, text, target_behavior, api_key, use_cache, on_statement, split)
+        )
+
+    async def _compute_combined(
+        self,
+        cache_key: str,
+        text: str,
+        target_behavior: Optional[str],
+        api_key: Optional[str],
+        use_cache: bool,
+        on_statement: Optional[StatementCallback],
+        split: bool
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """キャッシュにない4軸まとめての分析を実行し、結果をキャッシュ"""
+        axis_var.set("combined")
+        windows = self.split_long_transcript(text) if split else [text]
+        if len(windows) > 1:
+            window_results = await asyncio.gather(*[
+                self._analyze_combined(window, target_behavior, api_key, use_cache, split=False)
+                for window in windows
+            ])
+            result = {
+                aspect: merge_analysis_results([window_result[aspect] for window_result in window_results])
+                for aspect in EVALUATION_AXES
+            }
+        else:
+            transcript = self.prepare_transcript(text)
+            (result, errors), model = await self._request_analysis(
+                self.build_combined_messages(text, target_behavior),
+                PromptManager.get_analysis_response_format(combined=True),
+                lambda response: parse_combined_analysis_response(response, EVALUATION_AXES, transcript),
+                api_key,
+                on_statement=(
+                    lambda key, item: on_statement(key, item) if key in EVALUATION_AXES else None
+                ) if on_statement else None,
+                transcript=transcript
+            )
+            result = {aspect: tag_model(items, model) for aspect, items in result.items()}
+            if errors:
+                logger.warning("combined analysis returned invalid axes %s, retrying them individually", sorted(errors))
+                retried = await asyncio.gather(*[
+                    self._analyze_axis(text, aspect, target_behavior, api_key, use_cache, split=False)
+                    for aspect in errors
+                ])
+                result = {**result, **dict(zip(errors, retried))}
+            result = {aspect: result[aspect] for aspect in EVALUATION_AXES}
+            if model != settings.openai_model:
+                return result
+        if all(self._from_primary_model(items) for items in result.values()):
+            await analysis_cache.set(cache_key, result)
+        return result
+
+    async def _request_analysis(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, Any]],
+        parse: Callable[[str], Any],
+        api_key: Optional[str] = None,
+        on_statement: Optional[StatementCallback] = None,
+        transcript: Optional[Transcript] = None
+    ) -> Tuple[Any, str]:
+        """分析を呼び出してパースし、形式が不正なら応答を添えて出し直させる
+
+        (パースした結果, 最後の応答を返したモデル) を返す。
+        analysis_repair_attempts回出し直しても読み込めない場合はAnalysisParseErrorを送出する。
+        transcriptはストリーミング中の評価に発言内容を補うために使う。
+        """
+        if on_statement is not None:
+            response, model = await self._stream_analysis(messages, response_format, api_key, on_statement, transcript)
+        else:
+            response, model = await self._complete_with_hedge(messages, response_format, api_key)
+        attempt = 0
+        while True:
+            try:
+                return parse(response), model
+            except AnalysisParseError as e:
+                ANALYSIS_PARSE_FAILURES.labels(**metric_labels()).inc()
+                add_request_stats(parse_failures=1)
+                if attempt >= settings.analysis_repair_attempts:
+                    raise
+                attempt += 1
+                logger.warning("analysis response is malformed (%s), asking for a repair", e)
+                messages = messages + [
+                    {"role": "assistant", "content": response},
+                    {"role": "user", "content": PromptManager.get_repair_prompt(str(e))}]
+                response, model = await self._complete_with_hedge(messages, response_format, api_key)
+
+    async def _complete_with_hedge(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, Any]],
+        api_key: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """分析を呼び出し、評価軸ごとの直近のp95を過ぎても終わらなければ同じ呼び出しをもう1つ送る
+
+        (応答, 実際に呼び出したモデル) を返す。
+        """
+        axis = axis_var.get()
+        start = time.monotonic()
+        (response, model), winner = await hedged_call(
+            lambda: openai_service.create_chat_completion_with_model(
+                messages=messages,
+                api_key=api_key,
+                response_format=response_format
+            ),
+            self._hedge_delay(axis)
+        )
+        # 代わりのモデルの所要時間は本来のモデルのヘッジの判断に混ぜない
+        if model == settings.openai_model:
+            self._latency.record(axis, time.monotonic() - start)
+        if winner is not None:
+            ANALYSIS_HEDGES.labels(**metric_labels(), winner=winner).inc()
+        return response, model
+
+    def _hedge_delay(self, axis: str) -> Optional[float]:
+        """ヘッジを送るまでの秒数（ヘッジしない場合はNone）"""
+        if not settings.analysis_hedge_enabled:
+            return None
+        observed = self._latency.quantile(axis, settings.analysis_hedge_quantile)
+        if observed is None:
+            return None
+        delay = max(observed, settings.analysis_hedge_min_delay)
+        deadline = deadline_var.get()
+        # 期限までにヘッジが間に合わないなら送らない
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    async def _stream_analysis(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, Any]],
+        api_key: Optional[str],
+        on_statement: StatementCallback,
+        transcript: Optional[Transcript] = None
+    ) -> Tuple[str, str]:
+        """分析をストリーミングで呼び出し、評価のオブジェクトが閉じるたびにon_statementを呼ぶ
+
+        (応答全体, 実際に呼び出したモデル) を返す。
+        """
+        parser = IncrementalStatementParser()
+        chunks: List[str] = []
+        model = settings.openai_model
+        async for event in openai_service.stream_chat_completion(
+            messages,
+            api_key=api_key,
+            response_format=response_format
+        ):
+            if "model" in event:
+                model = event["model"]
+                continue
+            delta = event.get("delta")
+            if not delta:
+                continue
+            chunks.append(delta)
+            for key, item in parser.feed(delta):
+                try:
+                    validated = validate_statements([item], transcript)[0]
+                except AnalysisParseError:
+                    # 不正な要素は最後にまとめてパースするときに扱う
+                    continue
+                on_statement(key, {**validated, "model": model})
+        return "".join(chunks), model
+
+
+    @staticmethod
+    def _from_primary_model(items: List[Dict[str, Any]]) -> bool:
+        """代わりのモデル（サーキットが開いていたとき）の評価を含まないか"""
+        return all(item.get("model", settings.openai_model) == settings.openai_model for item in items)
+
+    @staticmethod
+    def _flight_key(cache_key: str, api_key: Optional[str]) -> str:
+        # 失敗（キーの枠切れなど）を別のAPI keyの呼び出し元に波及させない
+        return f"{hash_api_key(api_key)}:{cache_key}"
+
+    def inflight_stats(self) -> Dict[str, Any]:
+        """実行中の分析の集約の統計"""
+        return self._inflight.stats()
+
+    @staticmethod
+    def build_axis_messages(
+        text: str,
+        aspect: EvaluationAxis,
+        target_behavior: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """1つの評価軸を分析する呼び出しのメッセージ"""
+        system, prompt = PromptManager.get_analysis_prompt(
+            AnalysisService.render_transcript(text),
+            aspect,
+            target_behavior
+        )
+        return [
+            {"role": "developer", "content": system},
+            {"role": "user", "content": prompt}]
+
+    @staticmethod
+    def build_combined_messages(text: str, target_behavior: Optional[str] = None) -> List[Dict[str, str]]:
+        """4つの評価軸をまとめて分析する呼び出しのメッセージ"""
+        system, prompt = PromptManager.get_combined_analysis_prompt(
+            AnalysisService.render_transcript(text),
+            target_behavior
+        )
+        return [
+            {"role": "developer", "content": system},
+            {"role": "user", "content": prompt}]
+
+    @staticmethod
+    def prepare_transcript(text: str) -> Optional[Transcript]:
+        """発言番号で返させる場合の前処理済みの対話文（analysis_statement_idsが無効ならNone）"""
+        if not settings.analysis_statement_ids:
+            return None
+        return preprocess_transcript(text)
+
+    @staticmethod
+    def render_transcript(text: str) -> str:
+        """プロンプトに埋め込む対話文（発言番号で返させる場合は番号付きの圧縮形式）
+
+        詳細チャットも同じ表記を使い、分析とプロンプトキャッシュの先頭部分をそろえる。
+        """
+        transcript = AnalysisService.prepare_transcript(text)
+        return transcript.compact() if transcript else text
+
+    @staticmethod
+    def axis_cache_key(text: str, aspect: EvaluationAxis, target_behavior: Optional[str] = None) -> str:
+        """評価軸ごとの分析結果のキャッシュキー"""
+        return make_cache_key(
+            text,
+            target_behavior,
+            aspect,
+            settings.openai_model,
+            PromptManager.get_prompt_version(aspect)
+        )
+
+    @staticmethod
+    def combined_cache_key(text: str, target_behavior: Optional[str] = None) -> str:
+        """4軸まとめての分析結果のキャッシュキー"""
+        return make_cache_key(
+            text,
+            target_behavior,
+            "combined",
+            settings.openai_model,
+            PromptManager.get_prompt_version("combined")
+        )
+
+    @staticmethod
+    def split_long_transcript(text: str) -> List[str]:
+        """長い対話文を話者ターン単位の窓に分割（短ければそのまま1つ）"""
+        if count_tokens(text) <= settings.analysis_long_transcript_tokens:
+            return [text]
+        return segment_transcript(
+            text,
+            max_tokens=settings.analysis_window_tokens,
+            overlap_tokens=settings.analysis_window_overlap_tokens
+        )
 
 
 # グローバルインスタンス
@@ -0,0 +1,267 @@
+"""
+分析結果のスコア集計サービス
+"""
+import json
+import math
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+import numpy as np
+from pydantic import ValidationError
+from config.settings import settings
+from models.requests import AnalyticsItem
+from models.types import EVALUATION_AXES
+
+ICONS = ("good", "warning", "bad")
+SCORES = (1, 2, 3, 4, 5)
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class AnalyticsInputError(Exception):
+    """集計の入力が不正"""
+    pass
+
+
+class AnalyticsTooLargeError(AnalyticsInputError):
+    """集計する分析結果の件数が上限を超えた"""
+    pass
+
+
+class ScoreColumns:
+    """分析結果を評価1件ごとの列（スコア・評価軸・アイコン・分析結果の番号）に展開して貯める
+
+    分析結果ごとのオブジェクトを保持しないので、NDJSONを読みながら少しずつ追加できる。
+    """
+
+    def __init__(self):
+        self.scores: List[int] = []
+        self.axes: List[int] = []
+        self.icons: List[int] = []
+        self.sessions: List[int] = []
+        # 分析結果ごとの列
+        self.created_at: List[float] = []
+        self.groups: List[Optional[str]] = []
+        # 読み飛ばした評価（エラーの項目・範囲外のスコアなど）の件数
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self.created_at)
+
+    def add(self, item: AnalyticsItem) -> None:
+        if len(self) >= settings.analytics_max_sessions:
+            raise AnalyticsTooLargeError(f"一度に集計できるのは{settings.analytics_max_sessions}件までです")
+        session = len(self)
+        for axis_index, aspect in enumerate(EVALUATION_AXES):
+            for statement in getattr(item, aspect) or []:
+                score = statement.get("score") if isinstance(statement, dict) else None
+                icon = statement.get("icon") if isinstance(statement, dict) else None
+                # boolはintのサブクラスなので除く
+                if isinstance(score, bool) or not isinstance(score, (int, float)) or score not in SCORES or icon not in ICONS:
+                    self.skipped += 1
+                    continue
+                self.scores.append(int(score))
+                self.axes.append(axis_index)
+                self.icons.append(ICONS.index(icon))
+                self.sessions.append(session)
+        self.created_at.append(utc_timestamp(item.created_at) if item.created_at else math.nan)
+        self.groups.append(item.group)
+
+
+def utc_timestamp(value: datetime) -> float:
+    """UNIX時刻に変換（タイムゾーンのない日時はサーバーのローカル時刻ではなくUTCとみなす）"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class AnalyticsService:
+    """蓄積した分析結果のスコアを、NumPyの配列演算でまとめて集計する"""
+
+    def collect(self, items: List[AnalyticsItem]) -> ScoreColumns:
+        """JSONで受け取った分析結果を列に展開"""
+        columns = ScoreColumns()
+        for item in items:
+            columns.add(item)
+        return columns
+
+    async def read_ndjson(self, chunks: AsyncIterator[bytes]) -> ScoreColumns:
+        """NDJSON（1行に1件の分析結果）を読みながら列に展開"""
+        columns = ScoreColumns()
+        buffer = b""
+        line_number = 0
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                self._add_line(columns, line, line_number)
+        self._add_line(columns, buffer, line_number + 1)
+        return columns
+
+    @staticmethod
+    def _add_line(columns: ScoreColumns, line: bytes, line_number: int) -> None:
+        if not line.strip():
+            return
+        try:
+            item = AnalyticsItem.model_validate_json(line)
+        except ValidationError as e:
+            errors = json.dumps(e.errors(include_url=False, include_context=False), ensure_ascii=False, default=str)
+            raise AnalyticsInputError(f"{line_number}行目を読み込めません: {errors}")
+        columns.add(item)
+
+    def summarize(self, columns: ScoreColumns, rolling_window: int) -> Dict[str, Any]:
+        """全体とgroupごとの集計"""
+        scores = np.asarray(columns.scores, dtype=np.float64)
+        axes = np.asarray(columns.axes, dtype=np.int64)
+        icons = np.asarray(columns.icons, dtype=np.int64)
+        sessions = np.asarray(columns.sessions, dtype=np.int64)
+        created_at = np.asarray(columns.created_at, dtype=np.float64)
+
+        # 分析結果を時系列に並べ替え、評価の分析結果の番号も並べ替えた後の順位に付け替える
+        # （日時のないものはNaNとして最後に入力順で並ぶ）
+        order = np.argsort(created_at, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        sessions = rank[sessions]
+        created_at = created_at[order]
+
+        summary = self._summarize(scores, axes, icons, sessions, created_at, rolling_window)
+
+        groups: Dict[str, Any] = {}
+        labels = [columns.groups[index] for index in order]
+        if any(label is not None for label in labels):
+            names, session_groups = np.unique(np.array([label or "" for label in labels]), return_inverse=True)
+            statement_groups = session_groups[sessions]
+            # groupごとに連続するよう並べ替え、区切りの位置で切り出す（groupの数だけ全体を走査しない）
+            statement_order = np.argsort(statement_groups, kind="stable")
+            statement_bounds = np.searchsorted(statement_groups[statement_order], np.arange(len(names) + 1))
+            session_order = np.argsort(session_groups, kind="stable")
+            session_bounds = np.searchsorted(session_groups[session_order], np.arange(len(names) + 1))
+            for group_index, name in enumerate(names):
+                if not name:
+                    continue
+                selected = statement_order[statement_bounds[group_index]:statement_bounds[group_index + 1]]
+                group_sessions = session_order[session_bounds[group_index]:session_bounds[group_index + 1]]
+                # groupの中での時系列の順位（group_sessionsは昇順なので二分探索で引ける）
+                local_sessions = np.searchsorted(group_sessions, sessions[selected])
+                groups[str(name)] = self._summarize(
+                    scores[selected], axes[selected], icons[selected], local_sessions,
+                    created_at[group_sessions], rolling_window
+                )
+        return {**summary, "rolling_window": rolling_window, "skipped": columns.skipped, "groups": groups}
+
+    def _summarize(
+        self,
+        scores: np.ndarray,
+        axes: np.ndarray,
+        icons: np.ndarray,
+        sessions: np.ndarray,
+        created_at: np.ndarray,
+        rolling_window: int
+    ) -> Dict[str, Any]:
+        """評価の列（sessionsは時系列の順位）から1つの集計を作る"""
+        axis_count = len(EVALUATION_AXES)
+        session_count = len(created_at)
+
+        counts = np.bincount(axes, minlength=axis_count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.bincount(axes, weights=scores, minlength=axis_count) / counts
+            variances = np.bincount(axes, weights=scores ** 2, minlength=axis_count) / counts - means ** 2
+        stds = np.sqrt(np.maximum(variances, 0.0))
+        icon_counts = np.bincount(axes * len(ICONS) + icons, minlength=axis_count * len(ICONS)).reshape(axis_count, len(ICONS))
+
+        # 評価軸ごとにスコアが連続するよう並べ替えてからパーセンタイルを取る
+        sorted_scores = scores[np.lexsort((scores, axes))]
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+
+        # 分析結果 × 評価軸のスコアの合計と件数
+        cells = sessions * axis_count + axes
+        session_sums = np.bincount(cells, weights=scores, minlength=session_count * axis_count).reshape(session_count, axis_count)
+        session_counts = np.bincount(cells, minlength=session_count * axis_count).reshape(session_count, axis_count)
+        evaluated = session_counts > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            session_means = session_sums / session_counts
+
+        # 分析結果ごとに平均スコアが最も低かった評価軸
+        rated = evaluated.any(axis=1)
+        weakest = np.argmin(np.where(evaluated, session_means, np.inf)[rated], axis=1)
+        weakest_counts = np.bincount(weakest, minlength=axis_count)
+
+        axis_summaries = {}
+        for axis_index, aspect in enumerate(EVALUATION_AXES):
+            axis_scores = sorted_scores[bounds[axis_index]:bounds[axis_index + 1]]
+            axis_summaries[aspect] = {
+                "statements": int(counts[axis_index]),
+                "sessions": int(evaluated[:, axis_index].sum()),
+                "mean": self._round(means[axis_index]),
+                "std": self._round(stds[axis_index]),
+                "percentiles": (
+                    {
+                        f"p{q}": round(float(value), 3)
+                        for q, value in zip(PERCENTILES, np.percentile(axis_scores, PERCENTILES))
+                    }
+                    if len(axis_scores) else {}
+                ),
+                "icons": dict(zip(ICONS, icon_counts[axis_index].tolist())),
+            }
+
+        overall = np.where(counts > 0, means, np.inf)
+        return {
+            "sessions": session_count,
+            "statements": int(len(scores)),
+            "axes": axis_summaries,
+            "weakest_axis": EVALUATION_AXES[int(np.argmin(overall))] if counts.any() else None,
+            "weakest_axis_counts": dict(zip(EVALUATION_AXES, weakest_counts.tolist())),
+            "trend": self._trend(session_sums, session_counts, session_means, evaluated, created_at, rolling_window),
+        }
+
+    def _trend(
+        self,
+        session_sums: np.ndarray,
+        session_counts: np.ndarray,
+        session_means: np.ndarray,
+        evaluated: np.ndarray,
+        created_at: np.ndarray,
+        rolling_window: int
+    ) -> Dict[str, Any]:
+        """直近rolling_window件の移動平均と、分析結果1件あたりの変化（回帰直線の傾き）"""
+        session_count = len(created_at)
+        # 累積和の差で、各時点までの直近rolling_window件の合計と件数を求める
+        cumulative_sums = np.vstack((np.zeros((1, session_sums.shape[1])), np.cumsum(session_sums, axis=0)))
+        cumulative_counts = np.vstack((np.zeros((1, session_counts.shape[1])), np.cumsum(session_counts, axis=0)))
+        ends = np.arange(1, session_count + 1)
+        starts = np.maximum(ends - rolling_window, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rolling = (cumulative_sums[ends] - cumulative_sums[starts]) / (cumulative_counts[ends] - cumulative_counts[starts])
+
+        # 評価のある分析結果だけで最小二乗の傾きを求める
+        positions = np.arange(session_count, dtype=np.float64)[:, None]
+        points = evaluated.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_position = np.where(evaluated, positions, 0.0).sum(axis=0) / points
+            mean_score = np.where(evaluated, session_means, 0.0).sum(axis=0) / points
+            deviation = np.where(evaluated, positions - mean_position, 0.0)
+            covariance = (deviation * np.where(evaluated, session_means - mean_score, 0.0)).sum(axis=0)
+            slopes = covariance / (deviation ** 2).sum(axis=0)
+
+        return {
+            "created_at": [None if math.isnan(value) else value for value in created_at.tolist()],
+            "rolling_mean": {
+                aspect: [self._round(value) for value in rolling[:, axis_index]]
+                for axis_index, aspect in enumerate(EVALUATION_AXES)
+            },
+            "slope": {
+                aspect: self._round(slopes[axis_index], 4) if points[axis_index] >= 2 else None
+                for axis_index, aspect in enumerate(EVALUATION_AXES)
+            },
+        }
+
+    @staticmethod
+    def _round(value: float, digits: int = 3) -> Optional[float]:
+        """NaN（評価がない）をNoneにして丸める"""
+        value = float(value)
+        # -0.0 は 0.0 にそろえる
+        return None if math.isnan(value) or math.isinf(value) else round(value, digits) + 0.0
+
+
+# グローバルインスタンス
+analytics_service = AnalyticsService()
@@ -0,0 +1,400 @@
+"""
+一括分析サービス
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from config.settings import settings
+from core.prompt_manager import PromptManager
+from core.sqlite import connect_sqlite
+from core.utils import (
+    AnalysisParseError,
+    merge_analysis_results,
+    parse_analysis_response,
+    parse_combined_analysis_response,
+    tag_model,
+)
+from models.requests import BatchAnalysisItem
+from models.types import EVALUATION_AXES
+from .analysis_cache import analysis_cache, normalize_text
+from .analysis_service import analysis_service
+from .openai_client_pool import openai_client_pool
+
+logger = logging.getLogger(__name__)
+
+# プロバイダー側のバッチがこれ以上進まない状態
+TERMINAL_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchInput:
+    """重複を除いた一括分析の入力（同じ入力の項目IDをまとめる）"""
+
+    def __init__(self, text: str, target_behavior: Optional[str], ids: Optional[List[str]] = None):
+        self.text = text
+        self.target_behavior = target_behavior
+        self.ids = ids or []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"text": self.text, "target_behavior": self.target_behavior, "ids": self.ids}
+
+
+def deduplicate_items(items: List[BatchAnalysisItem]) -> List[BatchInput]:
+    """対話文（正規化後）と目標行動が同じ項目を1つの入力にまとめる"""
+    inputs: Dict[str, BatchInput] = {}
+    for item in items:
+        payload = json.dumps(
+            [normalize_text(item.text), (item.target_behavior or "").strip()],
+            ensure_ascii=False,
+        )
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        if key not in inputs:
+            inputs[key] = BatchInput(item.text, item.target_behavior)
+        inputs[key].ids.append(item.id)
+    return list(inputs.values())
+
+
+class ProviderBatchStore:
+    """プロバイダーのBatch APIへ投入した内容と取り込んだ結果を保存するSQLiteストア"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with connect_sqlite(self.path, row_factory=True) as conn:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS provider_batches ("
+                    "id TEXT PRIMARY KEY, manifest TEXT NOT NULL, status TEXT NOT NULL, "
+                    "result TEXT, created_at REAL NOT NULL)"
+                )
+                self._initialized = True
+            yield conn
+
+    def insert(self, batch_id: str, manifest: Dict[str, Any], status: str, created_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO provider_batches (id, manifest, status, created_at) VALUES (?, ?, ?, ?)",
+                (batch_id, json.dumps(manifest, ensure_ascii=False), status, created_at),
+            )
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM provider_batches WHERE id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "manifest": json.loads(row["manifest"]),
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "created_at": row["created_at"],
+        }
+
+    def update(self, batch_id: str, status: str, result: Optional[Dict[str, Any]] = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE provider_batches SET status = ?, result = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, batch_id),
+            )
+
+
+class BatchAnalysisService:
+    """クラス全員分の対話文などをまとめて分析するサービス
+
+    即時実行では同じ入力を1回だけ分析し、すべての一括分析で共有する同時実行数
+    （batch_concurrency）の内側で評価軸ごとの呼び出しを行う。
+    プロバイダー実行ではBatch APIにまとめて投入し、完了後に結果を取り込む。
+    """
+
+    def __init__(self):
+        self._slots = asyncio.Semaphore(settings.batch_concurrency)
+        self.store = ProviderBatchStore(settings.batch_provider_db_path)
+
+    async def stream(
+        self,
+        items: List[BatchAnalysisItem],
+        api_key: Optional[str] = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """項目ごとに、分析が完了した順で結果を返す"""
+        inputs = deduplicate_items(items)
+        tasks = [asyncio.ensure_future(self._analyze_input(batch_input, api_key, use_cache)) for batch_input in inputs]
+        failed: List[str] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                batch_input, results, errors = await next_done
+                for item_id in batch_input.ids:
+                    if errors:
+                        failed.append(item_id)
+                    yield {"type": "item", "id": item_id, "result": results, "errors": errors}
+            yield {"type": "done", "items": len(items), "unique_items": len(inputs), "failed": failed}
+        finally:
+            # 途中で打ち切られた場合は残りの呼び出しをキャンセル
+            for task in tasks:
+                task.cancel()
+
+    async def _analyze_input(
+        self,
+        batch_input: BatchInput,
+        api_key: Optional[str],
+        use_cache: bool
+    ) -> Tuple[BatchInput, Dict[str, List[Dict[str, Any]]], Dict[str, str]]:
+        results, errors, _ = await analysis_service.analyze_conversation_partial(
+            batch_input.text,
+            batch_input.target_behavior,
+            api_key,
+            use_cache=use_cache,
+            slots=self._slots
+        )
+        return batch_input, results, {aspect: f"分析エラー: {str(error)}" for aspect, error in errors.items()}
+
+    async def submit_provider_batch(
+        self,
+        items: List[BatchAnalysisItem],
+        api_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """評価軸ごと（analysis_mode=combinedでは4軸まとめて1回、長い対話文は窓ごと）の呼び出しをBatch APIに投入"""
+        inputs = deduplicate_items(items)
+        mode = settings.analysis_mode
+        response_format = PromptManager.get_analysis_response_format(combined=mode == "combined")
+        lines = []
+        manifest_inputs = []
+        for index, batch_input in enumerate(inputs):
+            windows = analysis_service.split_long_transcript(batch_input.text)
+            manifest_inputs.append({**batch_input.to_dict(), "windows": windows})
+            for window_index, window in enumerate(windows):
+                if mode == "combined":
+                    calls = [("combined", analysis_service.build_combined_messages(window, batch_input.target_behavior))]
+                else:
+                    calls = [
+                        (aspect, analysis_service.build_axis_messages(window, aspect, batch_input.target_behavior))
+                        for aspect in EVALUATION_AXES
+                    ]
+                for key, messages in calls:
+                    body: Dict[str, Any] = {"model": settings.openai_model, "messages": messages}
+                    if response_format:
+                        body["response_format"] = response_format
+                    lines.append(json.dumps({
+                        "custom_id": f"{index}:{key}:{window_index}",
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": body,
+                    }, ensure_ascii=False))
+
+        client = openai_client_pool.get(api_key)
+        input_file = await client.files.create(
+            file=("analysis_batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=settings.batch_provider_completion_window,
+        )
+        manifest = {"items": len(items), "model": settings.openai_model, "mode": mode, "inputs": manifest_inputs}
+        created_at = time.time()
+        await asyncio.to_thread(self.store.insert, batch.id, manifest, batch.status, created_at)
+        logger.info("submitted provider batch %s with %d requests", batch.id, len(lines))
+        return self._to_response(batch.id, manifest, batch.status, created_at)
+
+    async def get_provider_batch(self, batch_id: str, api_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """バッチの状態を取得し、終了していれば結果を取り込む"""
+        record = await asyncio.to_thread(self.store.get, batch_id)
+        if record is None:
+            return None
+        if record["result"] is not None:
+            return self._to_response(batch_id, record["manifest"], record["status"], record["created_at"], record["result"])
+
+        client = openai_client_pool.get(api_key)
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status not in TERMINAL_BATCH_STATUSES:
+            return self._to_response(batch_id, record["manifest"], batch.status, record["created_at"])
+
+        outputs: Dict[str, Any] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await client.files.content(file_id)
+                for line in content.text.splitlines():
+                    if not line.strip():
+                        continue
+                    # 読めない行があっても他の行は取り込む（その行の呼び出しは結果なしとしてエラーになる）
+                    try:
+                        entry = json.loads(line)
+                        outputs[entry["custom_id"]] = entry
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.warning("skipping unreadable line in provider batch %s: %s", batch_id, e)
+        result = await self._collect_outputs(record["manifest"], outputs)
+        await asyncio.to_thread(self.store.update, batch_id, batch.status, result)
+        return self._to_response(batch_id, record["manifest"], batch.status, record["created_at"], result)
+
+    async def _collect_outputs(self, manifest: Dict[str, Any], outputs: Dict[str, Any]) -> Dict[str, Any]:
+        """出力ファイルの各行を項目ID・評価軸ごとの結果にまとめ、分析キャッシュにも保存"""
+        results: Dict[str, Dict[str, Any]] = {}
+        errors: Dict[str, Dict[str, str]] = {}
+        model = manifest.get("model", settings.openai_model)
+        combined = manifest.get("mode") == "combined"
+        # 投入後に設定のモデルが変わっていれば、キャッシュには入れない
+        cacheable = model == settings.openai_model
+        for index, batch_input in enumerate(manifest["inputs"]):
+            windows = batch_input["windows"]
+            if combined:
+                window_results, input_errors = self._parse_combined_outputs(index, windows, outputs, model)
+            else:
+                window_results, input_errors = self._parse_axis_outputs(index, windows, outputs, model)
+            input_results = {
+                aspect: merge_analysis_results(items) if len(items) > 1 else items[0]
+                for aspect, items in window_results.items()
+            }
+            if cacheable:
+                await self._cache_results(batch_input, window_results, input_results, input_errors, combined)
+            for item_id in batch_input["ids"]:
+                results[item_id] = input_results
+                if input_errors:
+                    errors[item_id] = input_errors
+        return {"results": results, "errors": errors}
+
+    def _parse_axis_outputs(
+        self,
+        index: int,
+        windows: List[str],
+        outputs: Dict[str, Any],
+        model: str
+    ) -> Tuple[Dict[str, List[List[Dict[str, Any]]]], Dict[str, str]]:
+        """評価軸ごとの呼び出しの出力を (評価軸 → 窓ごとの結果, 評価軸 → エラー) にまとめる"""
+        results: Dict[str, List[List[Dict[str, Any]]]] = {}
+        errors: Dict[str, str] = {}
+        for aspect in EVALUATION_AXES:
+            try:
+                results[aspect] = [
+                    tag_model(self._parse_output(outputs.get(f"{index}:{aspect}:{window_index}"), window), model)
+                    for window_index, window in enumerate(windows)
+                ]
+            except AnalysisParseError as e:
+                errors[aspect] = f"分析エラー: {str(e)}"
+        return results, errors
+
+    def _parse_combined_outputs(
+        self,
+        index: int,
+        windows: List[str],
+        outputs: Dict[str, Any],
+        model: str
+    ) -> Tuple[Dict[str, List[List[Dict[str, Any]]]], Dict[str, str]]:
+        """4軸まとめての呼び出しの出力を (評価軸 → 窓ごとの結果, 評価軸 → エラー) にまとめる
+
+        即時実行と違い形式が不正だった評価軸を個別に分析し直せないため、その評価軸はエラーにする。
+        """
+        window_results: List[Dict[str, List[Dict[str, Any]]]] = []
+        errors: Dict[str, str] = {}
+        for window_index, window in enumerate(windows):
+            try:
+                parsed, axis_errors = parse_combined_analysis_response(
+                    self._output_content(outputs.get(f"{index}:combined:{window_index}")),
+                    EVALUATION_AXES,
+                    analysis_service.prepare_transcript(window)
+                )
+            except AnalysisParseError as e:
+                parsed, axis_errors = {}, {aspect: str(e) for aspect in EVALUATION_AXES}
+            for aspect, error in axis_errors.items():
+                errors.setdefault(aspect, f"分析エラー: {error}")
+            window_results.append({aspect: tag_model(items, model) for aspect, items in parsed.items()})
+        results = {
+            aspect: [window_result[aspect] for window_result in window_results]
+            for aspect in EVALUATION_AXES
+            if aspect not in errors
+        }
+        return results, errors
+
+    async def _cache_results(
+        self,
+        batch_input: Dict[str, Any],
+        window_results: Dict[str, List[List[Dict[str, Any]]]],
+        input_results: Dict[str, List[Dict[str, Any]]],
+        input_errors: Dict[str, str],
+        combined: bool
+    ) -> None:
+        """即時実行と同じキーで、窓ごとと対話文全体の結果を分析キャッシュに保存"""
+        windows = batch_input["windows"]
+        target_behavior = batch_input["target_behavior"]
+        if combined:
+            # 4軸まとめての結果は、すべての評価軸が揃った場合だけ保存する
+            if input_errors:
+                return
+            for window_index, window in enumerate(windows):
+                await analysis_cache.set(
+                    analysis_service.combined_cache_key(window, target_behavior),
+                    {aspect: window_results[aspect][window_index] for aspect in EVALUATION_AXES}
+                )
+            if len(windows) > 1:
+                await analysis_cache.set(
+                    analysis_service.combined_cache_key(batch_input["text"], target_behavior),
+                    input_results
+                )
+            return
+        for aspect, items in window_results.items():
+            for window, window_result in zip(windows, items):
+                await analysis_cache.set(
+                    analysis_service.axis_cache_key(window, aspect, target_behavior),
+                    window_result
+                )
+            if len(windows) > 1:
+                await analysis_cache.set(
+                    analysis_service.axis_cache_key(batch_input["text"], aspect, target_behavior),
+                    input_results[aspect]
+                )
+
+    @staticmethod
+    def _parse_output(entry: Optional[Dict[str, Any]], window: str) -> List[Dict[str, Any]]:
+        """出力ファイルの1行を分析結果にパース（失敗した呼び出しはAnalysisParseError）
+
+        発言番号で返された評価は、その呼び出しで送った窓の対話文から発言内容を補う。
+        """
+        return parse_analysis_response(
+            BatchAnalysisService._output_content(entry),
+            analysis_service.prepare_transcript(window)
+        )
+
+    @staticmethod
+    def _output_content(entry: Optional[Dict[str, Any]]) -> str:
+        """出力ファイルの1行から応答本文を取り出す（失敗した呼び出し・想定外の形はAnalysisParseError）"""
+        if entry is None:
+            raise AnalysisParseError("バッチの結果が返されませんでした")
+        try:
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code") != 200:
+                raise AnalysisParseError(
+                    f"バッチの呼び出しが失敗しました: {entry.get('error') or response.get('body')}"
+                )
+            return response["body"]["choices"][0]["message"]["content"] or ""
+        except (AttributeError, KeyError, IndexError, TypeError) as e:
+            raise AnalysisParseError(f"バッチの結果の形式が不正です: {e!r}") from e
+
+    @staticmethod
+    def _to_response(
+        batch_id: str,
+        manifest: Dict[str, Any],
+        status: str,
+        created_at: float,
+        result: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        return {
+            "batch_id": batch_id,
+            "status": status,
+            "items": manifest["items"],
+            "unique_items": len(manifest["inputs"]),
+            "created_at": created_at,
+            "results": result["results"] if result else None,
+            "errors": result["errors"] if result else None,
+        }
+
+
+# グローバルインスタンス
+batch_service = BatchAnalysisService()
@@ -1,24 +1,125 @@
 """
 チャットサービス
 """
+import hashlib
 import json
-from typing import List, Dict
-from models.requests import DetailedChatRequest
+import time
+from contextlib import aclosing
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from models.requests import DetailedChatRequest, SessionChatRequest
+from models.types import EvaluationAxis
+from config.settings import settings
 from core.prompt_manager import PromptManager
+from core.reference_index import reference_index
+from core.request_context import axis_var
+from core.tokenizer import count_tokens
+from core.ttl_cache import TTLCache
+from .analysis_service import AnalysisService
 from .openai_service import openai_service
+from .session_store import AnalysisSession, session_store
 
 
 class ChatService:
     """チャット機能サービス"""
     
+    def __init__(self):
+        # (会話, 要約済みの履歴) ごとの要約のメモ
+        self._summaries: TTLCache[str] = TTLCache(max_size=settings.chat_summary_cache_size)
+    
     async def detailed_chat(self, request: DetailedChatRequest, api_key: str = None) -> str:
         """詳細分析チャット"""
-        system,prompt = PromptManager.get_detailed_chat_prompt(
-            text=request.conversation_text,
-            aspect=request.aspect, 
-            use_reference=request.use_reference,
+        messages = await self._build_request_messages(request, api_key)
+        
+        return await openai_service.create_chat_completion(
+            messages=messages,
+            api_key=api_key
         )
+
+    async def stream_detailed_chat(
+        self,
+        request: DetailedChatRequest,
+        api_key: str = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """詳細分析チャット（ストリーミング）
+
+        (イベント名, データ) を順に返す。
+        token: 生成されたテキスト片 / first_token: 最初のトークンまでの時間 / done: 使用量の合計
+        """
+        messages = await self._build_request_messages(request, api_key)
+        async with aclosing(self._stream_messages(messages, api_key)) as events:
+            async for event in events:
+                yield event
+
+    async def session_chat(
+        self,
+        session: AnalysisSession,
+        request: SessionChatRequest,
+        api_key: str = None
+    ) -> str:
+        """セッションに保持した会話・分析結果を使う詳細チャット（履歴もセッションに残す）"""
+        messages = await self._build_session_messages(session, request, api_key)
         
+        answer = await openai_service.create_chat_completion(
+            messages=messages,
+            api_key=api_key
+        )
+        await session_store.append_chat(session, request.statement_id, request.question, answer)
+        return answer
+
+    async def stream_session_chat(
+        self,
+        session: AnalysisSession,
+        request: SessionChatRequest,
+        api_key: str = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """セッションを使う詳細チャット（ストリーミング）
+
+        最後まで生成できた回答だけをセッションの履歴に残す。
+        """
+        messages = await self._build_session_messages(session, request, api_key)
+        chunks: List[str] = []
+        async with aclosing(self._stream_messages(messages, api_key)) as events:
+            async for event, data in events:
+                if event == "token":
+                    chunks.append(data["content"])
+                elif event == "done":
+                    await session_store.append_chat(session, request.statement_id, request.question, "".join(chunks))
+                yield event, data
+
+    async def _stream_messages(
+        self,
+        messages: List[Dict[str, str]],
+        api_key: str = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """メッセージ列の補完をストリーミングし、イベントに変換"""
+        started = time.perf_counter()
+        first_token_ms = None
+        usage = None
+        model = None
+        
+        # 途中で閉じられた場合に上流のストリームも確実に閉じる
+        async with aclosing(openai_service.stream_chat_completion(messages=messages, api_key=api_key)) as stream:
+            async for event in stream:
+                if "model" in event:
+                    model = event["model"]
+                    continue
+                if "usage" in event:
+                    usage = event["usage"]
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000)
+                    yield "first_token", {"latency_ms": first_token_ms}
+                yield "token", {"content": event["delta"]}
+        
+        yield "done", {
+            "usage": usage,
+            "model": model,
+            "first_token_ms": first_token_ms,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000),
+        }
+
+    async def _build_request_messages(self, request: DetailedChatRequest, api_key: str = None) -> List[Dict[str, str]]:
+        """リクエストに含まれる会話・分析結果からメッセージ列を組み立てる"""
         # 分析結果から該当する発言の評価を取得
         # statement_contentを使って正しい評価を見つける
         statement_evaluation = None
@@ -41,8 +142,61 @@ class ChatService:
         if not statement_evaluation:
             raise ValueError(f"指定された発言の評価が見つかりません。発言内容: {request.statement_content[:50] if request.statement_content else 'なし'}...")
         
+        if not statement_evaluation.get('statement') and request.statement_content:
+            statement_evaluation = {**statement_evaluation, 'statement': request.statement_content}
+        
+        return await self._build_messages(
+            conversation_text=request.conversation_text,
+            aspect=request.aspect,
+            statement_evaluation=statement_evaluation,
+            chat_history=request.chat_history,
+            question=request.user_question,
+            use_reference=request.use_reference,
+            api_key=api_key
+        )
+
+    async def _build_session_messages(
+        self,
+        session: AnalysisSession,
+        request: SessionChatRequest,
+        api_key: str = None
+    ) -> List[Dict[str, str]]:
+        """セッションに保持した会話・分析結果からメッセージ列を組み立てる"""
+        statement_evaluation = session.find_statement(request.aspect, request.statement_id)
+        if statement_evaluation is None:
+            raise ValueError(f"指定された発言の評価が見つかりません。発言ID: {request.statement_id}")
+        
+        return await self._build_messages(
+            conversation_text=session.conversation_text,
+            aspect=request.aspect,
+            statement_evaluation=statement_evaluation,
+            chat_history=session.chat_histories.get(request.statement_id, []),
+            question=request.question,
+            use_reference=request.use_reference,
+            api_key=api_key
+        )
+
+    async def _build_messages(
+        self,
+        conversation_text: str,
+        aspect: EvaluationAxis,
+        statement_evaluation: Dict[str, Any],
+        chat_history: List[Dict[str, str]],
+        question: str,
+        use_reference: bool,
+        api_key: str = None
+    ) -> List[Dict[str, str]]:
+        """詳細チャット用のメッセージ列を組み立てる"""
+        # 以降の呼び出しの計測値を評価軸ごとに分ける（リクエスト単位のコンテキスト）
+        axis_var.set(aspect)
+        system,prompt = PromptManager.get_detailed_chat_prompt(
+            text=AnalysisService.render_transcript(conversation_text),
+            aspect=aspect,
+            use_reference=use_reference,
+        )
+        
         # 評価結果を文字列として整理
-        reply_content = f"""発言: {statement_evaluation.get('statement', request.statement_content or '')}
+        reply_content = f"""発言: {statement_evaluation.get('statement', '')}
 
 評価の根拠: {statement_evaluation.get('evaluation', '')}
 
@@ -58,18 +212,68 @@ class ChatService:
             {"role": "assistant", "content": reply_content}
         ]
         
-        # チャット履歴を追加
-        messages.extend(request.chat_history)
+        # チャット履歴を追加（長い場合は古いやり取りを要約に畳み込む）
+        summary, recent_history = await self._compact_history(conversation_text, aspect, chat_history, api_key)
+        if summary:
+            messages.append({"role": "developer", "content": f"# これまでの質疑の要約\n{summary}"})
+        messages.extend(recent_history)
+        
+        # 新しい質問を追加（参考資料は末尾に添えて、それより前のプレフィックスを変えない）
+        if use_reference:
+            references = await reference_index.search(
+                f"{question}\n{statement_evaluation.get('statement', '')}",
+                top_k=settings.reference_top_k
+            )
+            if references:
+                question = PromptManager.get_reference_question_prompt(question, references)
+        messages.append({"role": "user", "content": question})
+        
+        return messages
+
+    async def _compact_history(
+        self,
+        conversation_text: str,
+        aspect: EvaluationAxis,
+        history: List[Dict[str, str]],
+        api_key: str = None
+    ) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """履歴がトークン予算を超える場合、直近以外を要約して (要約, 直近の履歴) を返す"""
+        if sum(count_tokens(turn.get("content", "")) for turn in history) <= settings.chat_history_token_budget:
+            return None, history
         
-        # 新しい質問を追加
-        messages.append({"role": "user", "content": request.user_question})
+        split = max(len(history) - settings.chat_history_keep_turns * 2, 0)
+        older, recent = history[:split], history[split:]
+        if not older:
+            return None, history
         
+        conversation_hash = hashlib.sha256(
+            f"{aspect}\n{conversation_text}".encode("utf-8")
+        ).hexdigest()
+        summary = self._summaries.get(self._summary_key(conversation_hash, older))
+        if summary is None:
+            # 1往復前までの要約があれば、それに新しいやり取りだけを畳み込む
+            previous = self._summaries.get(self._summary_key(conversation_hash, older[:-2]), count=False)
+            new_turns = older[-2:] if previous is not None else older
+            summary = await self._summarize(previous, new_turns, api_key)
+            self._summaries.set(self._summary_key(conversation_hash, older), summary)
+        return summary, recent
+
+    async def _summarize(self, previous_summary: Optional[str], turns: List[Dict[str, str]], api_key: str = None) -> str:
+        """やり取りを要約（既存の要約があれば更新）"""
+        system, prompt = PromptManager.get_history_summary_prompt(previous_summary, turns)
         return await openai_service.create_chat_completion(
-            messages=messages,
-            api_key=api_key,
-            search = request.use_reference
+            messages=[
+                {"role": "developer", "content": system},
+                {"role": "user", "content": prompt}],
+            model=settings.chat_summary_model,
+            api_key=api_key
         )
 
+    @staticmethod
+    def _summary_key(conversation_hash: str, turns: List[Dict[str, str]]) -> str:
+        prefix = json.dumps(turns, ensure_ascii=False, sort_keys=True)
+        return f"{conversation_hash}:{hashlib.sha256(prefix.encode('utf-8')).hexdigest()}"
+
 
 # グローバルインスタンス
 chat_service = ChatService()
\ No newline at end of file
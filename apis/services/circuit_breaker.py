@@ -0,0 +1,184 @@
+"""
+モデルごとのサーキットブレーカー
+"""
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from config.settings import settings
+from core.metrics import OPENAI_CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# /metricsのゲージで使う値
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いていて、代わりに使えるモデルもない"""
+
+    def __init__(self, model: str):
+        super().__init__(f"{model} は応答が不安定なため一時的に呼び出しを止めています")
+        self.model = model
+
+
+class CircuitPermit:
+    """allow()で通した1回の呼び出し
+
+    generationは許可したときのブレーカーの状態の世代。状態が変わった後に終わった呼び出しの結果は数えない。
+    """
+
+    def __init__(self, breaker: "ModelCircuitBreaker", generation: int, probe: bool):
+        self.breaker = breaker
+        self.generation = generation
+        self.probe = probe  # 半開きのときの試しの呼び出しか
+
+    def record(self, ok: Optional[bool], seconds: Optional[float] = None) -> None:
+        """呼び出しの結果を記録"""
+        self.breaker.record(self, ok, seconds)
+
+
+class ModelCircuitBreaker:
+    """1つのモデルに対する呼び出しの失敗率・遅い呼び出しの割合を見て、呼び出しを止める
+
+    直近circuit_breaker_window_seconds秒の呼び出しがcircuit_breaker_min_calls件以上あり、
+    失敗（5xx・接続エラー・タイムアウト）か遅い呼び出しの割合がしきい値を超えたら開く。
+    開いてからcircuit_breaker_open_seconds秒後に半開きにし、試しの呼び出しを
+    circuit_breaker_half_open_probes件だけ通す。すべて成功したら閉じ、1件でも失敗したら開き直す。
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        # 状態が変わるたびに増やす（前の状態で許可された呼び出しの結果を見分ける）
+        self.generation = 0
+        # (時刻, 失敗したか, 遅かったか)
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        OPENAI_CIRCUIT_STATE.labels(model=model).set(STATE_VALUES[CLOSED])
+
+    def allow(self) -> Optional[CircuitPermit]:
+        """呼び出してよければ許可を返す（半開きの場合は試しの呼び出しの枠を1つ確保する）"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < settings.circuit_breaker_open_seconds:
+                return None
+            self._set_state(HALF_OPEN)
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight + self._probe_successes >= settings.circuit_breaker_half_open_probes:
+                return None
+            self._probes_in_flight += 1
+            return CircuitPermit(self, self.generation, probe=True)
+        return CircuitPermit(self, self.generation, probe=False)
+
+    def record(self, permit: CircuitPermit, ok: Optional[bool], seconds: Optional[float] = None) -> None:
+        """allow()で通した呼び出しの結果を記録
+
+        okがNoneの場合（429・4xx・キャンセルなど、モデルの不調と関係ない結果）は数えない。
+        許可した後に状態が変わっていれば（閉じていたときに通した呼び出しが半開きになってから終わったなど）数えない。
+        """
+        if permit.generation != self.generation:
+            return
+        slow = self._is_slow(seconds)
+        if permit.probe:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            if ok is None:
+                return
+            if not ok or slow:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= settings.circuit_breaker_half_open_probes:
+                self._calls.clear()
+                self._set_state(CLOSED)
+                logger.info("circuit for %s closed", self.model)
+            return
+        if ok is None:
+            return
+
+        now = time.monotonic()
+        self._calls.append((now, not ok, slow))
+        while self._calls and now - self._calls[0][0] > settings.circuit_breaker_window_seconds:
+            self._calls.popleft()
+        if len(self._calls) < settings.circuit_breaker_min_calls:
+            return
+        failure_rate = sum(1 for _, failed, _ in self._calls if failed) / len(self._calls)
+        slow_rate = sum(1 for _, _, slow_call in self._calls if slow_call) / len(self._calls)
+        if failure_rate >= settings.circuit_breaker_failure_rate or slow_rate >= settings.circuit_breaker_slow_call_rate:
+            logger.warning(
+                "circuit for %s opened (failure rate %.2f, slow call rate %.2f over %d calls)",
+                self.model, failure_rate, slow_rate, len(self._calls)
+            )
+            self._open()
+
+    @staticmethod
+    def _is_slow(seconds: Optional[float]) -> bool:
+        """遅い呼び出しか"""
+        return seconds is not None and seconds >= settings.circuit_breaker_slow_call_seconds
+
+    def _open(self) -> None:
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._calls.clear()
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self.generation += 1
+        OPENAI_CIRCUIT_STATE.labels(model=self.model).set(STATE_VALUES[state])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "recent_calls": len(self._calls),
+        }
+
+
+class CircuitBreakerRegistry:
+    """モデル名ごとのサーキットブレーカー"""
+
+    def __init__(self):
+        self._breakers: Dict[str, ModelCircuitBreaker] = {}
+
+    def get(self, model: str) -> ModelCircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = ModelCircuitBreaker(model)
+        return breaker
+
+    def select(self, model: str) -> Tuple[Optional[CircuitPermit], str]:
+        """呼び出すモデルを選ぶ（開いていればopenai_fallback_model、それも使えなければCircuitOpenError）
+
+        返した許可で呼び出しの結果を記録する（ブレーカーが無効ならNone）。
+        """
+        if not settings.circuit_breaker_enabled:
+            return None, model
+        permit = self.get(model).allow()
+        if permit is not None:
+            return permit, model
+        fallback = settings.openai_fallback_model
+        if fallback and fallback != model:
+            permit = self.get(fallback).allow()
+            if permit is not None:
+                return permit, fallback
+        raise CircuitOpenError(model)
+
+    def stats(self) -> Dict[str, Any]:
+        """ブレーカーの統計"""
+        return {
+            "enabled": settings.circuit_breaker_enabled,
+            "fallback_model": settings.openai_fallback_model,
+            "models": {model: breaker.stats() for model, breaker in self._breakers.items()},
+        }
+
+
+# グローバルインスタンス
+circuit_breaker = CircuitBreakerRegistry()
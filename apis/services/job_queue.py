@@ -0,0 +1,409 @@
+"""
+分析ジョブキュー
+"""
+import asyncio
+import ipaddress
+import itertools
+import json
+import logging
+import socket
+import sqlite3
+import time
+import uuid
+from typing import Any, ContextManager, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+import httpx
+from config.settings import settings
+from core.sqlite import connect_sqlite
+from models.requests import AnalysisJobRequest
+from .analysis_service import analysis_service
+from .session_store import session_store
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookURLError(ValueError):
+    """完了通知Webhookの送信先として使えないURL"""
+
+
+async def check_webhook_url(url: str) -> None:
+    """Webhookの送信先を検証（内部ネットワークへの送信を防ぐ）
+
+    httpsのURLだけを受け付ける。job_webhook_allowed_hostsを設定した場合はそのホストだけを、
+    設定しない場合は、解決したすべてのアドレスが公開アドレスのホストだけを許可する。
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https" or not parts.hostname:
+        raise WebhookURLError("webhook_urlにはhttpsのURLを指定してください")
+    host = parts.hostname.lower()
+
+    if settings.job_webhook_allowed_hosts:
+        if host not in {allowed.lower() for allowed in settings.job_webhook_allowed_hosts}:
+            raise WebhookURLError(f"webhook_urlのホストは許可されていません: {host}")
+        return
+
+    try:
+        infos = await asyncio.to_thread(socket.getaddrinfo, host, parts.port or 443, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise WebhookURLError(f"webhook_urlのホストを解決できません: {host}") from e
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise WebhookURLError(f"webhook_urlのホストは内部のアドレスに解決されます: {host}")
+
+
+class JobStore:
+    """ジョブを永続化するSQLiteストア"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _connect(self) -> ContextManager[sqlite3.Connection]:
+        return connect_sqlite(self.path, row_factory=True)
+
+    def initialize(self) -> None:
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL, "
+                "request TEXT NOT NULL, uses_api_key INTEGER NOT NULL, api_key TEXT, "
+                "webhook_url TEXT, result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status "
+                "ON analysis_jobs (status, priority DESC, created_at)"
+            )
+
+    def insert(self, job: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO analysis_jobs (id, status, priority, request, uses_api_key, api_key, "
+                "webhook_url, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job["id"], job["status"], job["priority"], job["request"],
+                    job["uses_api_key"], job["api_key"], job["webhook_url"],
+                    job["created_at"], job["updated_at"],
+                ),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, job_id: str) -> bool:
+        """queuedのジョブをrunningにする（他のワーカーが先に取得していればFalse）"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE analysis_jobs SET status = 'running', updated_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            return cursor.rowcount == 1
+
+    def prune(self, before: float) -> int:
+        """指定時刻より前に終了したジョブを削除し、削除した件数を返す"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM analysis_jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+                (before,),
+            )
+            return cursor.rowcount
+
+    def finish(self, job_id: str, status: str, result: Optional[Any] = None, error: Optional[str] = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE analysis_jobs SET status = ?, result = ?, error = ?, api_key = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def heartbeat(self, job_id: str) -> bool:
+        """実行中のジョブのリースを延長（すでにrunningでなければFalse）"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE analysis_jobs SET updated_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, job_ids: List[str]) -> None:
+        """実行を中断したジョブをqueuedに戻す"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE analysis_jobs SET status = 'queued', updated_at = ? WHERE id = ? AND status = 'running'",
+                [(now, job_id) for job_id in job_ids],
+            )
+
+    def requeue_expired(self, lease_seconds: int) -> List[Dict[str, Any]]:
+        """リースの切れたrunningのジョブをqueuedに戻し、戻したジョブを返す
+
+        複数のプロセスが同時に見回っても、1つのジョブを戻すのは1つのプロセスだけになる。
+        """
+        now = time.time()
+        requeued = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM analysis_jobs WHERE status = 'running' AND updated_at < ?",
+                (now - lease_seconds,),
+            ).fetchall()
+            for row in rows:
+                cursor = conn.execute(
+                    "UPDATE analysis_jobs SET status = 'queued', updated_at = ? "
+                    "WHERE id = ? AND status = 'running' AND updated_at = ?",
+                    (now, row["id"], row["updated_at"]),
+                )
+                if cursor.rowcount == 1:
+                    requeued.append(dict(row))
+        return requeued
+
+    def recover(self, lease_seconds: int) -> List[Dict[str, Any]]:
+        """未完了のジョブを取得（期限切れのrunningはqueuedに戻す）"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE analysis_jobs SET status = 'queued', updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (now, now - lease_seconds),
+            )
+            rows = conn.execute(
+                "SELECT * FROM analysis_jobs WHERE status = 'queued' "
+                "ORDER BY priority DESC, created_at"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class JobQueue:
+    """同時実行数を制限して分析ジョブを実行するキュー
+
+    ジョブはSQLiteに保存されるため、再起動しても未完了のジョブは再開される。
+    終了したジョブはjob_retention_secondsたつと見回りで削除する。
+    実行中のジョブはハートビートでリースを延長し、停止時はqueuedに戻す。
+    プロセスが異常終了してリースが切れたジョブは、他のプロセスの定期的な見回りか次回の起動で再実行する。
+    API keyは既定ではメモリ上にのみ保持するため、キー付きのジョブは
+    job_queue_persist_api_keysを有効にしない限り再起動後に失敗扱いになる。
+    """
+
+    def __init__(self):
+        self.store = JobStore(settings.job_queue_db_path)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        # このプロセスが実行中（running）にしたジョブ
+        self._running: Set[str] = set()
+        self._api_keys: Dict[str, str] = {}
+        self._sequence = itertools.count()
+
+    async def start(self) -> None:
+        """ワーカーを起動し、未完了のジョブを再投入"""
+        self._queue = asyncio.PriorityQueue()
+        await asyncio.to_thread(self.store.initialize)
+
+        for job in await asyncio.to_thread(self.store.recover, settings.job_queue_lease_seconds):
+            self._enqueue(job["id"], job["priority"])
+        if self._queue.qsize():
+            logger.info("recovered %d analysis jobs", self._queue.qsize())
+
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(settings.job_queue_concurrency)
+        ]
+        self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self) -> None:
+        """ワーカーを停止（実行中のジョブはqueuedに戻し、次回起動時に再実行される）"""
+        tasks = self._workers + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sweeper = None
+        if self._running:
+            logger.info("returning %d running analysis jobs to the queue", len(self._running))
+            await asyncio.to_thread(self.store.release, list(self._running))
+            self._running.clear()
+
+    async def submit(self, request: AnalysisJobRequest, api_key: Optional[str] = None) -> Dict[str, Any]:
+        """ジョブを登録（webhook_urlが使えなければWebhookURLError）"""
+        if request.webhook_url:
+            await check_webhook_url(request.webhook_url)
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "priority": request.priority,
+            "request": json.dumps(
+                {"text": request.text, "target_behavior": request.target_behavior},
+                ensure_ascii=False,
+            ),
+            "uses_api_key": int(bool(api_key)),
+            "api_key": api_key if settings.job_queue_persist_api_keys else None,
+            "webhook_url": request.webhook_url,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await asyncio.to_thread(self.store.insert, job)
+        if api_key:
+            self._api_keys[job["id"]] = api_key
+        self._enqueue(job["id"], job["priority"])
+        return self._to_response(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態を取得"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        return self._to_response(job) if job else None
+
+    def stats(self) -> Dict[str, Any]:
+        """キューの統計"""
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "workers": len(self._workers),
+        }
+
+    def _enqueue(self, job_id: str, priority: int) -> None:
+        # priorityが大きいものから、同じなら登録順に取り出す
+        self._queue.put_nowait((-priority, next(self._sequence), job_id))
+
+    async def _sweep(self) -> None:
+        """リースの切れたジョブ（異常終了したプロセスが実行していたもの）を定期的に再投入し、
+        保持期間を過ぎた終了済みのジョブを削除"""
+        while True:
+            await asyncio.sleep(settings.job_queue_lease_seconds / 2)
+            try:
+                jobs = await asyncio.to_thread(self.store.requeue_expired, settings.job_queue_lease_seconds)
+            except Exception:
+                logger.exception("failed to sweep expired analysis jobs")
+                jobs = []
+            for job in jobs:
+                logger.warning("requeued analysis job %s after its lease expired", job["id"])
+                self._enqueue(job["id"], job["priority"])
+
+            try:
+                pruned = await asyncio.to_thread(self.store.prune, time.time() - settings.job_retention_seconds)
+            except Exception:
+                logger.exception("failed to prune finished analysis jobs")
+                continue
+            if pruned:
+                logger.info("pruned %d finished analysis jobs", pruned)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """実行中のジョブのリースを延長し続ける"""
+        while True:
+            await asyncio.sleep(settings.job_queue_lease_seconds / 3)
+            try:
+                if not await asyncio.to_thread(self.store.heartbeat, job_id):
+                    logger.warning("analysis job %s is no longer running in the store", job_id)
+                    return
+            except Exception:
+                logger.exception("failed to extend the lease of analysis job %s", job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("analysis job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        if not await asyncio.to_thread(self.store.claim, job_id):
+            return
+        self._running.add(job_id)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        cancelled = False
+        try:
+            await self._execute(job_id)
+        except asyncio.CancelledError:
+            # 停止によるキャンセル。stop()がqueuedに戻すまで実行中として残す
+            cancelled = True
+            raise
+        finally:
+            heartbeat.cancel()
+            if not cancelled:
+                self._running.discard(job_id)
+
+    async def _execute(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        # 中断してqueuedに戻ったジョブを同じプロセスで再実行できるよう、終わるまでキーを残す
+        api_key = self._api_keys.get(job_id) or job["api_key"]
+
+        if job["uses_api_key"] and not api_key:
+            await self._finish(job, "failed", error="再起動によりAPIキーが失われました。もう一度登録してください。")
+            return
+
+        request = json.loads(job["request"])
+        # 一部の評価軸が失敗しても、完了した評価軸の結果は残す（/analyzeと同じ）
+        try:
+            results, errors, timed_out = await analysis_service.analyze_conversation_partial(
+                request["text"],
+                request["target_behavior"],
+                api_key
+            )
+        except Exception as e:
+            await self._finish(job, "failed", error=f"分析エラー: {str(e)}")
+            return
+        if not results:
+            error = next(iter(errors.values()), None)
+            await self._finish(job, "failed", error=f"分析エラー: {str(error) if error else '分析が完了しませんでした'}")
+            return
+
+        try:
+            # /analyzeと同じく、発言IDを付けて詳細チャット用のセッションを作る
+            session = await session_store.create(request["text"], request["target_behavior"], results)
+        except Exception as e:
+            await self._finish(job, "failed", error=f"分析エラー: {str(e)}")
+            return
+        await self._finish(job, "completed", result={
+            **session.analysis_result,
+            "session_id": session.session_id,
+            "timed_out": timed_out,
+            "errors": {aspect: f"分析エラー: {str(error)}" for aspect, error in errors.items()},
+        })
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: Optional[Any] = None, error: Optional[str] = None) -> None:
+        await asyncio.to_thread(self.store.finish, job["id"], status, result, error)
+        self._api_keys.pop(job["id"], None)
+        if job["webhook_url"]:
+            await self._notify(job["webhook_url"], await self.get(job["id"]))
+
+    async def _notify(self, url: str, payload: Dict[str, Any]) -> None:
+        """完了通知Webhookを送信（失敗してもジョブの結果には影響しない）
+
+        登録後に名前解決の結果が変わっていないか、送信の直前にも送信先を検証する。リダイレクトはたどらない。
+        """
+        try:
+            await check_webhook_url(url)
+            async with httpx.AsyncClient(timeout=settings.job_webhook_timeout, follow_redirects=False) as client:
+                response = await client.post(url, json=payload)
+                response.raise_for_status()
+        except (WebhookURLError, httpx.HTTPError) as e:
+            logger.warning("webhook for analysis job %s failed: %s", payload["job_id"], e)
+
+    @staticmethod
+    def _to_response(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "priority": job["priority"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "result": json.loads(job["result"]) if job.get("result") else None,
+            "error": job.get("error"),
+        }
+
+
+# グローバルインスタンス
+job_queue = JobQueue()
@@ -0,0 +1,92 @@
+"""
+OpenAIクライアントプール
+"""
+import logging
+import os
+from typing import Any, Dict, Optional
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from config.settings import settings
+from core.ttl_cache import TTLCache
+from core.utils import hash_api_key
+
+logger = logging.getLogger(__name__)
+
+
+class OpenAIClientPool:
+    """API keyごとのAsyncOpenAIクライアントを再利用するプール
+
+    全クライアントが1つのhttpx接続プール（HTTP/2 keep-alive）を共有するため、
+    API keyが変わってもTLSハンドシェイクをやり直さない。
+    キーはハッシュ化して保持し、平文はクライアント内部にのみ残る。
+    """
+
+    def __init__(self):
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._clients: TTLCache[AsyncOpenAI] = TTLCache(
+            max_size=settings.openai_client_pool_size,
+            ttl=settings.openai_client_idle_ttl,
+            sliding=True,
+        )
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """共有のhttpxクライアントを取得（未作成・クローズ済みなら作成）"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = DefaultAsyncHttpxClient(
+                http2=settings.openai_http2,
+                limits=httpx.Limits(
+                    max_connections=settings.openai_max_connections,
+                    max_keepalive_connections=settings.openai_max_keepalive_connections,
+                    keepalive_expiry=settings.openai_keepalive_expiry,
+                ),
+            )
+        return self._http_client
+
+    def get(self, api_key: Optional[str] = None) -> AsyncOpenAI:
+        """API keyに対応するクライアントを取得（なければ作成）"""
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        key = hash_api_key(api_key)
+
+        client = self._clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=settings.openai_base_url,
+                timeout=settings.openai_timeout,
+                # リトライはOpenAIServiceがレート制御と合わせて行う
+                max_retries=0,
+                http_client=self._get_http_client(),
+            )
+            self._clients.set(key, client)
+        return client
+
+    async def prewarm(self) -> None:
+        """APIのホストへの接続（DNS解決・TLSハンドシェイク）を先に確立しておく
+
+        応答の内容は使わないため、認証なしのリクエストで接続だけを共有プールに残す。
+        """
+        client = self.get()
+        response = await self._get_http_client().get(client.base_url.join("models"))
+        await response.aclose()
+        logger.info("prewarmed connection to %s (status %d)", client.base_url.host, response.status_code)
+
+    async def close(self) -> None:
+        """全クライアントを破棄し、共有接続をクローズ"""
+        # 個々のクライアントは共有接続を参照しているだけなので、
+        # 破棄後に共有のhttpxクライアントを1回だけ閉じる
+        self._clients.clear()
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+        self._http_client = None
+
+    def stats(self) -> Dict[str, Any]:
+        """プールの統計"""
+        return {
+            **self._clients.stats(),
+            "idle_ttl": settings.openai_client_idle_ttl,
+            "http2": settings.openai_http2,
+        }
+
+
+# グローバルインスタンス
+openai_client_pool = OpenAIClientPool()
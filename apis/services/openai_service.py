@@ -1,29 +1,46 @@
 """
 OpenAI API連携サービス
 """
-import os
-from typing import List, Dict
-from openai import AsyncOpenAI
+import asyncio
+import logging
+import random
+import time
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+from openai.types import CompletionUsage
 from config.settings import settings
+from core.metrics import (
+    OPENAI_ERRORS,
+    OPENAI_FALLBACKS,
+    OPENAI_QUEUE_WAIT_SECONDS,
+    OPENAI_REQUEST_SECONDS,
+    OPENAI_TIME_TO_FIRST_TOKEN_SECONDS,
+    OPENAI_TOKENS,
+)
+from core.request_context import add_request_stats, deadline_var, get_request_id, metric_labels
+from .circuit_breaker import circuit_breaker
+from .openai_client_pool import openai_client_pool
+from .rate_limiter import parse_retry_after, rate_limiter
+
+
+logger = logging.getLogger(__name__)
 
 
 class OpenAIService:
     """OpenAI APIとの連携を管理するサービス"""
     
     def __init__(self):
-        self.default_client = AsyncOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            timeout=settings.openai_timeout
-        )
+        # トークン使用量の累計（プロンプトキャッシュのヒット率確認用）
+        self.usage_totals = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+        }
     
     def _get_client(self, api_key: str = None) -> AsyncOpenAI:
-        """API keyに応じてクライアントを取得"""
-        if api_key:
-            return AsyncOpenAI(
-                api_key=api_key,
-                timeout=settings.openai_timeout
-            )
-        return self.default_client
+        """API keyに応じてクライアントを取得（プールから再利用）"""
+        return openai_client_pool.get(api_key)
     
     async def create_chat_completion(
         self,
@@ -32,18 +49,202 @@ class OpenAIService:
         temperature: float = None,
         # max_tokens: int = None,
         api_key: str = None,
-        search: bool = False
+        response_format: Optional[Dict[str, Any]] = None
     ) -> str:
         """チャット補完を実行"""
-        client = self._get_client(api_key)
-        response = await client.chat.completions.create(
+        content, _ = await self.create_chat_completion_with_model(
+            messages,
+            model=model,
+            api_key=api_key,
+            response_format=response_format
+        )
+        return content
+
+    async def create_chat_completion_with_model(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        api_key: str = None,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, str]:
+        """チャット補完を実行し、(応答, 実際に呼び出したモデル) を返す
+
+        サーキットが開いていて代わりのモデルで呼び出した場合は、そのモデル名が返る。
+        """
+        extra = {"response_format": response_format} if response_format else {}
+        response, used_model = await self._create_with_retries(
+            api_key,
             model=model or settings.openai_model,
             messages=messages,
             # temperature=temperature or settings.openai_temperature,
             # max_tokens=max_tokens or settings.openai_max_tokens,
+            **extra
+        )
+        self._record_usage(response.usage, response.model)
+        
+        return response.choices[0].message.content or "エラーが発生しました。もう一度お試しください。", used_model
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        api_key: str = None,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """チャット補完をストリーミングで実行
+
+        最初に {"model": 実際に呼び出したモデル} を、続いて {"delta": 文字列} を順に返し、
+        最後に {"usage": {...}} を返す。
+        呼び出し側がイテレーションを中断した場合は上流のストリームも閉じる。
+        リトライは最初の応答を受け取るまでの間だけ行う。
+        """
+        extra = {"response_format": response_format} if response_format else {}
+        start = time.monotonic()
+        first_token = True
+        stream, used_model = await self._create_with_retries(
+            api_key,
+            model=model or settings.openai_model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **extra
         )
+        try:
+            yield {"model": used_model}
+            async for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token:
+                            first_token = False
+                            ttft = time.monotonic() - start
+                            OPENAI_TIME_TO_FIRST_TOKEN_SECONDS.labels(**metric_labels()).observe(ttft)
+                            add_request_stats(time_to_first_token_seconds=ttft)
+                        yield {"delta": delta}
+                if chunk.usage:
+                    self._record_usage(chunk.usage, chunk.model)
+                    yield {"usage": chunk.usage.model_dump(exclude_none=True)}
+        finally:
+            await stream.close()
+
+    async def _create_with_retries(self, api_key: Optional[str], **params: Any) -> Tuple[Any, str]:
+        """API keyごとのレート制御を通して呼び出し、429/5xx/接続エラーはリトライ
+
+        リトライは指数バックオフ（ジッターつき）で行い、Retry-Afterがあればそれ以上待つ。
+        openai_retry_deadlineを超える場合は最後のエラーを送出する。
+        各呼び出しのタイムアウトはopenai_timeoutと期限までの残りの短い方にする。
+        呼び出すたびにモデルのサーキットブレーカーを確認し、開いていれば代わりのモデルで呼び出す
+        （使えるモデルがなければ待たずにCircuitOpenErrorを送出する）。
+        (応答, 実際に呼び出したモデル) を返す。
+        """
+        client = self._get_client(api_key)
+        limiter = rate_limiter.get(api_key)
+        deadline = time.monotonic() + settings.openai_retry_deadline
+        request_deadline = deadline_var.get()
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline)
+        attempt = 0
+        labels = metric_labels()
+        requested_model = params["model"]
+        
+        while True:
+            retry_after = None
+            permit, params["model"] = circuit_breaker.select(requested_model)
+            if params["model"] != requested_model:
+                OPENAI_FALLBACKS.labels(**labels, model=requested_model, fallback_model=params["model"]).inc()
+            # サーキットブレーカーに記録する結果（Noneはモデルの不調と関係ないので数えない）
+            outcome: Optional[bool] = None
+            request_start: Optional[float] = None
+            try:
+                wait_start = time.monotonic()
+                async with limiter.slot():
+                    queue_wait = time.monotonic() - wait_start
+                    OPENAI_QUEUE_WAIT_SECONDS.labels(**labels).observe(queue_wait)
+                    request_start = time.monotonic()
+                    # リトライを含めた期限（リクエストの期限があればその早い方）の残りを超えて待たない
+                    params["timeout"] = min(settings.openai_timeout, max(deadline - request_start, 1.0))
+                    raw = await client.chat.completions.with_raw_response.create(**params)
+                upstream = time.monotonic() - request_start
+                outcome = True
+                OPENAI_REQUEST_SECONDS.labels(**labels, model=params["model"]).observe(upstream)
+                add_request_stats(upstream_calls=1, queue_wait_seconds=queue_wait, upstream_seconds=upstream)
+                limiter.record_headers(raw.headers)
+                limiter.record_success()
+                return raw.parse(), params["model"]
+            except APIStatusError as e:
+                OPENAI_ERRORS.labels(**labels, error=str(e.status_code)).inc()
+                limiter.record_headers(e.response.headers)
+                if e.status_code == 429:
+                    # クォータ切れは待っても回復しない
+                    if e.code == "insufficient_quota":
+                        raise
+                    retry_after = parse_retry_after(e.response.headers)
+                    limiter.record_throttled(retry_after)
+                    rate_limiter.throttle_events += 1
+                elif e.status_code < 500:
+                    raise
+                else:
+                    outcome = False
+                error = e
+            except APIConnectionError as e:
+                # タイムアウト（APITimeoutError）も含む
+                OPENAI_ERRORS.labels(**labels, error="connection").inc()
+                outcome = False
+                error = e
+            finally:
+                if permit is not None:
+                    permit.record(outcome, time.monotonic() - request_start if request_start is not None else None)
+            
+            attempt += 1
+            delay = self._backoff_delay(attempt, retry_after)
+            if attempt > settings.openai_max_retries or time.monotonic() + delay > deadline:
+                raise error
+            rate_limiter.retries += 1
+            logger.warning(
+                "openai request failed (%s), retrying in %.1fs (attempt %d)",
+                type(error).__name__, delay, attempt
+            )
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _backoff_delay(attempt: int, retry_after: Optional[float]) -> float:
+        """リトライまでの待ち時間（full jitter）"""
+        ceiling = min(settings.openai_backoff_max, settings.openai_backoff_base * 2 ** (attempt - 1))
+        delay = random.uniform(0, ceiling)
+        return max(delay, retry_after or 0.0)
+
+    def _record_usage(self, usage: Optional[CompletionUsage], model: str) -> None:
+        """トークン使用量（キャッシュされたプロンプトトークンを含む）を記録"""
+        if usage is None:
+            return
+        details = usage.prompt_tokens_details
+        cached_tokens = (details.cached_tokens or 0) if details else 0
         
-        return response.choices[0].message.content or "エラーが発生しました。もう一度お試しください。"
+        self.usage_totals["requests"] += 1
+        self.usage_totals["prompt_tokens"] += usage.prompt_tokens
+        self.usage_totals["cached_tokens"] += cached_tokens
+        self.usage_totals["completion_tokens"] += usage.completion_tokens
+        labels = metric_labels()
+        OPENAI_TOKENS.labels(**labels, model=model, kind="prompt").inc(usage.prompt_tokens)
+        OPENAI_TOKENS.labels(**labels, model=model, kind="cached").inc(cached_tokens)
+        OPENAI_TOKENS.labels(**labels, model=model, kind="completion").inc(usage.completion_tokens)
+        add_request_stats(
+            prompt_tokens=usage.prompt_tokens,
+            cached_tokens=cached_tokens,
+            completion_tokens=usage.completion_tokens
+        )
+        logger.info(
+            "openai usage request_id=%s model=%s prompt_tokens=%d cached_tokens=%d completion_tokens=%d",
+            get_request_id(), model, usage.prompt_tokens, cached_tokens, usage.completion_tokens
+        )
+
+    def usage_stats(self) -> Dict[str, Any]:
+        """トークン使用量の統計"""
+        prompt_tokens = self.usage_totals["prompt_tokens"]
+        return {
+            **self.usage_totals,
+            "cached_token_rate": round(self.usage_totals["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+        }
 
 
 # グローバルインスタンス
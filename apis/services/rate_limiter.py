@@ -0,0 +1,191 @@
+"""
+API keyごとのレート制御
+"""
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Mapping, Optional
+from config.settings import settings
+from core.ttl_cache import TTLCache
+from core.utils import hash_api_key
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """"1s" / "6m0s" / "20ms" 形式（x-ratelimit-reset-*）を秒に変換"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """retry-after-ms / retry-after ヘッダーを秒に変換"""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+class KeyRateLimiter:
+    """1つのAPI keyに対するトークンバケット + 同時実行数制限
+
+    レートは応答ヘッダーに合わせて調整する。429を受けたら半減させ、
+    成功が続く間は上限まで少しずつ戻す（AIMD）。
+    """
+
+    def __init__(self):
+        self.max_rate = settings.rate_limit_requests_per_second
+        self.rate = self.max_rate
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.semaphore = asyncio.Semaphore(settings.rate_limit_max_concurrency)
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.throttled = 0
+
+    @property
+    def busy(self) -> bool:
+        """待ち・実行中の呼び出しがあるか、スロットリングで止めている最中か"""
+        return bool(self.waiting or self.in_flight or self.blocked_until > time.monotonic())
+
+    def _refill(self, now: float) -> None:
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def _take_token(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max(wait, (1 - self.tokens) / self.rate))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """呼び出し枠を確保（空くまで待つ）"""
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+            try:
+                await self._take_token()
+            except BaseException:
+                self.semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def record_headers(self, headers: Mapping[str, str]) -> None:
+        """x-ratelimit-* ヘッダーから残り枠を反映"""
+        now = time.monotonic()
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is None or reset is None:
+                continue
+            try:
+                remaining_count = int(remaining)
+            except ValueError:
+                continue
+            if remaining_count <= 0:
+                # 枠を使い切っている間は新しい呼び出しを止める
+                self.blocked_until = max(self.blocked_until, now + reset)
+            elif kind == "requests" and reset > 0:
+                # リセットまでに残り枠を使い切るペースに合わせる
+                self.rate = max(
+                    settings.rate_limit_min_requests_per_second,
+                    min(self.max_rate, remaining_count / reset),
+                )
+
+    def record_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + settings.rate_limit_min_requests_per_second)
+
+    def record_throttled(self, retry_after: Optional[float]) -> None:
+        self.throttled += 1
+        self.rate = max(settings.rate_limit_min_requests_per_second, self.rate / 2)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class RateLimiter:
+    """API keyごとのレート制御を管理（キーはハッシュ化して保持）
+
+    件数上限・アイドルTTLで追い出されたレート制御でも、呼び出しが残っている間は手放さない
+    （同じキーに別のレート制御を作ると、同時実行数の制限やスロットリングが効かなくなるため）。
+    """
+
+    def __init__(self):
+        self._limiters: TTLCache[KeyRateLimiter] = TTLCache(
+            max_size=settings.openai_client_pool_size,
+            ttl=settings.openai_client_idle_ttl,
+            sliding=True,
+            on_evict=self._on_evict,
+        )
+        # 追い出されたが、まだ呼び出しの残っているレート制御
+        self._retained: Dict[str, KeyRateLimiter] = {}
+        self.retries = 0
+        self.throttle_events = 0
+
+    def get(self, api_key: Optional[str]) -> KeyRateLimiter:
+        key = hash_api_key(api_key)
+        limiter = self._limiters.get(key, count=False)
+        if limiter is None:
+            limiter = self._retained.pop(key, None) or KeyRateLimiter()
+            self._limiters.set(key, limiter)
+        self._release_idle()
+        return limiter
+
+    def _on_evict(self, key: str, limiter: KeyRateLimiter) -> None:
+        if limiter.busy:
+            self._retained[key] = limiter
+
+    def _release_idle(self) -> None:
+        """呼び出しの終わった、追い出し済みのレート制御を手放す"""
+        for key in [key for key, limiter in self._retained.items() if not limiter.busy]:
+            del self._retained[key]
+
+    def clear(self) -> None:
+        """すべてのレート制御を手放す"""
+        self._limiters.clear()
+        self._retained.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """待ち行列の長さやスロットリングの統計"""
+        limiters = self._limiters.values() + list(self._retained.values())
+        return {
+            "keys": len(limiters),
+            "queue_depth": sum(limiter.waiting for limiter in limiters),
+            "in_flight": sum(limiter.in_flight for limiter in limiters),
+            "throttled": self.throttle_events,
+            "retries": self.retries,
+            "min_rate": round(min((limiter.rate for limiter in limiters), default=0.0), 3),
+        }
+
+
+# グローバルインスタンス
+rate_limiter = RateLimiter()
@@ -0,0 +1,195 @@
+"""
+分析セッションストア
+"""
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from config.settings import settings
+from core.sqlite import connect_sqlite
+from core.ttl_cache import TTLCache
+from core.utils import assign_statement_ids
+
+
+class AnalysisSession:
+    """1回の分析の対話文・結果・発言ごとのチャット履歴"""
+
+    def __init__(
+        self,
+        session_id: str,
+        conversation_text: str,
+        target_behavior: Optional[str],
+        analysis_result: Dict[str, List[Dict[str, Any]]],
+        chat_histories: Optional[Dict[str, List[Dict[str, str]]]] = None,
+        created_at: Optional[float] = None
+    ):
+        self.session_id = session_id
+        self.conversation_text = conversation_text
+        self.target_behavior = target_behavior
+        self.analysis_result = analysis_result
+        self.chat_histories = chat_histories or {}
+        self.created_at = created_at or time.time()
+        # 発言ID → (評価軸, 評価) の索引
+        self.statements = {
+            item["id"]: (aspect, item)
+            for aspect, items in analysis_result.items()
+            for item in items
+            if "id" in item
+        }
+
+    def find_statement(self, aspect: str, statement_id: str) -> Optional[Dict[str, Any]]:
+        """評価軸と発言IDから評価を取得"""
+        entry = self.statements.get(statement_id)
+        if entry is None or entry[0] != aspect:
+            return None
+        return entry[1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "conversation_text": self.conversation_text,
+            "target_behavior": self.target_behavior,
+            "analysis_result": self.analysis_result,
+            "chat_histories": self.chat_histories,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnalysisSession":
+        return cls(**data)
+
+
+class SQLiteSessionStore:
+    """ワーカー間で共有するSQLiteのセッション保存先"""
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with connect_sqlite(self.path) as conn:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_sessions ("
+                    "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+                )
+                self._initialized = True
+            yield conn
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, updated_at FROM analysis_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def save(self, data: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                (data["session_id"], json.dumps(data, ensure_ascii=False), now),
+            )
+            conn.execute("DELETE FROM analysis_sessions WHERE updated_at < ?", (now - self.ttl,))
+
+    def append_chat(self, session_id: str, statement_id: str, messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """チャット履歴に追加して更新後のセッションを返す
+
+        他のワーカーが同時に追加しても失われないよう、読み込みから書き込みまでを1つのトランザクションで行う。
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data FROM analysis_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            data["chat_histories"].setdefault(statement_id, []).extend(messages)
+            conn.execute(
+                "UPDATE analysis_sessions SET data = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(data, ensure_ascii=False), time.time(), session_id),
+            )
+        return data
+
+
+class SessionStore:
+    """分析セッションを保持するストア（SQLite、指定がなければメモリLRU）
+
+    SQLiteを使う場合は、他のワーカーが更新したチャット履歴を読めるよう毎回SQLiteから読み込む。
+    """
+
+    def __init__(self):
+        self._memory: TTLCache[AnalysisSession] = TTLCache(
+            max_size=settings.session_store_max_entries,
+            ttl=settings.session_ttl,
+            sliding=True,
+        )
+        self._sqlite: Optional[SQLiteSessionStore] = None
+        if settings.session_store_sqlite_path:
+            self._sqlite = SQLiteSessionStore(settings.session_store_sqlite_path, ttl=settings.session_ttl)
+
+    async def create(
+        self,
+        conversation_text: str,
+        target_behavior: Optional[str],
+        analysis_result: Dict[str, List[Dict[str, Any]]]
+    ) -> AnalysisSession:
+        """分析結果に発言IDを付けてセッションを作成"""
+        session = AnalysisSession(
+            session_id=uuid.uuid4().hex,
+            conversation_text=conversation_text,
+            target_behavior=target_behavior,
+            analysis_result={
+                aspect: assign_statement_ids(aspect, items)
+                for aspect, items in analysis_result.items()
+            },
+        )
+        await self.save(session)
+        return session
+
+    async def get(self, session_id: str) -> Optional[AnalysisSession]:
+        """セッションを取得（SQLiteを使う場合はメモリ上の古いコピーを使わずSQLiteから読む）"""
+        if self._sqlite is None:
+            return self._memory.get(session_id)
+        data = await asyncio.to_thread(self._sqlite.get, session_id)
+        return AnalysisSession.from_dict(data) if data is not None else None
+
+    async def save(self, session: AnalysisSession) -> None:
+        """セッションを保存"""
+        if self._sqlite is None:
+            self._memory.set(session.session_id, session)
+            return
+        await asyncio.to_thread(self._sqlite.save, session.to_dict())
+
+    async def append_chat(self, session: AnalysisSession, statement_id: str, question: str, answer: str) -> None:
+        """発言ごとのチャット履歴に1往復を追加"""
+        messages = [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer},
+        ]
+        if self._sqlite is None:
+            session.chat_histories.setdefault(statement_id, []).extend(messages)
+            self._memory.set(session.session_id, session)
+            return
+        data = await asyncio.to_thread(self._sqlite.append_chat, session.session_id, statement_id, messages)
+        # 他のワーカーが追加した分も含めて、手元のセッションを最新にする
+        session.chat_histories = data["chat_histories"] if data is not None else session.chat_histories
+
+    def stats(self) -> Dict[str, Any]:
+        """ストアの統計"""
+        if self._sqlite is not None:
+            return {"sqlite": True}
+        return {**self._memory.stats(), "sqlite": False}
+
+
+# グローバルインスタンス
+session_store = SessionStore()
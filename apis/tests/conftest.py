@@ -0,0 +1,53 @@
+"""
+テスト共通の設定
+
+設定（config.settings）の読み込み前に、SQLiteの保存先を一時ディレクトリに向け、
+OpenAIの呼び出し先をテスト用のモックにする。
+"""
+import os
+import tempfile
+
+_DATA_DIR = tempfile.mkdtemp(prefix="apis-tests-")
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ["OPENAI_BASE_URL"] = "http://mock-openai/v1"
+os.environ["SESSION_STORE_SQLITE_PATH"] = os.path.join(_DATA_DIR, "sessions.sqlite3")
+os.environ["JOB_QUEUE_DB_PATH"] = os.path.join(_DATA_DIR, "jobs.sqlite3")
+os.environ["BATCH_PROVIDER_DB_PATH"] = os.path.join(_DATA_DIR, "batches.sqlite3")
+
+
+# 設定を読み込むモジュールは環境変数を設定した後にimportする
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from benchmarks.mock_openai import MockConfig, create_app  # noqa: E402
+from services.openai_client_pool import openai_client_pool  # noqa: E402
+from services.rate_limiter import rate_limiter  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiters():
+    """API keyごとのレート制御を作り直す
+
+    asyncioのロックは待ちが発生したイベントループに結び付くため、テストごとに別のループで動かすと使い回せない。
+    """
+    rate_limiter.clear()
+    yield
+    rate_limiter.clear()
+
+
+@pytest.fixture(scope="module")
+def mock_openai():
+    """OpenAIの呼び出しをbenchmarksのモックサーバーに向ける
+
+    共有のhttpxクライアントをモックサーバーへのASGI呼び出しに差し替え、そのクライアントを返す
+    （`await mock_openai.get("/stats")` でモックが受けたリクエスト数を確認できる）。
+    """
+    mock = create_app(MockConfig(latency="fixed:0", first_token="fixed:0", tokens_per_second=0))
+    openai_client_pool._clients.clear()
+    openai_client_pool._http_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=mock),
+        base_url="http://mock-openai",
+    )
+    yield openai_client_pool._http_client
+    openai_client_pool._clients.clear()
+    openai_client_pool._http_client = None
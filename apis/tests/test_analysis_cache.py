@@ -0,0 +1,89 @@
+"""
+services.analysis_cache のテスト
+"""
+import asyncio
+import pytest
+from config.settings import settings
+from services.analysis_cache import AnalysisCache, SQLiteCacheStore, make_cache_key
+
+RESULT = [{"statement": "発言", "score": 4}]
+
+
+@pytest.fixture
+def sqlite_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(settings, "analysis_cache_enabled", True)
+    monkeypatch.setattr(settings, "analysis_cache_sqlite_path", path)
+    return path
+
+
+def test_cache_key_ignores_whitespace_differences():
+    key = make_cache_key("Th: こんにちは\nCl: どうも", "減酒", "cct", "model-a", "v1")
+
+    assert make_cache_key("  Th: こんにちは  \r\nCl: どうも\n", " 減酒 ", "cct", "model-a", "v1") == key
+    assert make_cache_key("Th: こんにちは\nCl: どうも", None, "cct", "model-a", "v1") != key
+
+
+@pytest.mark.parametrize("field, value", [("aspect", "sst"), ("model", "model-b"), ("prompt_version", "v2")])
+def test_cache_key_changes_with_model_and_prompt(field, value):
+    args = {"text": "Th: こんにちは", "target_behavior": None, "aspect": "cct", "model": "model-a", "prompt_version": "v1"}
+    assert make_cache_key(**{**args, field: value}) != make_cache_key(**args)
+
+
+def test_returns_copies(sqlite_path):
+    async def main():
+        cache = AnalysisCache()
+        await cache.set("key", RESULT)
+        first = await cache.get("key")
+        first[0]["score"] = 1
+        return await cache.get("key")
+
+    # 呼び出し元が書き換えてもキャッシュは変わらない
+    assert asyncio.run(main()) == RESULT
+
+
+def test_sqlite_layer_is_shared_between_workers(sqlite_path):
+    async def main():
+        await AnalysisCache().set("key", RESULT)
+        # 別のワーカー（メモリ層は空）でもSQLiteから読める
+        other = AnalysisCache()
+        value = await other.get("key")
+        missing = await other.get("other-key")
+        return value, missing, other.stats()
+
+    value, missing, stats = asyncio.run(main())
+    assert value == RESULT
+    assert missing is None
+    assert stats["sqlite_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_disabled_cache_stores_nothing(sqlite_path, monkeypatch):
+    monkeypatch.setattr(settings, "analysis_cache_enabled", False)
+
+    async def main():
+        cache = AnalysisCache()
+        await cache.set("key", RESULT)
+        return await cache.get("key")
+
+    assert asyncio.run(main()) is None
+
+
+def test_sqlite_store_expires_entries(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "cache.sqlite3"), ttl=-1, max_entries=10)
+    store.set("key", RESULT)
+    assert store.get("key") is None
+
+
+def test_sqlite_store_keeps_recently_used_entries(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "cache.sqlite3"), ttl=3600, max_entries=2)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.get("a")
+    store.set("c", 3)
+
+    # 上限を超えた分は参照の古いもの（b）から削除する
+    assert store.get("a") == 1
+    assert store.get("b") is None
+    assert store.get("c") == 3
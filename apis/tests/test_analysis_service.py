@@ -0,0 +1,188 @@
+"""
+services.analysis_service のテスト（OpenAIの呼び出しはbenchmarksのモックサーバーに向ける）
+
+レート制御のロックはイベントループに結び付くため、1つのテストは1回のasyncio.runで実行する。
+"""
+import asyncio
+import pytest
+from pydantic import ValidationError
+from benchmarks.samples import SAMPLE_TARGET_BEHAVIOR, sample_transcript
+from config.settings import Settings, settings
+from models.types import EVALUATION_AXES
+import services.analysis_service as analysis_module
+from services.analysis_service import AnalysisService, analysis_service
+
+
+@pytest.fixture(autouse=True)
+def axis_mode(mock_openai, monkeypatch):
+    monkeypatch.setattr(settings, "analysis_mode", "per_axis")
+    return mock_openai
+
+
+async def upstream_requests(mock_openai):
+    return (await mock_openai.get("/stats")).json()["requests"]
+
+
+async def analyze(text):
+    return await analysis_service.analyze_conversation_partial(text, SAMPLE_TARGET_BEHAVIOR, use_cache=False)
+
+
+async def analyze_incremental(text, previous_text, previous_result):
+    return await analysis_service.analyze_incremental(
+        text, previous_text, previous_result, SAMPLE_TARGET_BEHAVIOR, use_cache=False
+    )
+
+
+def test_incremental_reanalyzes_only_the_edited_window(mock_openai):
+    previous_text = sample_transcript(repeat=2)
+    lines = previous_text.split("\n")
+    lines[-2] = "Th: 平日に減らすとしたら、まず何から始められそうですか？"
+    text = "\n".join(lines)
+
+    async def main():
+        previous_result, errors, _ = await analyze(previous_text)
+        assert errors == {}
+        before = await upstream_requests(mock_openai)
+        outcome = await analyze_incremental(text, previous_text, previous_result)
+        return outcome, await upstream_requests(mock_openai) - before
+
+    (results, errors, timed_out, info), requests = asyncio.run(main())
+
+    assert errors == {} and timed_out == []
+    assert info["mode"] == "incremental"
+    assert 0 < info["reanalyzed_turns"] < info["total_turns"] == 20
+    # 変更された窓だけを評価軸ごとに1回ずつ分析する
+    assert requests == len(EVALUATION_AXES)
+    for aspect in EVALUATION_AXES:
+        assert 0 < len(results[aspect]) <= 3
+
+
+def test_incremental_unchanged_text_reuses_previous_result(mock_openai):
+    text = sample_transcript(repeat=2)
+
+    async def main():
+        previous_result, _, _ = await analyze(text)
+        before = await upstream_requests(mock_openai)
+        outcome = await analyze_incremental(text, text, previous_result)
+        return previous_result, outcome, await upstream_requests(mock_openai) - before
+
+    previous_result, (results, _, _, info), requests = asyncio.run(main())
+
+    assert info["mode"] == "unchanged"
+    assert results == previous_result
+    assert requests == 0
+
+
+def test_incremental_falls_back_to_full_analysis():
+    previous_text = sample_transcript()
+    text = previous_text + "\nTh: 少しずつ試してみましょう。"
+
+    async def main():
+        previous_result, _, _ = await analyze(previous_text)
+        # 評価軸が欠けた結果からは差分で分析できない
+        del previous_result["sst"]
+        return await analyze_incremental(text, previous_text, previous_result)
+
+    results, errors, _, info = asyncio.run(main())
+
+    assert errors == {}
+    assert info["mode"] == "full"
+    assert info["reanalyzed_turns"] == info["total_turns"]
+    assert set(results) == set(EVALUATION_AXES)
+
+
+def test_long_transcript_windows_are_not_split_again(mock_openai, monkeypatch):
+    monkeypatch.setattr(settings, "analysis_long_transcript_tokens", 200)
+    monkeypatch.setattr(settings, "analysis_window_tokens", 150)
+    monkeypatch.setattr(settings, "analysis_window_overlap_tokens", 30)
+    text = sample_transcript(repeat=3)
+    windows = AnalysisService.split_long_transcript(text)
+    assert len(windows) > 1
+
+    splits = []
+    original = AnalysisService.split_long_transcript
+
+    def split_long_transcript(text):
+        splits.append(text)
+        return original(text)
+
+    monkeypatch.setattr(AnalysisService, "split_long_transcript", staticmethod(split_long_transcript))
+
+    async def main():
+        before = await upstream_requests(mock_openai)
+        outcome = await analyze(text)
+        return outcome, await upstream_requests(mock_openai) - before
+
+    (results, errors, _), requests = asyncio.run(main())
+
+    assert errors == {}
+    # 分けるのは対話文全体の1回だけで、窓ごとに評価軸の数だけ呼び出す（同じ内容の窓は1回にまとまる）
+    assert splits == [text] * len(EVALUATION_AXES)
+    assert requests == len(set(windows)) * len(EVALUATION_AXES)
+    assert all(0 < len(results[aspect]) <= 3 for aspect in EVALUATION_AXES)
+
+
+def test_settings_reject_window_not_shorter_than_threshold():
+    with pytest.raises(ValidationError):
+        Settings(analysis_long_transcript_tokens=6000, analysis_window_tokens=6000)
+    with pytest.raises(ValidationError):
+        Settings(analysis_window_tokens=500, analysis_window_overlap_tokens=500)
+
+
+def test_cached_analysis_skips_upstream(mock_openai):
+    text = sample_transcript(variant=21)
+
+    async def main():
+        first = await analysis_service.analyze_conversation_partial(text, SAMPLE_TARGET_BEHAVIOR)
+        before = await upstream_requests(mock_openai)
+        second = await analysis_service.analyze_conversation_partial(text + "\n", SAMPLE_TARGET_BEHAVIOR)
+        return first, second, await upstream_requests(mock_openai) - before
+
+    (first, _, _), (second, _, _), requests = asyncio.run(main())
+
+    # 末尾の空白だけ違う対話文も同じキーでキャッシュから返す
+    assert requests == 0
+    assert second == first
+
+
+def test_combined_mode_analyzes_all_axes_in_one_call(mock_openai, monkeypatch):
+    monkeypatch.setattr(settings, "analysis_mode", "combined")
+    text = sample_transcript(variant=22)
+
+    async def main():
+        before = await upstream_requests(mock_openai)
+        outcome = await analyze(text)
+        return outcome, await upstream_requests(mock_openai) - before
+
+    (results, errors, timed_out), requests = asyncio.run(main())
+
+    assert errors == {} and timed_out == []
+    assert requests == 1
+    for aspect in EVALUATION_AXES:
+        assert len(results[aspect]) == 3
+
+
+def test_combined_mode_retries_invalid_axes_individually(mock_openai, monkeypatch):
+    monkeypatch.setattr(settings, "analysis_mode", "combined")
+    original = analysis_module.parse_combined_analysis_response
+
+    def parse_without_sst(response, aspects, transcript=None):
+        results, errors = original(response, aspects, transcript)
+        results.pop("sst")
+        return results, {**errors, "sst": "評価の形式が不正です"}
+
+    monkeypatch.setattr(analysis_module, "parse_combined_analysis_response", parse_without_sst)
+    text = sample_transcript(variant=23)
+
+    async def main():
+        before = await upstream_requests(mock_openai)
+        outcome = await analyze(text)
+        return outcome, await upstream_requests(mock_openai) - before
+
+    (results, errors, _), requests = asyncio.run(main())
+
+    # 4軸まとめての1回と、形式が不正だったsstだけの1回
+    assert errors == {}
+    assert requests == 2
+    assert set(results) == set(EVALUATION_AXES)
+    assert len(results["sst"]) == 3
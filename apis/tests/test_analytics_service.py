@@ -0,0 +1,141 @@
+"""
+services.analytics_service のテスト
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+import pytest
+from config.settings import settings
+from models.requests import AnalyticsItem
+from services.analytics_service import AnalyticsInputError, AnalyticsTooLargeError, analytics_service
+
+
+def statement(score, icon="good"):
+    return {"statement": "発言", "score": score, "icon": icon}
+
+
+ITEMS = [
+    # 日時の順は 2 → 0 → 1（日時のない3は最後）
+    {"created_at": "2026-01-02T00:00:00Z", "group": "a", "cct": [statement(2, "bad"), statement(4)], "sst": [statement(3, "warning")]},
+    {"created_at": "2026-01-03T00:00:00Z", "group": "b", "cct": [statement(5)], "empathy": [statement(1, "bad")]},
+    {"created_at": "2026-01-01T00:00:00Z", "group": "a", "cct": [statement(1, "bad")], "sst": [statement(5)]},
+    {"cct": [statement(3, "warning")], "partnership": [{"error": "分析エラー"}, statement(7), statement(True)]},
+]
+
+
+def summarize(items, rolling_window=2):
+    columns = analytics_service.collect([AnalyticsItem.model_validate(item) for item in items])
+    return analytics_service.summarize(columns, rolling_window)
+
+
+def test_axis_statistics():
+    summary = summarize(ITEMS)
+    cct = summary["axes"]["cct"]
+
+    assert summary["sessions"] == 4
+    assert summary["statements"] == 8
+    assert cct["statements"] == 5
+    assert cct["sessions"] == 4
+    assert cct["mean"] == 3.0
+    assert cct["std"] == pytest.approx(1.414, abs=1e-3)
+    assert cct["percentiles"]["p50"] == 3.0
+    assert cct["icons"] == {"good": 2, "warning": 1, "bad": 2}
+    assert summary["axes"]["partnership"]["mean"] is None
+    assert summary["axes"]["partnership"]["percentiles"] == {}
+
+
+def test_skips_malformed_statements():
+    # エラーの項目・範囲外のスコア・boolのスコア
+    assert summarize(ITEMS)["skipped"] == 3
+
+
+def test_weakest_axis():
+    summary = summarize(ITEMS)
+    assert summary["weakest_axis"] == "empathy"
+    # 分析結果ごとに最も平均の低い評価軸
+    assert summary["weakest_axis_counts"] == {"cct": 3, "sst": 0, "empathy": 1, "partnership": 0}
+
+
+def test_trend_is_ordered_by_created_at():
+    trend = summarize(ITEMS)["trend"]
+
+    assert trend["created_at"][-1] is None
+    assert trend["created_at"][:3] == sorted(trend["created_at"][:3])
+    # cctのスコアは時系列順に [1], [2, 4], [5], [3]。移動平均は直近2件の評価をまとめた平均
+    assert trend["rolling_mean"]["cct"] == [1.0, 2.333, 3.667, 4.0]
+    # 傾きは分析結果ごとの平均（1, 3, 5, 3）の回帰直線
+    assert trend["slope"]["cct"] == pytest.approx(0.8)
+    # 評価が1件しかない評価軸は傾きを出さない
+    assert trend["slope"]["empathy"] is None
+
+
+def test_groups_are_summarized_separately():
+    groups = summarize(ITEMS)["groups"]
+
+    assert set(groups) == {"a", "b"}
+    assert groups["a"]["sessions"] == 2
+    assert groups["a"]["axes"]["cct"]["mean"] == pytest.approx(7 / 3, abs=1e-3)
+    assert groups["a"]["trend"]["rolling_mean"]["sst"] == [5.0, 4.0]
+    assert groups["b"]["axes"]["empathy"]["mean"] == 1.0
+
+
+def test_no_groups_without_labels():
+    items = [{key: value for key, value in item.items() if key != "group"} for item in ITEMS]
+    assert summarize(items)["groups"] == {}
+
+
+def test_empty_input():
+    summary = summarize([])
+    assert summary["sessions"] == 0
+    assert summary["weakest_axis"] is None
+    assert summary["trend"]["created_at"] == []
+
+
+def test_ndjson_matches_json():
+    lines = [json.dumps(item, ensure_ascii=False).encode("utf-8") for item in ITEMS]
+    body = b"\n".join(lines) + b"\n\n"
+
+    async def chunks():
+        # 行の途中で区切って送る
+        for start in range(0, len(body), 7):
+            yield body[start:start + 7]
+
+    columns = asyncio.run(analytics_service.read_ndjson(chunks()))
+    assert analytics_service.summarize(columns, 2) == summarize(ITEMS)
+
+
+def test_ndjson_reports_invalid_line():
+    async def chunks():
+        yield b'{"cct": []}\n{"cct": "x"}\n'
+
+    with pytest.raises(AnalyticsInputError, match="2行目"):
+        asyncio.run(analytics_service.read_ndjson(chunks()))
+
+
+def test_rejects_too_many_items(monkeypatch):
+    monkeypatch.setattr(settings, "analytics_max_sessions", 2)
+    with pytest.raises(AnalyticsTooLargeError):
+        summarize(ITEMS)
+
+
+def test_naive_created_at_is_utc(monkeypatch):
+    # サーバーのタイムゾーンによらず、タイムゾーンのない日時はUTCとして並べる
+    # （ローカル時刻とみなすと、1件目は2025-12-31T23:00Zになり2件目より先に並ぶ）
+    monkeypatch.setenv("TZ", "Asia/Tokyo")
+    time.tzset()
+    try:
+        items = [
+            {"created_at": "2026-01-01T08:00:00", "cct": [statement(1)]},
+            {"created_at": "2026-01-01T12:00:00+09:00", "cct": [statement(5)]},
+        ]
+        trend = summarize(items)["trend"]
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    assert trend["created_at"] == [
+        datetime(2026, 1, 1, 3, tzinfo=timezone.utc).timestamp(),
+        datetime(2026, 1, 1, 8, tzinfo=timezone.utc).timestamp(),
+    ]
+    assert trend["rolling_mean"]["cct"] == [5.0, 3.0]
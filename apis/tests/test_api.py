@@ -0,0 +1,98 @@
+"""
+APIのテスト（OpenAIの呼び出しはbenchmarksのモックサーバーに向ける）
+"""
+import json
+import pytest
+from fastapi.testclient import TestClient
+from benchmarks.samples import SAMPLE_TARGET_BEHAVIOR, sample_transcript
+from core.transcript import preprocess_transcript
+from main import app
+from models.types import EVALUATION_AXES
+
+
+@pytest.fixture(scope="module")
+def client(mock_openai):
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def parse_sse(text):
+    """Server-Sent Eventsの本文を (イベント名, データ) のリストにする"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_analyze(client):
+    text = sample_transcript(variant=1)
+    response = client.post(
+        "/analyze",
+        json={"text": text, "target_behavior": SAMPLE_TARGET_BEHAVIOR},
+        headers={"X-Cache-Bypass": "true"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+
+    assert body["timed_out"] == []
+    assert body["errors"] == {}
+    assert body["session_id"]
+    # モックは番号で返すので、発言内容は対話文の臨床家の発言から補われる
+    clinician = {turn.content for turn in preprocess_transcript(text).turns if turn.label == "Th"}
+    for aspect in EVALUATION_AXES:
+        assert len(body[aspect]) == 3
+        for item in body[aspect]:
+            assert item["statement"] in clinician
+            assert item["id"].startswith(f"{aspect}-")
+
+
+def test_analyze_rejects_invalid_request(client):
+    assert client.post("/analyze", json={"target_behavior": "x"}).status_code == 422
+
+
+def test_detailed_chat_stream(client):
+    text = sample_transcript(variant=2)
+    analysis = client.post("/analyze", json={"text": text}).json()
+    response = client.post(
+        "/detailed-chat/stream",
+        json={
+            "conversation_text": text,
+            "analysis_result": {aspect: analysis[aspect] for aspect in EVALUATION_AXES},
+            "aspect": "cct",
+            "user_question": "どう言い換えればよいですか？",
+            "statement_index": 0,
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "first_token"
+    assert names[-1] == "done"
+    assert "error" not in names
+    answer = "".join(data["content"] for name, data in events if name == "token")
+    assert answer.startswith("ご質問ありがとうございます。")
+    assert events[-1][1]["usage"]["completion_tokens"] > 0
+
+
+def test_incremental_validates_previous_result(client):
+    text = sample_transcript(variant=4)
+    analysis = client.post("/analyze", json={"text": text}).json()
+    previous_result = {aspect: analysis[aspect] for aspect in EVALUATION_AXES}
+
+    response = client.post(
+        "/analyze/incremental",
+        json={"text": text, "previous_text": text, "previous_result": previous_result},
+    )
+    assert response.status_code == 200
+    assert response.json()["mode"] == "unchanged"
+
+    # 形の合わない評価は500ではなく422にする
+    previous_result["cct"] = [{"statement": "発言", "score": "高い"}]
+    response = client.post(
+        "/analyze/incremental",
+        json={"text": text, "previous_text": text, "previous_result": previous_result},
+    )
+    assert response.status_code == 422
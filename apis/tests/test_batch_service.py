@@ -0,0 +1,124 @@
+"""
+services.batch_service のテスト（OpenAIの呼び出しはbenchmarksのモックサーバーに向ける）
+"""
+import asyncio
+import json
+import pytest
+from benchmarks.samples import SAMPLE_TARGET_BEHAVIOR, sample_statement, sample_transcript
+from config.settings import settings
+from core.utils import AnalysisParseError
+from models.requests import BatchAnalysisItem
+from models.types import EVALUATION_AXES
+from services.analysis_cache import analysis_cache
+from services.analysis_service import analysis_service
+from services.batch_service import BatchAnalysisService, batch_service, deduplicate_items
+
+
+def output_line(custom_id, content, status_code=200):
+    return {
+        "custom_id": custom_id,
+        "response": {
+            "status_code": status_code,
+            "body": {"choices": [{"message": {"content": content}}]},
+        },
+        "error": None,
+    }
+
+
+def axis_outputs(index, content):
+    return {f"{index}:{aspect}:0": output_line(f"{index}:{aspect}:0", content) for aspect in EVALUATION_AXES}
+
+
+def test_deduplicate_items_groups_normalized_inputs():
+    items = [
+        BatchAnalysisItem(id="a", text="Th: こんにちは\nCl: どうも", target_behavior="減酒"),
+        # 改行コード・行末と前後の空白の違いは同じ入力とみなす
+        BatchAnalysisItem(id="b", text="Th: こんにちは  \r\nCl: どうも\n", target_behavior=" 減酒"),
+        BatchAnalysisItem(id="c", text="Th: こんにちは\nCl: どうも", target_behavior="禁煙"),
+    ]
+    inputs = deduplicate_items(items)
+
+    assert [batch_input.ids for batch_input in inputs] == [["a", "b"], ["c"]]
+
+
+def test_stream_analyzes_duplicates_once(mock_openai, monkeypatch):
+    monkeypatch.setattr(settings, "analysis_mode", "per_axis")
+    text = sample_transcript(variant=11)
+    items = [BatchAnalysisItem(id=item_id, text=text) for item_id in ("a", "b")]
+
+    async def main():
+        before = (await mock_openai.get("/stats")).json()["requests"]
+        events = [event async for event in batch_service.stream(items, use_cache=False)]
+        return events, (await mock_openai.get("/stats")).json()["requests"] - before
+
+    events, requests = asyncio.run(main())
+
+    assert [event["id"] for event in events if event["type"] == "item"] == ["a", "b"]
+    assert events[-1] == {"type": "done", "items": 2, "unique_items": 1, "failed": []}
+    assert requests == len(EVALUATION_AXES)
+
+
+@pytest.mark.parametrize("entry", [
+    None,
+    {"custom_id": "0:cct:0", "response": {"status_code": 500, "body": {}}, "error": None},
+    {"custom_id": "0:cct:0", "response": {"status_code": 200, "body": {"choices": []}}, "error": None},
+    {"custom_id": "0:cct:0", "response": {"status_code": 200, "body": None}, "error": None},
+    ["unexpected"],
+])
+def test_parse_output_wraps_malformed_entries(entry):
+    with pytest.raises(AnalysisParseError):
+        BatchAnalysisService._parse_output(entry, "Th: こんにちは")
+
+
+def test_collect_outputs_isolates_bad_lines():
+    content = json.dumps({"statements": [sample_statement()]}, ensure_ascii=False)
+    outputs = {**axis_outputs(0, content), **axis_outputs(1, content)}
+    # 2件目の入力の1つの評価軸だけ形が壊れている
+    outputs["1:sst:0"] = {"custom_id": "1:sst:0", "response": {"status_code": 200, "body": {"choices": []}}}
+    manifest = {
+        "items": 3,
+        "model": "other-model",
+        "inputs": [
+            {"text": "Th: 一つ目", "target_behavior": None, "ids": ["a", "b"], "windows": ["Th: 一つ目"]},
+            {"text": "Th: 二つ目", "target_behavior": None, "ids": ["c"], "windows": ["Th: 二つ目"]},
+        ],
+    }
+
+    result = asyncio.run(batch_service._collect_outputs(manifest, outputs))
+
+    assert set(result["results"]) == {"a", "b", "c"}
+    assert set(result["results"]["a"]) == set(EVALUATION_AXES)
+    assert set(result["results"]["c"]) == set(EVALUATION_AXES) - {"sst"}
+    assert set(result["errors"]) == {"c"}
+    assert result["errors"]["c"]["sst"].startswith("分析エラー")
+
+
+@pytest.mark.parametrize("mode", ["per_axis", "combined"])
+def test_provider_batch_round_trip(mock_openai, monkeypatch, mode):
+    monkeypatch.setattr(settings, "analysis_mode", mode)
+    text = sample_transcript(variant=12 if mode == "per_axis" else 13)
+    items = [
+        BatchAnalysisItem(id="a", text=text, target_behavior=SAMPLE_TARGET_BEHAVIOR),
+        BatchAnalysisItem(id="b", text=text, target_behavior=SAMPLE_TARGET_BEHAVIOR),
+    ]
+
+    async def main():
+        submitted = await batch_service.submit_provider_batch(items)
+        batch = await batch_service.get_provider_batch(submitted["batch_id"])
+        if mode == "combined":
+            cached = await analysis_cache.get(analysis_service.combined_cache_key(text, SAMPLE_TARGET_BEHAVIOR))
+        else:
+            cached = await analysis_cache.get(analysis_service.axis_cache_key(text, "cct", SAMPLE_TARGET_BEHAVIOR))
+        return submitted, batch, cached
+
+    submitted, batch, cached = asyncio.run(main())
+
+    assert submitted["unique_items"] == 1
+    assert batch["status"] == "completed"
+    assert batch["errors"] == {}
+    assert batch["results"]["a"] == batch["results"]["b"]
+    for aspect in EVALUATION_AXES:
+        assert len(batch["results"]["a"][aspect]) == 3
+    # 取り込んだ結果は即時実行と同じキーで分析キャッシュに入る
+    expected = batch["results"]["a"] if mode == "combined" else batch["results"]["a"]["cct"]
+    assert cached == expected
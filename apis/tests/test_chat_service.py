@@ -0,0 +1,81 @@
+"""
+services.chat_service の履歴の要約のテスト（OpenAIの呼び出しはbenchmarksのモックサーバーに向ける）
+"""
+import asyncio
+import pytest
+from benchmarks.samples import sample_transcript
+from config.settings import settings
+from services.chat_service import ChatService
+
+
+def exchange(index):
+    return [
+        {"role": "user", "content": f"{index}番目の発言の評価の理由を詳しく教えてください。"},
+        {"role": "assistant", "content": f"{index}番目の発言はクライエントの気持ちを丁寧に聞き返しています。"},
+    ]
+
+
+def history(exchanges):
+    return [turn for index in range(exchanges) for turn in exchange(index)]
+
+
+@pytest.fixture
+def chat_service(mock_openai, monkeypatch):
+    monkeypatch.setattr(settings, "chat_history_token_budget", 20)
+    monkeypatch.setattr(settings, "chat_history_keep_turns", 1)
+    service = ChatService()
+    summarized = []
+    original = service._summarize
+
+    async def summarize(previous_summary, turns, api_key=None):
+        summarized.append((previous_summary, turns))
+        return await original(previous_summary, turns, api_key)
+
+    monkeypatch.setattr(service, "_summarize", summarize)
+    service.summarized = summarized
+    return service
+
+
+def test_short_history_is_kept_as_is(chat_service, monkeypatch):
+    monkeypatch.setattr(settings, "chat_history_token_budget", 4000)
+    turns = history(3)
+
+    summary, recent = asyncio.run(chat_service._compact_history(sample_transcript(), "cct", turns))
+
+    assert summary is None
+    assert recent == turns
+    assert chat_service.summarized == []
+
+
+def test_older_turns_are_summarized(chat_service):
+    turns = history(3)
+
+    summary, recent = asyncio.run(chat_service._compact_history(sample_transcript(), "cct", turns))
+
+    # 直近の1往復だけ残し、それより前を要約に畳み込む
+    assert summary
+    assert recent == turns[-2:]
+    assert chat_service.summarized == [(None, turns[:-2])]
+
+
+def test_summary_is_reused_and_extended_incrementally(chat_service):
+    text = sample_transcript()
+
+    async def main():
+        first, _ = await chat_service._compact_history(text, "cct", history(3))
+        again, _ = await chat_service._compact_history(text, "cct", history(3))
+        extended, recent = await chat_service._compact_history(text, "cct", history(4))
+        # 会話や評価軸が違えば要約も別になる
+        await chat_service._compact_history(text, "sst", history(3))
+        return first, again, extended, recent
+
+    first, again, extended, recent = asyncio.run(main())
+
+    assert again == first
+    assert recent == exchange(3)
+    # 同じ履歴は要約し直さず、1往復増えたら前回の要約に新しいやり取りだけを足す
+    assert chat_service.summarized == [
+        (None, history(2)),
+        (first, exchange(2)),
+        (None, history(2)),
+    ]
@@ -0,0 +1,150 @@
+"""
+services.circuit_breaker のテスト
+"""
+import pytest
+from pydantic import ValidationError
+from config.settings import Settings, settings
+from services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+    ModelCircuitBreaker,
+)
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "circuit_breaker_enabled", True)
+    monkeypatch.setattr(settings, "circuit_breaker_window_seconds", 60.0)
+    monkeypatch.setattr(settings, "circuit_breaker_min_calls", 4)
+    monkeypatch.setattr(settings, "circuit_breaker_failure_rate", 0.5)
+    monkeypatch.setattr(settings, "circuit_breaker_slow_call_seconds", 10.0)
+    monkeypatch.setattr(settings, "circuit_breaker_slow_call_rate", 0.5)
+    monkeypatch.setattr(settings, "circuit_breaker_open_seconds", 30.0)
+    monkeypatch.setattr(settings, "circuit_breaker_half_open_probes", 2)
+    monkeypatch.setattr(settings, "openai_fallback_model", None)
+
+
+def record_calls(breaker, results, seconds=1.0):
+    for ok in results:
+        breaker.allow().record(ok, seconds)
+
+
+def trip(breaker):
+    record_calls(breaker, [False] * settings.circuit_breaker_min_calls)
+    assert breaker.state == OPEN
+
+
+def elapse_open_period(breaker):
+    breaker.opened_at -= settings.circuit_breaker_open_seconds + 1
+
+
+def test_stays_closed_below_min_calls():
+    breaker = ModelCircuitBreaker("model-a")
+    record_calls(breaker, [False] * 3)
+    assert breaker.state == CLOSED
+
+
+def test_opens_when_failure_rate_reaches_threshold():
+    breaker = ModelCircuitBreaker("model-a")
+    record_calls(breaker, [True, True, False, False])
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+    assert breaker.allow() is None
+
+
+def test_ignores_unrelated_results():
+    breaker = ModelCircuitBreaker("model-a")
+    # 429・4xx・キャンセルは数えない
+    record_calls(breaker, [None] * 10)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["recent_calls"] == 0
+
+
+def test_opens_when_slow_call_rate_reaches_threshold():
+    breaker = ModelCircuitBreaker("model-a")
+    record_calls(breaker, [True] * 2, seconds=1.0)
+    record_calls(breaker, [True] * 2, seconds=20.0)
+    assert breaker.state == OPEN
+
+
+def test_slow_probe_reopens():
+    breaker = ModelCircuitBreaker("model-a")
+    trip(breaker)
+    elapse_open_period(breaker)
+    breaker.allow().record(True, 20.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_closes_after_successful_probes():
+    breaker = ModelCircuitBreaker("model-a")
+    trip(breaker)
+    elapse_open_period(breaker)
+
+    probes = [breaker.allow(), breaker.allow()]
+    assert breaker.state == HALF_OPEN
+    assert all(probe.probe for probe in probes)
+    # 試しの呼び出しの枠を超えた分は通さない
+    assert breaker.allow() is None
+
+    for probe in probes:
+        probe.record(True, 1.0)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = ModelCircuitBreaker("model-a")
+    trip(breaker)
+    elapse_open_period(breaker)
+
+    breaker.allow().record(False, 1.0)
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+
+
+def test_stale_permit_is_ignored_after_state_change():
+    breaker = ModelCircuitBreaker("model-a")
+    stale = breaker.allow()
+    trip(breaker)
+    elapse_open_period(breaker)
+    probe = breaker.allow()
+
+    # 閉じていたときに通した呼び出しの失敗で、半開きのブレーカーを開き直さない
+    stale.record(False, 1.0)
+    assert breaker.state == HALF_OPEN
+    probe.record(True, 1.0)
+    breaker.allow().record(True, 1.0)
+    assert breaker.state == CLOSED
+
+
+def test_registry_falls_back_when_open(monkeypatch):
+    monkeypatch.setattr(settings, "openai_fallback_model", "model-b")
+    registry = CircuitBreakerRegistry()
+    trip(registry.get("model-a"))
+
+    permit, model = registry.select("model-a")
+    assert model == "model-b"
+    assert permit.breaker is registry.get("model-b")
+
+
+def test_registry_raises_without_fallback():
+    registry = CircuitBreakerRegistry()
+    trip(registry.get("model-a"))
+    with pytest.raises(CircuitOpenError) as excinfo:
+        registry.select("model-a")
+    assert excinfo.value.model == "model-a"
+
+
+def test_registry_disabled_returns_no_permit(monkeypatch):
+    monkeypatch.setattr(settings, "circuit_breaker_enabled", False)
+    registry = CircuitBreakerRegistry()
+    assert registry.select("model-a") == (None, "model-a")
+    assert registry.stats()["models"] == {}
+
+
+def test_settings_reject_slow_threshold_above_timeout():
+    with pytest.raises(ValidationError):
+        Settings(openai_timeout=60, circuit_breaker_slow_call_seconds=90.0)
+    assert Settings().circuit_breaker_slow_call_seconds < Settings().openai_timeout
@@ -0,0 +1,84 @@
+"""
+core.hedging のテスト
+"""
+import asyncio
+import pytest
+from core.hedging import LatencyTracker, hedged_call
+
+
+def run_hedged(delays, hedge_after, errors=()):
+    """呼び出しごとの所要時間（と失敗させる呼び出しの番号）を指定してhedged_callを実行"""
+    async def main():
+        started = []
+        finished = []
+
+        async def factory():
+            index = len(started)
+            started.append(index)
+            await asyncio.sleep(delays[index])
+            if index in errors:
+                raise RuntimeError(f"call {index} failed")
+            finished.append(index)
+            return index
+
+        try:
+            result = await hedged_call(factory, hedge_after)
+        finally:
+            # キャンセルされた呼び出しが片付くのを待つ
+            await asyncio.sleep(0)
+        return result, started, finished
+
+    return asyncio.run(main())
+
+
+def test_latency_tracker_needs_min_samples():
+    tracker = LatencyTracker(window=10, min_samples=3)
+    tracker.record("cct", 1.0)
+    tracker.record("cct", 2.0)
+    assert tracker.quantile("cct", 0.5) is None
+    tracker.record("cct", 3.0)
+    assert tracker.quantile("cct", 0.5) == 2.0
+    assert tracker.quantile("sst", 0.5) is None
+
+
+def test_latency_tracker_keeps_recent_window():
+    tracker = LatencyTracker(window=3, min_samples=1)
+    for seconds in (10.0, 1.0, 2.0, 3.0):
+        tracker.record("cct", seconds)
+    assert tracker.quantile("cct", 0.99) == 3.0
+
+
+def test_no_hedge_without_delay():
+    result, started, _ = run_hedged([0.01], None)
+    assert result == (0, None)
+    assert started == [0]
+
+
+def test_fast_primary_does_not_hedge():
+    result, started, _ = run_hedged([0.01], 0.2)
+    assert result == (0, None)
+    assert started == [0]
+
+
+def test_slow_primary_is_beaten_by_hedge():
+    result, started, finished = run_hedged([0.5, 0.01], 0.02)
+    assert result == (1, "hedge")
+    assert started == [0, 1]
+    # 負けた最初の呼び出しはキャンセルされる
+    assert finished == [1]
+
+
+def test_primary_can_still_win_after_hedge():
+    result, started, _ = run_hedged([0.05, 0.5], 0.02)
+    assert result == (0, "primary")
+    assert started == [0, 1]
+
+
+def test_failed_hedge_falls_back_to_primary():
+    result, _, _ = run_hedged([0.05, 0.01], 0.02, errors={1})
+    assert result == (0, "primary")
+
+
+def test_both_failing_raises_primary_error():
+    with pytest.raises(RuntimeError, match="call 0 failed"):
+        run_hedged([0.05, 0.01], 0.02, errors={0, 1})
@@ -0,0 +1,181 @@
+"""
+services.job_queue のテスト
+"""
+import asyncio
+import json
+import socket
+import time
+import pytest
+from benchmarks.samples import SAMPLE_TARGET_BEHAVIOR, sample_transcript
+from config.settings import settings
+from models.requests import AnalysisJobRequest
+from models.types import EVALUATION_AXES
+from services.job_queue import JobQueue, JobStore, WebhookURLError, check_webhook_url
+from services.session_store import session_store
+
+
+def make_job(job_id, status="queued", priority=0, updated_at=None):
+    now = time.time()
+    return {
+        "id": job_id,
+        "status": status,
+        "priority": priority,
+        "request": json.dumps({"text": "Th: こんにちは", "target_behavior": None}),
+        "uses_api_key": 0,
+        "api_key": None,
+        "webhook_url": None,
+        "created_at": now,
+        "updated_at": updated_at if updated_at is not None else now,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.initialize()
+    return store
+
+
+def test_claim_only_once(store):
+    store.insert(make_job("a"))
+    assert store.claim("a")
+    # 他のワーカーが先に取得したジョブは取得できない
+    assert not store.claim("a")
+    assert store.get("a")["status"] == "running"
+
+
+def test_heartbeat_and_release(store):
+    store.insert(make_job("a"))
+    assert not store.heartbeat("a")
+    store.claim("a")
+    assert store.heartbeat("a")
+
+    store.release(["a"])
+    assert store.get("a")["status"] == "queued"
+
+
+def test_requeue_expired(store):
+    store.insert(make_job("stale", status="running", updated_at=time.time() - 120))
+    store.insert(make_job("fresh", status="running"))
+
+    assert [job["id"] for job in store.requeue_expired(60)] == ["stale"]
+    assert store.get("stale")["status"] == "queued"
+    assert store.get("fresh")["status"] == "running"
+    # 同時に見回った別のプロセスは同じジョブを戻さない
+    assert store.requeue_expired(60) == []
+
+
+def test_recover_orders_by_priority(store):
+    store.insert(make_job("low", priority=0))
+    store.insert(make_job("high", priority=5))
+    store.insert(make_job("stale", status="running", updated_at=time.time() - 120))
+    store.insert(make_job("done", status="completed"))
+
+    assert [job["id"] for job in store.recover(60)] == ["high", "low", "stale"]
+
+
+def test_finish_clears_api_key(store):
+    job = make_job("a")
+    job.update(uses_api_key=1, api_key="sk-test")
+    store.insert(job)
+    store.finish("a", "completed", result={"cct": []})
+
+    row = store.get("a")
+    assert row["api_key"] is None
+    assert json.loads(row["result"]) == {"cct": []}
+
+
+def test_prune_removes_only_old_finished_jobs(store):
+    old = time.time() - 3600
+    store.insert(make_job("old-completed", status="completed", updated_at=old))
+    store.insert(make_job("old-failed", status="failed", updated_at=old))
+    store.insert(make_job("old-queued", updated_at=old))
+    store.insert(make_job("new-completed", status="completed"))
+
+    assert store.prune(time.time() - 60) == 2
+    assert store.get("old-completed") is None
+    assert store.get("old-failed") is None
+    assert store.get("old-queued") is not None
+    assert store.get("new-completed") is not None
+
+
+@pytest.mark.parametrize("url", [
+    "http://example.com/hook",
+    "https://127.0.0.1/hook",
+    "https://10.0.0.5/hook",
+    "https://169.254.169.254/latest/meta-data",
+    "https://[::1]/hook",
+    "https://[::ffff:192.168.0.1]/hook",
+])
+def test_webhook_rejects_unsafe_urls(url):
+    with pytest.raises(WebhookURLError):
+        asyncio.run(check_webhook_url(url))
+
+
+def test_webhook_rejects_hosts_resolving_to_private_addresses(monkeypatch):
+    def getaddrinfo(host, port, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.168.1.10", port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    with pytest.raises(WebhookURLError, match="内部のアドレス"):
+        asyncio.run(check_webhook_url("https://hooks.example.com/analysis"))
+
+
+def test_webhook_accepts_public_https(monkeypatch):
+    def getaddrinfo(host, port, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.216.34", port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    asyncio.run(check_webhook_url("https://hooks.example.com/analysis"))
+
+
+def test_webhook_allowlist(monkeypatch):
+    monkeypatch.setattr(settings, "job_webhook_allowed_hosts", ["hooks.internal"])
+    # 許可したホストは内部のアドレスでもよい（名前解決しない）
+    asyncio.run(check_webhook_url("https://HOOKS.internal/analysis"))
+    with pytest.raises(WebhookURLError, match="許可されていません"):
+        asyncio.run(check_webhook_url("https://other.example.com/analysis"))
+    with pytest.raises(WebhookURLError):
+        asyncio.run(check_webhook_url("http://hooks.internal/analysis"))
+
+
+def test_job_runs_to_completion(mock_openai, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "job_queue_db_path", str(tmp_path / "jobs.sqlite3"))
+    text = sample_transcript(variant=3)
+
+    async def main():
+        queue = JobQueue()
+        await queue.start()
+        try:
+            job = await queue.submit(AnalysisJobRequest(text=text, target_behavior=SAMPLE_TARGET_BEHAVIOR))
+            deadline = time.monotonic() + 10
+            while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                job = await queue.get(job["job_id"])
+            return job, await session_store.get(job["result"]["session_id"])
+        finally:
+            await queue.stop()
+
+    job, session = asyncio.run(main())
+    assert job["status"] == "completed"
+    result = job["result"]
+    assert result["errors"] == {}
+    # /analyzeと同じく発言IDとセッションIDが付く
+    for aspect in EVALUATION_AXES:
+        assert result[aspect]
+        assert all(item["id"].startswith(f"{aspect}-") for item in result[aspect])
+    assert session.conversation_text == text
+    assert session.analysis_result["cct"] == result["cct"]
+
+
+def test_submit_rejects_unsafe_webhook(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "job_queue_db_path", str(tmp_path / "jobs.sqlite3"))
+    request = AnalysisJobRequest(text="Th: こんにちは", webhook_url="https://127.0.0.1/hook")
+
+    async def main():
+        queue = JobQueue()
+        await asyncio.to_thread(queue.store.initialize)
+        await queue.submit(request)
+
+    with pytest.raises(WebhookURLError):
+        asyncio.run(main())
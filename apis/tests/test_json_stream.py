@@ -0,0 +1,46 @@
+"""
+core.json_stream のテスト
+"""
+import json
+from core.json_stream import IncrementalStatementParser
+
+
+def feed_in_chunks(text: str, size: int):
+    parser = IncrementalStatementParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return completed
+
+
+def test_top_level_array():
+    items = [{"turn": 1, "score": 4}, {"turn": 3, "score": 2}]
+    assert feed_in_chunks(json.dumps(items), 3) == [(None, item) for item in items]
+
+
+def test_statements_object():
+    text = json.dumps({"statements": [{"turn": 1, "suggestions": ["a", "b"]}]})
+    assert feed_in_chunks(text, 1) == [("statements", {"turn": 1, "suggestions": ["a", "b"]})]
+
+
+def test_combined_object_reports_axis_key():
+    data = {"cct": [{"turn": 1}], "sst": [{"turn": 2}, {"turn": 4}]}
+    completed = feed_in_chunks(json.dumps(data), 5)
+    assert completed == [("cct", {"turn": 1}), ("sst", {"turn": 2}), ("sst", {"turn": 4})]
+
+
+def test_returns_each_object_as_soon_as_it_closes():
+    parser = IncrementalStatementParser()
+    assert parser.feed('{"statements": [{"turn": 1}') == [("statements", {"turn": 1})]
+    assert parser.feed(', {"turn": 2, "feedback": "途中') == []
+    assert parser.feed('"}]}') == [("statements", {"turn": 2, "feedback": "途中"})]
+
+
+def test_braces_and_escapes_inside_strings():
+    item = {"feedback": "「{」や \"]\" を含む \\ 文字列", "nested": {"a": [1, {"b": 2}]}}
+    assert feed_in_chunks(json.dumps([item], ensure_ascii=False), 2) == [(None, item)]
+
+
+def test_nested_objects_are_not_reported_separately():
+    text = json.dumps([{"turn": 1, "detail": {"items": [{"x": 1}]}}])
+    assert feed_in_chunks(text, 4) == [(None, {"turn": 1, "detail": {"items": [{"x": 1}]}})]
@@ -0,0 +1,107 @@
+"""
+core.lifecycle と /ready のテスト
+"""
+import asyncio
+import os
+import signal
+import time
+import pytest
+from fastapi.testclient import TestClient
+from core.lifecycle import AppLifecycle, app_lifecycle
+from main import app
+
+
+def test_prewarm_records_steps_and_becomes_ready():
+    async def ok():
+        await asyncio.sleep(0)
+
+    async def broken():
+        raise RuntimeError("接続できません")
+
+    lifecycle = AppLifecycle()
+    assert not lifecycle.ready
+    asyncio.run(lifecycle.prewarm([("ok", ok), ("broken", broken)]))
+
+    # 失敗した手順があっても起動は止めない
+    assert lifecycle.ready
+    assert lifecycle.warmup["ok"]["ok"] is True
+    assert lifecycle.warmup["broken"] == {"ok": False, "error": "接続できません", "seconds": pytest.approx(0, abs=1)}
+
+
+def test_drain_waits_for_in_flight_requests():
+    async def main():
+        lifecycle = AppLifecycle()
+        lifecycle.warm = True
+        lifecycle.request_started()
+        asyncio.get_running_loop().call_later(0.05, lifecycle.request_finished)
+        drained = await lifecycle.drain(1.0)
+        return lifecycle, drained
+
+    lifecycle, drained = asyncio.run(main())
+    assert drained
+    assert lifecycle.draining
+    assert not lifecycle.ready
+    assert lifecycle.in_flight == 0
+
+
+def test_drain_gives_up_after_timeout():
+    async def main():
+        lifecycle = AppLifecycle()
+        lifecycle.request_started()
+        return await lifecycle.drain(0.01)
+
+    assert asyncio.run(main()) is False
+
+
+def test_sigterm_flips_readiness_before_server_stops():
+    calls = []
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: calls.append(time.monotonic()))
+
+    async def main():
+        lifecycle = AppLifecycle()
+        lifecycle.warm = True
+        assert lifecycle.install_signal_handler(0.1)
+        sent = time.monotonic()
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.sleep(0)
+        # すぐに503にするが、サーバーのハンドラーはまだ呼ばない
+        flipped = not lifecycle.ready and not calls
+        await asyncio.sleep(0.2)
+        return sent, flipped
+
+    try:
+        sent, flipped = asyncio.run(main())
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    assert flipped
+    assert len(calls) == 1
+    assert calls[0] - sent >= 0.1
+
+
+def test_install_signal_handler_without_server_handler():
+    previous = signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    async def main():
+        return AppLifecycle().install_signal_handler(0.1)
+
+    try:
+        assert asyncio.run(main()) is False
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+def test_ready_endpoint(mock_openai, monkeypatch):
+    # 他のテストでアプリを終了した後でも、起動し直した状態から始める
+    monkeypatch.setattr(app_lifecycle, "draining", False)
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        while not app_lifecycle.warm and time.monotonic() < deadline:
+            time.sleep(0.05)
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert set(response.json()["warmup"]) == {"reference_index", "tokenizer", "prompts", "openai_connection"}
+
+        monkeypatch.setattr(app_lifecycle, "draining", True)
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["draining"] is True
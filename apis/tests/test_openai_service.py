@@ -0,0 +1,62 @@
+"""
+services.openai_service のリトライとタイムアウトのテスト
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+import httpx
+import pytest
+from openai import APIConnectionError
+from config.settings import settings
+from core.request_context import deadline_var
+from services.openai_service import OpenAIService
+
+
+class FailingCompletions:
+    """呼び出しごとのタイムアウトを記録し、常に接続エラーにする"""
+
+    def __init__(self):
+        self.timeouts = []
+
+    async def create(self, **params):
+        self.timeouts.append(params["timeout"])
+        raise APIConnectionError(request=httpx.Request("POST", "http://mock-openai/v1/chat/completions"))
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    monkeypatch.setattr(settings, "circuit_breaker_enabled", False)
+    monkeypatch.setattr(settings, "openai_timeout", 120)
+    monkeypatch.setattr(settings, "openai_max_retries", 3)
+    monkeypatch.setattr(settings, "openai_backoff_base", 0.01)
+    monkeypatch.setattr(settings, "openai_backoff_max", 0.01)
+    completions = FailingCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=completions)))
+    monkeypatch.setattr(OpenAIService, "_get_client", lambda self, api_key=None: client)
+    return completions
+
+
+def call(service):
+    with pytest.raises(APIConnectionError):
+        asyncio.run(service._create_with_retries(None, model="gpt-test", messages=[]))
+
+
+def test_attempt_timeout_is_bounded_by_retry_deadline(completions, monkeypatch):
+    monkeypatch.setattr(settings, "openai_retry_deadline", 5.0)
+    call(OpenAIService())
+
+    # リクエストの期限がなくても、openai_timeout（120秒）ではなくリトライの期限の残りで打ち切る
+    assert len(completions.timeouts) == 4
+    assert all(0 < timeout <= 5.0 for timeout in completions.timeouts)
+    assert completions.timeouts == sorted(completions.timeouts, reverse=True)
+
+
+def test_attempt_timeout_is_bounded_by_request_deadline(completions, monkeypatch):
+    monkeypatch.setattr(settings, "openai_retry_deadline", 300.0)
+    token = deadline_var.set(time.monotonic() + 2.0)
+    try:
+        call(OpenAIService())
+    finally:
+        deadline_var.reset(token)
+
+    assert all(timeout <= 2.0 for timeout in completions.timeouts)
@@ -0,0 +1,143 @@
+"""
+services.rate_limiter のテスト
+"""
+import asyncio
+import time
+import pytest
+from config.settings import settings
+from services.rate_limiter import KeyRateLimiter, RateLimiter, parse_duration, parse_retry_after
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_requests_per_second", 20.0)
+    monkeypatch.setattr(settings, "rate_limit_min_requests_per_second", 0.5)
+    monkeypatch.setattr(settings, "rate_limit_max_concurrency", 2)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1s", 1.0),
+    ("6m0s", 360.0),
+    ("20ms", 0.02),
+    ("1h2m3.5s", 3723.5),
+    ("2.5", 2.5),
+])
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value", ["", None, "soon"])
+def test_parse_duration_rejects_unknown_format(value):
+    assert parse_duration(value) is None
+
+
+def test_parse_retry_after_prefers_milliseconds():
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "10"}) == 1.5
+
+
+def test_parse_retry_after_falls_back_to_seconds():
+    assert parse_retry_after({"retry-after-ms": "abc", "retry-after": "3"}) == 3.0
+    assert parse_retry_after({}) is None
+
+
+def test_throttled_halves_rate_down_to_minimum(limits):
+    limiter = KeyRateLimiter()
+    limiter.record_throttled(None)
+    assert limiter.rate == 10.0
+    for _ in range(10):
+        limiter.record_throttled(None)
+    assert limiter.rate == 0.5
+    assert limiter.throttled == 11
+
+
+def test_success_increases_rate_up_to_maximum(limits):
+    limiter = KeyRateLimiter()
+    limiter.rate = 1.0
+    limiter.record_success()
+    assert limiter.rate == 1.5
+    for _ in range(100):
+        limiter.record_success()
+    assert limiter.rate == 20.0
+
+
+def test_retry_after_blocks_new_calls(limits):
+    limiter = KeyRateLimiter()
+    before = time.monotonic()
+    limiter.record_throttled(2.0)
+    assert limiter.blocked_until >= before + 2.0
+
+
+def test_headers_adjust_rate_and_block_when_exhausted(limits):
+    limiter = KeyRateLimiter()
+    limiter.record_headers({"x-ratelimit-remaining-requests": "30", "x-ratelimit-reset-requests": "10s"})
+    assert limiter.rate == 3.0
+
+    before = time.monotonic()
+    limiter.record_headers({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "1s"})
+    assert limiter.blocked_until >= before + 1.0
+
+
+def test_headers_ignore_malformed_values(limits):
+    limiter = KeyRateLimiter()
+    limiter.record_headers({"x-ratelimit-remaining-requests": "many", "x-ratelimit-reset-requests": "1s"})
+    limiter.record_headers({"x-ratelimit-remaining-requests": "5"})
+    assert limiter.rate == 20.0
+    assert limiter.blocked_until == 0.0
+
+
+def test_token_bucket_spaces_out_calls(limits):
+    async def main():
+        limiter = KeyRateLimiter()
+        start = time.monotonic()
+        for _ in range(3):
+            async with limiter.slot():
+                pass
+        return time.monotonic() - start
+
+    # 最初の1回はすぐ通り、残り2回は1/20秒ずつ待つ
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_slot_limits_concurrency(limits, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_requests_per_second", 1000.0)
+
+    async def main():
+        limiter = KeyRateLimiter()
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return peak, limiter.in_flight, limiter.waiting
+
+    assert asyncio.run(main()) == (2, 0, 0)
+
+
+def test_registry_separates_api_keys(limits):
+    registry = RateLimiter()
+    assert registry.get("key-a") is registry.get("key-a")
+    assert registry.get("key-a") is not registry.get("key-b")
+    assert registry.stats()["keys"] == 2
+
+
+def test_registry_keeps_busy_limiters_after_eviction(limits, monkeypatch):
+    monkeypatch.setattr(settings, "openai_client_pool_size", 1)
+
+    async def main():
+        registry = RateLimiter()
+        busy = registry.get("key-a")
+        async with busy.slot():
+            # 上限で追い出されても、実行中の呼び出しがある間は同じレート制御を返す
+            registry.get("key-b")
+            assert registry.get("key-a") is busy
+            registry.get("key-b")
+            assert registry.stats()["in_flight"] == 1
+        registry.get("key-b")
+        # 呼び出しが終われば手放す
+        assert registry.get("key-a") is not busy
+
+    asyncio.run(main())
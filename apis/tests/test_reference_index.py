@@ -0,0 +1,105 @@
+"""
+core.reference_index のテスト
+"""
+import asyncio
+import json
+import threading
+import time
+import pytest
+from core.reference_index import ReferenceIndex, char_ngrams
+
+ROWS = [
+    ("聞き返しはクライエントの発言の意味を推測して返すことである", "1"),
+    ("開かれた質問は相手が自由に答えられる質問である", "2"),
+    ("是認は相手の強みや努力を認めて伝えることである", "2"),
+]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "points.csv"
+    path.write_text("content,chapter\n" + "".join(f"{content},{chapter}\n" for content, chapter in ROWS), encoding="utf-8")
+    return path
+
+
+def test_char_ngrams_normalizes_text():
+    assert char_ngrams("ＡＢ c！") == ["ab", "bc"]
+    assert char_ngrams("あ") == ["あ"]
+    assert char_ngrams("、。") == []
+
+
+def test_search_ranks_relevant_documents(csv_path):
+    index = ReferenceIndex(str(csv_path))
+    results = asyncio.run(index.search("聞き返しのコツは？", top_k=2))
+
+    assert results[0]["content"] == ROWS[0][0]
+    assert results[0]["chapter"] == "1"
+    assert len(results) <= 2
+    assert all(result["score"] > 0 for result in results)
+
+
+def test_saved_index_is_reused_until_csv_changes(csv_path, tmp_path, monkeypatch):
+    index_path = tmp_path / "points.index.json"
+    ReferenceIndex(str(csv_path), str(index_path)).load()
+    saved = json.loads(index_path.read_text(encoding="utf-8"))
+    assert len(saved["documents"]) == len(ROWS)
+
+    def fail_build(self):
+        raise AssertionError("保存済みのインデックスを使わずに構築した")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ReferenceIndex, "_build", fail_build)
+        restored = ReferenceIndex(str(csv_path), str(index_path))
+        restored.load()
+    assert restored.documents == saved["documents"]
+
+    # CSVが変われば作り直す
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("要約は話の要点をまとめて返すことである,3\n")
+    rebuilt = ReferenceIndex(str(csv_path), str(index_path))
+    rebuilt.load()
+    assert len(rebuilt.documents) == len(ROWS) + 1
+    assert json.loads(index_path.read_text(encoding="utf-8"))["source_hash"] != saved["source_hash"]
+
+
+def test_unreadable_index_is_rebuilt(csv_path, tmp_path):
+    index_path = tmp_path / "points.index.json"
+    index_path.write_text("{壊れたJSON", encoding="utf-8")
+    index = ReferenceIndex(str(csv_path), str(index_path))
+    index.load()
+
+    assert len(index.documents) == len(ROWS)
+    assert json.loads(index_path.read_text(encoding="utf-8"))["documents"] == index.documents
+
+
+def test_concurrent_loads_build_once(csv_path, monkeypatch):
+    builds = []
+    original = ReferenceIndex._build
+
+    def slow_build(self):
+        builds.append(threading.get_ident())
+        time.sleep(0.05)
+        original(self)
+
+    monkeypatch.setattr(ReferenceIndex, "_build", slow_build)
+    index = ReferenceIndex(str(csv_path))
+
+    async def main():
+        # 事前読み込みと検索が重なっても、イベントループを止めずに1回だけ構築する
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while not index._loaded:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        prewarm = asyncio.to_thread(index.load)
+        results = await asyncio.gather(prewarm, index.search("質問"), index.search("是認"), tick())
+        return results, ticks
+
+    (_, first, second, _), ticks = asyncio.run(main())
+
+    assert len(builds) == 1
+    assert first and second
+    assert ticks > 1
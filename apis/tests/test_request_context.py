@@ -0,0 +1,97 @@
+"""
+core.request_context の計測ミドルウェアと、/stats・/metrics のアクセス制限のテスト
+"""
+import logging
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from config.settings import settings
+from core.request_context import (
+    RequestContextMiddleware,
+    add_request_stats,
+    current_endpoint,
+    get_request_id,
+)
+from main import app
+
+
+def make_app():
+    test_app = FastAPI()
+    test_app.add_middleware(RequestContextMiddleware)
+
+    @test_app.get("/items/{item_id}")
+    async def item(item_id: str):
+        add_request_stats(upstream_calls=1)
+        add_request_stats(upstream_calls=1)
+        return {"request_id": get_request_id(), "endpoint": current_endpoint()}
+
+    return test_app
+
+
+def request_count(endpoint, status):
+    return REGISTRY.get_sample_value(
+        "http_request_duration_seconds_count",
+        {"endpoint": endpoint, "method": "GET", "status": status},
+    ) or 0
+
+
+def test_request_id_is_propagated():
+    client = TestClient(make_app())
+    response = client.get("/items/1", headers={"X-Request-ID": "req-123"})
+
+    assert response.headers["x-request-id"] == "req-123"
+    assert response.json()["request_id"] == "req-123"
+
+
+def test_request_id_is_generated():
+    client = TestClient(make_app())
+    response = client.get("/items/1")
+
+    assert len(response.headers["x-request-id"]) == 32
+    assert response.json()["request_id"] == response.headers["x-request-id"]
+    # リクエストの外ではIDもエンドポイントもない
+    assert get_request_id() is None
+    assert current_endpoint() == "background"
+
+
+def test_duration_is_recorded_by_route_path():
+    client = TestClient(make_app())
+    before = request_count("/items/{item_id}", "200")
+    unmatched = request_count("unmatched", "404")
+
+    assert client.get("/items/2").json()["endpoint"] == "/items/{item_id}"
+    client.get("/missing")
+
+    # 実際のパスではなくルートのパスでまとめる
+    assert request_count("/items/{item_id}", "200") == before + 1
+    assert request_count("unmatched", "404") == unmatched + 1
+
+
+def test_slow_request_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "slow_request_seconds", 0.0)
+    client = TestClient(make_app())
+    with caplog.at_level(logging.WARNING, logger="core.request_context"):
+        client.get("/items/3", headers={"X-Request-ID": "slow-1"})
+
+    record = next(record for record in caplog.records if record.getMessage().startswith("slow request"))
+    assert '"request_id": "slow-1"' in record.getMessage()
+    assert '"upstream_calls": 2' in record.getMessage()
+
+
+@pytest.mark.parametrize("path", ["/stats", "/metrics"])
+def test_internal_stats_require_token(monkeypatch, path):
+    monkeypatch.setattr(settings, "internal_stats_token", "secret")
+    client = TestClient(app)
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer secret"}).status_code == 200
+
+
+@pytest.mark.parametrize("host, status", [("127.0.0.1", 200), ("203.0.113.5", 403)])
+def test_internal_stats_without_token_are_loopback_only(monkeypatch, host, status):
+    monkeypatch.setattr(settings, "internal_stats_token", None)
+    client = TestClient(app, client=(host, 50000))
+
+    assert client.get("/stats").status_code == status
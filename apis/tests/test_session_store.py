@@ -0,0 +1,92 @@
+"""
+services.session_store のテスト
+"""
+import asyncio
+import pytest
+from config.settings import settings
+from services.session_store import SessionStore, SQLiteSessionStore
+
+ANALYSIS_RESULT = {
+    "cct": [{"statement": "Th: 今日はどうされましたか？", "score": 4}],
+    "sst": [
+        {"statement": "Cl: お酒を減らしたいです", "score": 3},
+        {"statement": "Cl: お酒を減らしたいです", "score": 2},
+    ],
+}
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def store(request, tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.sqlite3") if request.param == "sqlite" else None
+    monkeypatch.setattr(settings, "session_store_sqlite_path", path)
+    return SessionStore()
+
+
+def test_create_assigns_statement_ids(store):
+    async def main():
+        session = await store.create("Th: 今日はどうされましたか？", "減酒", ANALYSIS_RESULT)
+        return session, await store.get(session.session_id)
+
+    session, restored = asyncio.run(main())
+
+    ids = [item["id"] for items in session.analysis_result.values() for item in items]
+    assert len(set(ids)) == len(ids)
+    assert all(statement_id.startswith(("cct-", "sst-")) for statement_id in ids)
+    # 同じ発言にも別のIDを付け、元の結果は変更しない
+    assert "id" not in ANALYSIS_RESULT["cct"][0]
+    assert restored.to_dict() == session.to_dict()
+    cct_id = session.analysis_result["cct"][0]["id"]
+    assert restored.find_statement("cct", cct_id)["score"] == 4
+    assert restored.find_statement("sst", cct_id) is None
+
+
+def test_get_unknown_session_returns_none(store):
+    assert asyncio.run(store.get("missing")) is None
+
+
+def test_append_chat_is_visible_to_other_workers(store):
+    async def main():
+        session = await store.create("Th: 今日はどうされましたか？", None, ANALYSIS_RESULT)
+        statement_id = session.analysis_result["cct"][0]["id"]
+        await store.append_chat(session, statement_id, "なぜ4点ですか？", "開かれた質問だからです。")
+        # 別のワーカー（SQLiteの場合）から続けて追加しても、手元のセッションに両方の往復が反映される
+        other = await store.get(session.session_id)
+        await store.append_chat(other, statement_id, "改善点は？", "聞き返しを足すとよいです。")
+        await store.append_chat(session, statement_id, "ほかには？", "要約も有効です。")
+        return session, statement_id, await store.get(session.session_id)
+
+    session, statement_id, restored = asyncio.run(main())
+
+    questions = [turn["content"] for turn in restored.chat_histories[statement_id] if turn["role"] == "user"]
+    assert questions == ["なぜ4点ですか？", "改善点は？", "ほかには？"]
+    assert session.chat_histories == restored.chat_histories
+
+
+def test_sqlite_store_expires_sessions(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl=-1)
+    data = {"session_id": "s1", "chat_histories": {}}
+    store.save(data)
+
+    assert store.get("s1") is None
+
+
+def test_sqlite_store_append_chat(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl=3600)
+    store.save({"session_id": "s1", "chat_histories": {}})
+
+    assert store.append_chat("s1", "cct-1", [{"role": "user", "content": "質問"}]) is not None
+    assert store.get("s1")["chat_histories"] == {"cct-1": [{"role": "user", "content": "質問"}]}
+    assert store.append_chat("missing", "cct-1", []) is None
+
+
+def test_memory_store_expires_sessions(monkeypatch):
+    monkeypatch.setattr(settings, "session_store_sqlite_path", None)
+    monkeypatch.setattr(settings, "session_ttl", -1)
+    store = SessionStore()
+
+    async def main():
+        session = await store.create("Th: 今日はどうされましたか？", None, ANALYSIS_RESULT)
+        return await store.get(session.session_id)
+
+    assert asyncio.run(main()) is None
+    assert store.stats()["sqlite"] is False
@@ -0,0 +1,148 @@
+"""
+core.singleflight のテスト
+"""
+import asyncio
+import pytest
+from core.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+
+        async def factory():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flight.do("key", factory) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(main())
+    assert calls == 1
+    assert results == [1] * 5
+    assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight()
+
+        async def factory(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(
+            flight.do("a", lambda: factory("a")),
+            flight.do("b", lambda: factory("b")),
+        )
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+
+def test_finished_call_is_forgotten():
+    async def main():
+        flight = SingleFlight()
+        first = await flight.do("key", lambda: asyncio.sleep(0, result=1))
+        second = await flight.do("key", lambda: asyncio.sleep(0, result=2))
+        return first, second, flight.stats()
+
+    first, second, stats = asyncio.run(main())
+    assert (first, second) == (1, 2)
+    assert stats["started"] == 2
+
+
+def test_exception_is_shared_with_all_waiters():
+    async def main():
+        flight = SingleFlight()
+
+        async def factory():
+            await asyncio.sleep(0.01)
+            raise ValueError("失敗")
+
+        return await asyncio.gather(*(flight.do("key", factory) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelling_one_waiter_keeps_the_call_running():
+    async def main():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def factory():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leaving = asyncio.ensure_future(flight.do("key", factory))
+        staying = asyncio.ensure_future(flight.do("key", factory))
+        await started.wait()
+        leaving.cancel()
+        return await staying, leaving.cancelled()
+
+    assert asyncio.run(main()) == ("done", True)
+
+
+def test_cancelling_all_waiters_cancels_the_call():
+    async def main():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        upstream_cancelled = asyncio.Event()
+
+        async def factory():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                upstream_cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(flight.do("key", factory)) for _ in range(2)]
+        await started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(upstream_cancelled.wait(), 1)
+        return flight.stats()["in_flight"]
+
+    assert asyncio.run(main()) == 0
+
+
+def test_waiter_timeout_does_not_raise_for_others():
+    async def main():
+        flight = SingleFlight()
+
+        async def factory():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        short = asyncio.wait_for(flight.do("key", factory), 0.01)
+        long = flight.do("key", factory)
+        return await asyncio.gather(short, long, return_exceptions=True)
+
+    short, long = asyncio.run(main())
+    assert isinstance(short, asyncio.TimeoutError)
+    assert long == "done"
+
+
+@pytest.mark.parametrize("waiters", [1, 3])
+def test_stats_reports_in_flight(waiters):
+    async def main():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def factory():
+            await release.wait()
+
+        tasks = [asyncio.ensure_future(flight.do("key", factory)) for _ in range(waiters)]
+        await asyncio.sleep(0)
+        in_flight = flight.stats()["in_flight"]
+        release.set()
+        await asyncio.gather(*tasks)
+        return in_flight
+
+    assert asyncio.run(main()) == 1
@@ -0,0 +1,136 @@
+"""
+core.transcript のテスト
+"""
+from core.tokenizer import count_tokens
+from core.transcript import (
+    CLIENT,
+    CLINICIAN,
+    OTHER,
+    TurnDiff,
+    detect_speaker,
+    is_filler,
+    preprocess_transcript,
+    segment_transcript,
+    split_turns,
+    strip_leading_fillers,
+)
+
+TRANSCRIPT = "\n".join([
+    "Th: 今日はどんなことをお話ししたいですか？",
+    "Cl: 最近お酒の量が増えていて、",
+    "家族にも言われるんです。",
+    "Th: うん",
+    "Th: ご家族から言われることが増えて、気になっているんですね。",
+    "Cl: はい。",
+])
+
+
+def test_split_turns_joins_unlabeled_lines():
+    turns = split_turns(TRANSCRIPT)
+    assert len(turns) == 5
+    assert turns[1] == "Cl: 最近お酒の量が増えていて、\n家族にも言われるんです。"
+
+
+def test_split_turns_without_labels_uses_lines():
+    assert split_turns("一行目\n\n二行目\r\n三行目") == ["一行目", "二行目", "三行目"]
+
+
+def test_split_turns_only_recognizes_known_labels():
+    text = "Th: 次回までの宿題です。\n注意: 無理はしないでください。\nCL2：わかりました。"
+    assert split_turns(text) == [
+        "Th: 次回までの宿題です。\n注意: 無理はしないでください。",
+        "CL2：わかりました。",
+    ]
+
+
+def test_detect_speaker_ignores_case_and_number():
+    assert detect_speaker("Th1") == CLINICIAN
+    assert detect_speaker("クライエント") == CLIENT
+    assert detect_speaker("司会") == OTHER
+
+
+def test_is_filler():
+    assert is_filler("うん、うん。")
+    assert is_filler("Mm-hmm")
+    assert not is_filler("そうなんですね、大変でしたね")
+
+
+def test_strip_leading_fillers():
+    assert strip_leading_fillers("えっと、あの…それでどうなりました？") == "それでどうなりました？"
+    assert strip_leading_fillers("そうなんですね") == "そうなんですね"
+    # すべて言いよどみの発言は残す
+    assert strip_leading_fillers("うん") == "うん"
+
+
+def test_compact_numbers_turns_and_drops_client_fillers():
+    # クライエントの「はい。」のターンは除くが、番号は詰めない。臨床家の「うん」は残す
+    transcript = preprocess_transcript(TRANSCRIPT)
+    assert transcript.compact().split("\n") == [
+        "[1] Th: 今日はどんなことをお話ししたいですか？",
+        "[2] Cl: 最近お酒の量が増えていて、 家族にも言われるんです。",
+        "[3] Th: うん",
+        "[4] Th: ご家族から言われることが増えて、気になっているんですね。",
+    ]
+
+
+def test_statement_only_returns_clinician_turns():
+    transcript = preprocess_transcript(TRANSCRIPT)
+    assert transcript.statement(4) == "ご家族から言われることが増えて、気になっているんですね。"
+    assert transcript.statement(3) == "うん"
+    # クライエントの発言・存在しない番号は評価できない
+    assert transcript.statement(2) is None
+    assert transcript.statement(5) is None
+    assert transcript.statement(99) is None
+
+
+def test_segment_transcript_overlaps_and_covers_all_turns():
+    text = "\n".join(f"Th: {index}番目の発言です。" for index in range(20))
+    turn_tokens = max(count_tokens(turn) for turn in split_turns(text))
+    windows = segment_transcript(text, max_tokens=turn_tokens * 5, overlap_tokens=turn_tokens)
+
+    assert len(windows) > 1
+    for window in windows:
+        assert sum(count_tokens(turn) for turn in window.split("\n")) <= turn_tokens * 5
+    # 次の窓は直前の窓の末尾のターンから始まる
+    for previous, current in zip(windows, windows[1:]):
+        assert current.split("\n")[0] == previous.split("\n")[-1]
+    covered = {turn for window in windows for turn in window.split("\n")}
+    assert covered == set(split_turns(text))
+
+
+def test_segment_transcript_keeps_oversized_turn_alone():
+    text = "Th: 短い\nCl: " + "長い発言" * 50 + "\nTh: 短い2"
+    windows = segment_transcript(text, max_tokens=5, overlap_tokens=0)
+    assert windows == split_turns(text)
+
+
+def test_turn_diff_unchanged():
+    diff = TurnDiff(TRANSCRIPT, TRANSCRIPT.replace("Th: ", "Th:  "), context_turns=1)
+    assert diff.unchanged
+    assert diff.windows() == []
+
+
+def test_turn_diff_regions_include_context():
+    edited = TRANSCRIPT.replace("Cl: はい。", "Cl: はい。そうなんです。")
+    diff = TurnDiff(TRANSCRIPT, edited, context_turns=1)
+
+    assert diff.changed_turns == 1
+    assert diff.regions == [(3, 5)]
+    assert diff.reanalyzed_turns == 2
+    assert diff.is_stable("今日はどんなことをお話ししたいですか？")
+    assert not diff.is_stable("ご家族から言われることが増えて、気になっているんですね。")
+
+
+def test_prompt_version_includes_preprocessing_version(monkeypatch):
+    import core.prompt_manager as prompt_manager
+
+    version = prompt_manager.PromptManager.get_prompt_version
+    before = version("cct")
+    monkeypatch.setattr(prompt_manager, "PREPROCESSING_VERSION", "test")
+    version.cache_clear()
+    try:
+        # 前処理が変わると分析キャッシュのキーも変わる
+        assert version("cct") != before
+    finally:
+        monkeypatch.undo()
+        version.cache_clear()
@@ -0,0 +1,90 @@
+"""
+core.ttl_cache のテスト
+"""
+import pytest
+from core import ttl_cache
+from core.ttl_cache import TTLCache
+
+
+class FakeClock:
+    """time.monotonic の代わりに進める時計"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ttl_cache, "time", clock)
+    return clock
+
+
+def test_evicts_least_recently_used():
+    evicted = []
+    cache = TTLCache(max_size=2, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert evicted == ["b"]
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_expires_after_ttl(clock):
+    cache = TTLCache(max_size=10, ttl=5)
+    cache.set("a", 1)
+    clock.now += 4
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_sliding_ttl_extends_on_access(clock):
+    cache = TTLCache(max_size=10, ttl=5, sliding=True)
+    cache.set("a", 1)
+    for _ in range(3):
+        clock.now += 4
+        assert cache.get("a") == 1
+    clock.now += 6
+    assert cache.get("a") is None
+
+
+def test_purge_expired_counts_evictions(clock):
+    cache = TTLCache(max_size=10, ttl=5)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    clock.now += 6
+    assert cache.purge_expired() == 2
+    assert cache.evictions == 2
+
+
+def test_pop_does_not_call_on_evict():
+    evicted = []
+    cache = TTLCache(max_size=10, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    assert evicted == []
+
+
+def test_stats_and_contains():
+    cache = TTLCache(max_size=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    # __contains__ はヒット率に数えない
+    assert "a" in cache
+    assert "missing" not in cache
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
@@ -0,0 +1,131 @@
+"""
+core.utils のテスト（分析結果のパースと発言内容の補完）
+"""
+import json
+import pytest
+from core.transcript import preprocess_transcript
+from core.utils import (
+    AnalysisParseError,
+    assign_statement_ids,
+    format_sse,
+    merge_analysis_results,
+    parse_analysis_response,
+    parse_combined_analysis_response,
+    rehydrate_statement,
+    tag_model,
+    validate_statements,
+)
+
+TRANSCRIPT = preprocess_transcript("\n".join([
+    "Th: 今日はどんなことをお話ししたいですか？",
+    "Cl: お酒を減らしたいんです。",
+    "Th: 減らしたいと思っているんですね。",
+]))
+
+
+def evaluation(**fields):
+    return {
+        "statement": "減らしたいと思っているんですね。",
+        "evaluation": "複雑な聞き返し",
+        "score": 4,
+        "feedback": "よくできています",
+        "suggestions": ["理由を尋ねる"],
+        "icon": "good",
+        **fields,
+    }
+
+
+def turn_evaluation(turn, **fields):
+    item = evaluation(**fields)
+    del item["statement"]
+    return {"turn": turn, **item}
+
+
+def test_parse_array_response():
+    assert parse_analysis_response(json.dumps([evaluation()])) == [evaluation()]
+
+
+def test_parse_structured_response():
+    assert parse_analysis_response(json.dumps({"statements": [evaluation()]})) == [evaluation()]
+
+
+def test_parse_response_with_surrounding_text():
+    text = "分析結果です。\n```json\n" + json.dumps({"statements": [evaluation()]}, ensure_ascii=False) + "\n```"
+    assert parse_analysis_response(text) == [evaluation()]
+
+
+@pytest.mark.parametrize("text", [
+    "JSONではありません",
+    "[{\"statement\": ",
+    json.dumps({"items": []}),
+    json.dumps([evaluation(score=6)]),
+    json.dumps([evaluation(icon="great")]),
+])
+def test_parse_rejects_invalid_response(text):
+    with pytest.raises(AnalysisParseError):
+        parse_analysis_response(text)
+
+
+def test_rehydrate_fills_statement_from_turn():
+    assert rehydrate_statement(turn_evaluation(3), TRANSCRIPT) == evaluation()
+    # 発言内容で返された評価はそのまま
+    assert rehydrate_statement(evaluation(), TRANSCRIPT) == evaluation()
+
+
+@pytest.mark.parametrize("turn", [2, 99, "3"])
+def test_rehydrate_rejects_non_clinician_turn(turn):
+    with pytest.raises(AnalysisParseError):
+        rehydrate_statement(turn_evaluation(turn), TRANSCRIPT)
+
+
+def test_parse_with_transcript():
+    text = json.dumps({"statements": [turn_evaluation(1), turn_evaluation(3)]})
+    results = parse_analysis_response(text, TRANSCRIPT)
+    assert [item["statement"] for item in results] == [
+        "今日はどんなことをお話ししたいですか？",
+        "減らしたいと思っているんですね。",
+    ]
+
+
+def test_validate_keeps_extra_fields():
+    assert validate_statements([evaluation(id="cct-1")])[0]["id"] == "cct-1"
+
+
+def test_parse_combined_splits_errors_by_axis():
+    text = json.dumps({"cct": [evaluation()], "sst": [evaluation(score=0)]})
+    results, errors = parse_combined_analysis_response(text, ["cct", "sst", "empathy"])
+    assert results == {"cct": [evaluation()]}
+    assert set(errors) == {"sst", "empathy"}
+
+
+def test_parse_combined_without_json_fails_every_axis():
+    results, errors = parse_combined_analysis_response("すみません", ["cct", "sst"])
+    assert results == {}
+    assert set(errors) == {"cct", "sst"}
+
+
+def test_merge_prefers_notable_scores_and_dedupes():
+    first = [evaluation(statement="A", score=3), evaluation(statement="B", score=1)]
+    second = [evaluation(statement=" B ", score=2), evaluation(statement="C", score=5), evaluation(statement="D", score=4)]
+    merged = merge_analysis_results([first, second], limit=3)
+    assert [item["statement"] for item in merged] == ["B", "C", "D"]
+
+
+def test_assign_statement_ids_is_stable_and_unique():
+    items = [evaluation(), evaluation(), evaluation(statement="別の発言")]
+    first = assign_statement_ids("cct", items)
+    second = assign_statement_ids("cct", items)
+
+    assert [item["id"] for item in first] == [item["id"] for item in second]
+    assert first[1]["id"] == first[0]["id"] + "-2"
+    assert len({item["id"] for item in first}) == 3
+    assert "id" not in items[0]
+    assert assign_statement_ids("sst", items[:1])[0]["id"] != first[0]["id"]
+
+
+def test_tag_model():
+    assert tag_model([evaluation()], "gpt-test")[0]["model"] == "gpt-test"
+
+
+def test_format_sse():
+    assert format_sse("token", {"content": "こんにちは"}) == 'event: token\ndata: {"content": "こんにちは"}\n\n'